@@ -6,8 +6,8 @@ a = Analysis(
     ['main.py'],
     pathex=[],
     binaries=[],
-    datas=[('./app.py', '.'), ('./config.py', '.'), ('./idle.py', '.'), ('./plex_shutdown_manager.py', '.'), ('./icons', 'icons/')] + gui_packages,
-    hiddenimports=[],
+    datas=[('./app.py', '.'), ('./config.py', '.'), ('./config_watcher.py', '.'), ('./idle.py', '.'), ('./plex_shutdown_manager.py', '.'), ('./plex_alerts.py', '.'), ('./process_probe.py', '.'), ('./plex_connection.py', '.'), ('./probe_scheduler.py', '.'), ('./plex_server_group.py', '.'), ('./plex_sessions.py', '.'), ('./metrics.py', '.'), ('./notifications.py', '.'), ('./power.py', '.'), ('./trace_log.py', '.'), ('./plex_supervisor.py', '.'), ('./ui_dispatch.py', '.'), ('./monitor_log.py', '.'), ('./usage_model.py', '.'), ('./icons', 'icons/')] + gui_packages,
+    hiddenimports=['websocket'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
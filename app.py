@@ -2,31 +2,57 @@
 from __future__ import annotations
 
 import webbrowser
+from functools import partial
+from typing import TYPE_CHECKING
 
 import customtkinter
-import pystray
-from PIL import Image
-from plexapi.server import PlexServer
-from pystray import MenuItem as item
-from win11toast import toast
 
 from config import (
     DEFAULT_COMPUTER_IDLE,
     DEFAULT_INTERVAL_DELAY,
+    DEFAULT_LOG_LEVEL,
+    DEFAULT_METRICS_PORT,
     DEFAULT_PLEX_TOKEN,
     DEFAULT_PLEX_URL,
     DEFAULT_SHUTDOWN_DELAY,
+    DEFAULT_STALE_SESSION_TIMEOUT,
+    DEFAULT_USE_ALERTS,
+    PRIMARY_SERVER_NAME,
+    Settings,
     resource_path,
     write_config,
 )
+from notifications import toast
+from plex_connection import (
+    ConnectionResult,
+    ConnectionWorker,
+    PlexConnectionPool,
+    validate_plex_url,
+)
+from plex_shutdown_manager import MonitorSettings
+from ui_dispatch import (
+    DRAIN_INTERVAL_MS,
+    HEALTH_SLOT,
+    MESSAGE_SECONDS,
+    STATUS_SLOT,
+    UiDispatcher,
+)
+
+if TYPE_CHECKING:
+    from plexapi.server import PlexServer
 
 customtkinter.set_appearance_mode("dark")
 
+CONNECTING_MESSAGE = "Connecting to Plex..."
+
 
 class App(customtkinter.CTk):
     """Main GUI class"""
 
-    plex: PlexServer = None
+    # (primary handle, list of (name, extra handle)), replaced as a whole so the monitor thread
+    # never sees the primary and extra handles of different connects
+    plex_handles: tuple[PlexServer, list] = (None, [])
+    monitor_settings: MonitorSettings = None
     shutdown_switch_enabled = False
     shutdown_switch_on_show_end_enabled = False
     plex_url = DEFAULT_PLEX_URL
@@ -34,6 +60,11 @@ class App(customtkinter.CTk):
     shutdown_delay = DEFAULT_SHUTDOWN_DELAY
     interval_delay = DEFAULT_INTERVAL_DELAY
     max_computer_idle = DEFAULT_COMPUTER_IDLE
+    use_alerts = DEFAULT_USE_ALERTS
+    extra_servers = ()
+    metrics_port = DEFAULT_METRICS_PORT
+    stale_session_timeout = DEFAULT_STALE_SESSION_TIMEOUT
+    log_level = DEFAULT_LOG_LEVEL
 
     def __init__(
         self,
@@ -42,15 +73,18 @@ class App(customtkinter.CTk):
         computer_idle,
         interval_delay,
         shutdown_delay,
+        use_alerts=DEFAULT_USE_ALERTS,
+        extra_servers=(),
+        metrics_port=DEFAULT_METRICS_PORT,
+        stale_session_timeout=DEFAULT_STALE_SESSION_TIMEOUT,
+        log_level=DEFAULT_LOG_LEVEL,
     ):
         super().__init__(fg_color="#2b2b2b")
-        if plex_token != DEFAULT_PLEX_TOKEN:
-            try:
-                self.plex = PlexServer(plex_url, plex_token)
-            except ConnectionError:
-                self.show_error("Connection error")
-            except:
-                self.show_error("Unknown error, maybe you are using an unvalid token")
+        # Every widget update of other threads goes through the dispatcher
+        self.ui = UiDispatcher()
+        self.connection_pool = PlexConnectionPool()
+        self.connection_worker = ConnectionWorker(self.connection_pool, self.post)
+        self.settings_listeners = []
 
         self.plex_url = plex_url
         self.plex_token = plex_token
@@ -58,6 +92,14 @@ class App(customtkinter.CTk):
         self.interval_delay = interval_delay
         self.shutdown_delay = shutdown_delay
         self.max_computer_idle = computer_idle
+        self.use_alerts = use_alerts
+        self.extra_servers = list(extra_servers)
+        self.metrics_port = metrics_port
+        self.stale_session_timeout = stale_session_timeout
+        self.log_level = log_level
+        self.publish_settings()
+        if plex_token != DEFAULT_PLEX_TOKEN:
+            self.connect_servers()
 
         self.title("Plex Auto Shutdown")
         self.resizable(False, False)
@@ -128,6 +170,13 @@ class App(customtkinter.CTk):
         max_idle_delay_entry = customtkinter.CTkEntry(self)
         max_idle_delay_entry.grid(row=7, column=0, padx=10, pady=(0, 10))
         max_idle_delay_entry.insert(0, self.max_computer_idle)
+        self.settings_entries = (
+            plex_url_entry,
+            plex_token_entry,
+            shutdown_delay_entry,
+            interval_delay_entry,
+            max_idle_delay_entry,
+        )
 
         # Reset Default Values
         customtkinter.CTkButton(
@@ -186,8 +235,23 @@ class App(customtkinter.CTk):
         )
         how_to_get_token_label.grid(row=10, column=1, padx=10, pady=10)
 
+        # Status lines, each a single label reused by every message
+        status_label = customtkinter.CTkLabel(self, text="", font=("Arial", 12, "bold"))
+        status_label.grid(row=9, column=0, columnspan=2, padx=10, pady=10)
+        plex_health_label = customtkinter.CTkLabel(self, text="", font=("Arial", 11))
+        plex_health_label.grid(row=11, column=0, columnspan=2, padx=10, pady=(0, 10))
+        self.ui.add_status(STATUS_SLOT, partial(self.render_status, status_label))
+        self.ui.add_status(HEALTH_SLOT, partial(self.render_status, plex_health_label))
+        self.ui.start(self.after, DRAIN_INTERVAL_MS)
+
     def hide_window(self):
-        """Hides the window and shows the icon in the system tray"""
+        """Hides the window and shows the icon in the system tray, the tray stack is only
+        loaded the first time the window is hidden"""
+        # pylint: disable=import-outside-toplevel
+        import pystray
+        from PIL import Image
+        from pystray import MenuItem as item
+
         self.withdraw()
 
         image = Image.open(resource_path("./icons/plex.png"))
@@ -205,6 +269,7 @@ class App(customtkinter.CTk):
     def quit_window(self, icon):
         """Ends the program"""
         icon.stop()
+        self.connection_worker.shutdown()
         self.quit()
 
     def show_window(self, icon):
@@ -215,6 +280,7 @@ class App(customtkinter.CTk):
     def toggle_shutdown_switch(self, label):
         """Toggles the auto shutdown switch, if it's enabled it will stop the auto shutdown"""
         self.shutdown_switch_enabled = not self.shutdown_switch_enabled
+        self.publish_settings()
         if self.shutdown_switch_enabled:
             self.show_success("Auto Shutdown is now ON")
             label.configure(text="Auto Shutdown is currently: ON")
@@ -223,23 +289,20 @@ class App(customtkinter.CTk):
             label.configure(text="Auto Shutdown is currently: OFF")
 
     def show_error(self, message):
-        """Shows an error message for 5 seconds"""
-        error_label = customtkinter.CTkLabel(
-            self, text=f"Error: {message}", text_color="red", font=("Arial", 12, "bold")
-        )
-        error_label.grid(row=9, column=0, columnspan=2, padx=10, pady=10)
-        self.after(5000, error_label.destroy)
+        """Shows an error message for 5 seconds, safe from any thread"""
+        self.ui.show(STATUS_SLOT, f"Error: {message}", "red", MESSAGE_SECONDS)
 
     def show_success(self, message):
-        """Shows a success message for 5 seconds"""
-        success_label = customtkinter.CTkLabel(
-            self,
-            text=f"Success: {message}",
-            text_color="green",
-            font=("Arial", 12, "bold"),
+        """Shows a success message for 5 seconds, safe from any thread"""
+        self.ui.show(STATUS_SLOT, f"Success: {message}", "green", MESSAGE_SECONDS)
+
+    def render_status(self, label, text, color):
+        """Updates a status label on the Tk thread, no color is the theme color"""
+        label.configure(
+            text=text,
+            text_color=color
+            or customtkinter.ThemeManager.theme["CTkLabel"]["text_color"],
         )
-        success_label.grid(row=9, column=0, columnspan=2, padx=10, pady=10)
-        self.after(5000, success_label.destroy)
 
     def apply_settings(
         self,
@@ -251,40 +314,54 @@ class App(customtkinter.CTk):
         auto_shutdown_label,
         auto_shutdown_on_show_end_label,
     ):
-        """Applies the settings to the program"""
-        self.plex_token = token_entry.get()
-        if self.plex_token == "Your Plex Token Here":
+        """Applies the settings to the program, the URL and token are only kept once the
+        Plex server accepted them"""
+        plex_url = url_entry.get()
+        plex_token = token_entry.get()
+        if plex_token == "Your Plex Token Here":
             self.show_error("You need to enter a valid Plex Token first")
             return
+        try:
+            validate_plex_url(plex_url)
+        except ValueError as e:
+            self.show_error(str(e))
+            return
         self.shutdown_switch_enabled = False
         self.shutdown_switch_on_show_end_enabled = False
-        self.plex_url = url_entry.get()
         self.max_computer_idle = float(max_idle_delay_entry.get())
         self.interval_delay = float(interval_delay_entry.get())
         self.shutdown_delay = float(shutdown_delay_entry.get())
-        self.update()
-        try:
-            self.plex = PlexServer(self.plex_url, self.plex_token)
-            write_config(
-                self.plex_url,
-                self.plex_token,
-                self.max_computer_idle,
-                self.interval_delay,
-                self.shutdown_delay,
-            )
-            auto_shutdown_label.configure(
-                text=f"Auto Shutdown is currently: {'ON' if self.shutdown_switch_enabled else 'OFF'}"
-            )
-            auto_shutdown_on_show_end_label.configure(
-                text=f"Shutdown when show ends is: {'ON' if self.shutdown_switch_on_show_end_enabled else 'OFF'}"
-            )
-            self.show_success("Settings applied, auto shutdown is now OFF")
-        except ConnectionError:
-            self.show_error("Connection error")
-            return
-        except:
-            self.show_error("Unknown error, maybe you are using an unvalid token")
-            return
+        self.publish_settings()
+        auto_shutdown_label.configure(
+            text=f"Auto Shutdown is currently: {'ON' if self.shutdown_switch_enabled else 'OFF'}"
+        )
+        auto_shutdown_on_show_end_label.configure(
+            text=f"Shutdown when show ends is: {'ON' if self.shutdown_switch_on_show_end_enabled else 'OFF'}"
+        )
+        self.connect_servers(
+            on_connected=partial(self.save_applied_settings, plex_url, plex_token),
+            plex_url=plex_url,
+            plex_token=plex_token,
+        )
+
+    def save_applied_settings(self, plex_url, plex_token):
+        """Keeps the URL and token and writes the applied settings once the Plex server
+        accepted them"""
+        self.plex_url = plex_url
+        self.plex_token = plex_token
+        write_config(
+            self.plex_url,
+            self.plex_token,
+            self.max_computer_idle,
+            self.interval_delay,
+            self.shutdown_delay,
+            self.use_alerts,
+            self.extra_servers,
+            self.metrics_port,
+            self.stale_session_timeout,
+            self.log_level,
+        )
+        self.show_success("Settings applied, auto shutdown is now OFF")
 
     def reset_settings(
         self,
@@ -302,6 +379,8 @@ class App(customtkinter.CTk):
         self.max_computer_idle = DEFAULT_COMPUTER_IDLE
         self.interval_delay = DEFAULT_INTERVAL_DELAY
         self.shutdown_delay = DEFAULT_SHUTDOWN_DELAY
+        self.use_alerts = DEFAULT_USE_ALERTS
+        self.publish_settings()
 
         url_entry.delete(0, "end")
         url_entry.insert(0, self.plex_url)
@@ -332,6 +411,11 @@ class App(customtkinter.CTk):
             self.max_computer_idle,
             self.interval_delay,
             self.shutdown_delay,
+            self.use_alerts,
+            self.extra_servers,
+            self.metrics_port,
+            self.stale_session_timeout,
+            self.log_level,
         )
         self.show_success("Settings reseted, auto shutdown is now OFF")
 
@@ -339,22 +423,167 @@ class App(customtkinter.CTk):
         """Opens a web browser with the given url"""
         webbrowser.open(url)
 
+    def current_settings(self):
+        """Returns the settings in use as a Settings of the config file"""
+        return Settings(
+            self.plex_url,
+            self.plex_token,
+            self.max_computer_idle,
+            self.interval_delay,
+            self.shutdown_delay,
+            self.use_alerts,
+            tuple(tuple(server) for server in self.extra_servers),
+            self.metrics_port,
+            self.stale_session_timeout,
+            self.log_level,
+        )
+
+    def reload_settings(self, settings: Settings):
+        """Applies settings changed in the config file while running, the auto shutdown switch
+        is kept and the servers are only reconnected if they changed"""
+        current = self.current_settings()
+        if settings == current:
+            return
+        self.plex_url = settings.plex_url
+        self.plex_token = settings.plex_token
+        self.max_computer_idle = settings.computer_idle
+        self.interval_delay = settings.interval_delay
+        self.shutdown_delay = settings.shutdown_delay
+        self.use_alerts = settings.use_alerts
+        self.extra_servers = list(settings.extra_servers)
+        self.metrics_port = settings.metrics_port
+        self.stale_session_timeout = settings.stale_session_timeout
+        self.log_level = settings.log_level
+        for entry, value in zip(
+            self.settings_entries,
+            (
+                self.plex_url,
+                self.plex_token,
+                self.shutdown_delay,
+                self.interval_delay,
+                self.max_computer_idle,
+            ),
+        ):
+            entry.delete(0, "end")
+            entry.insert(0, value)
+        self.publish_settings()
+        if settings.connection_changed(current):
+            self.connect_servers()
+        self.show_success("Settings reloaded from the config file")
+
+    def add_settings_listener(self, listener):
+        """Registers a callable run whenever new settings are published"""
+        self.settings_listeners.append(listener)
+
+    def publish_settings(self):
+        """Replaces the settings read by the monitor with a snapshot of the current ones and
+        notifies the listeners, so a change takes effect without waiting for the next check"""
+        self.monitor_settings = MonitorSettings(
+            self.shutdown_switch_enabled,
+            self.max_computer_idle,
+            self.interval_delay,
+            self.shutdown_delay,
+        )
+        for listener in self.settings_listeners:
+            listener()
+
     def get_shutdown_status(self):
         """Returns the status of the shutdown switch"""
-        return self.shutdown_switch_enabled
+        return self.monitor_settings.shutdown_enabled
 
     def get_max_computer_idle(self):
         """Returns the computer idle time in minutes"""
-        return self.max_computer_idle
+        return self.monitor_settings.max_computer_idle
 
     def get_plex_instance(self):
         """Returns the plex server instance"""
-        return self.plex
+        return self.plex_handles[0]
+
+    def post(self, callback):
+        """Runs the callback on the Tk thread, safe from any thread"""
+        self.ui.post(callback)
+
+    def connect_servers(self, on_connected=None, plex_url=None, plex_token=None):
+        """Connects to every monitored Plex server in the background while the window shows a
+        connecting state, on_connected runs on the Tk thread once the primary server is reached.
+        The primary server is the current one unless another URL and token are given"""
+        self.show_connecting()
+        self.connection_worker.connect(
+            plex_url or self.plex_url,
+            plex_token or self.plex_token,
+            self.extra_servers,
+            partial(self.on_servers_connected, on_connected),
+        )
+
+    def on_servers_connected(self, on_connected, result: ConnectionResult):
+        """Swaps in the new handles, keeps the previous ones if the primary server cannot be reached"""
+        self.hide_connecting()
+        if result.error is not None:
+            if isinstance(result.error, ConnectionError):
+                self.show_error("Connection error")
+            else:
+                self.show_error("Unknown error, maybe you are using an unvalid token")
+            return
+        self.plex_handles = (result.plex, result.extra_plex)
+        for name in result.failed_extra_servers():
+            self.show_error(f"Cannot connect to the Plex server {name}")
+        if on_connected is not None:
+            on_connected()
+
+    def show_connecting(self):
+        """Shows the connecting state until the connection result arrives"""
+        self.ui.show(STATUS_SLOT, CONNECTING_MESSAGE)
+
+    def hide_connecting(self):
+        """Removes the connecting state unless another message replaced it"""
+        self.ui.clear(STATUS_SLOT, CONNECTING_MESSAGE)
+
+    def reconnect_server(self, name):
+        """Returns a new handle of the given server, built on the calling thread, the window
+        swaps it in on the Tk thread. Raises if the server cannot be reached"""
+        servers = {PRIMARY_SERVER_NAME: (self.plex_url, self.plex_token)}
+        servers.update(
+            (server, (url, token)) for server, url, token in self.extra_servers
+        )
+        url, token = servers[name]
+        plex = self.connection_pool.connect(url, token)
+        self.post(partial(self.replace_plex_handle, name, url, plex))
+        return plex
+
+    def replace_plex_handle(self, name, url, plex):
+        """Swaps in a reconnected handle unless the server was changed in the meantime"""
+        primary, extra_plex = self.plex_handles
+        if name == PRIMARY_SERVER_NAME:
+            if url != self.plex_url:
+                return
+            primary = plex
+        else:
+            if (name, url) not in (
+                (server, address) for server, address, _ in self.extra_servers
+            ):
+                return
+            extra_plex = [
+                (server, plex if server == name else handle)
+                for server, handle in extra_plex
+            ]
+        self.plex_handles = (primary, extra_plex)
+
+    def show_plex_health(self, message):
+        """Shows the connection state of the Plex servers, safe from any thread"""
+        self.ui.show(HEALTH_SLOT, f"Plex {message}")
+
+    def get_extra_plex_instances(self):
+        """Returns a list of (name, plex server instance) of the other monitored servers"""
+        return self.plex_handles[1]
+
+    def get_connection_pool(self):
+        """Returns the connection pool shared by every Plex call"""
+        return self.connection_pool
 
     def get_shutdown_delay(self):
         """Returns the shutdown delay in minutes"""
-        return self.shutdown_delay
+        return self.monitor_settings.shutdown_delay
 
     def get_interval_delay(self):
         """Returns the interval delay in minutes"""
-        return self.interval_delay
+        return self.monitor_settings.interval_delay
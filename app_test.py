@@ -0,0 +1,33 @@
+""" Test file for app.py """
+import importlib.util
+import subprocess
+import sys
+import unittest
+
+DEFERRED_MODULES = ("pystray", "PIL", "win11toast", "plexapi")
+
+
+@unittest.skipUnless(
+    importlib.util.find_spec("customtkinter"), "the GUI stack is not installed"
+)
+class AppTest(unittest.TestCase):
+    """Test class for app.py"""
+
+    def test_01_heavy_imports_are_deferred(self):
+        """Test that loading the GUI does not load the tray, toast and Plex stacks"""
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, app; print(','.join(sorted(set(sys.modules) & set(sys.argv[1:]))))",
+                *DEFERRED_MODULES,
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(result.stdout.strip(), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+""" Benchmark of the logging cost a monitor check pays, written by the listener thread or on the monitor thread, to a file or to a slow console
+
+Run from the repository root: python -m benchmarks.monitor_log_bench
+"""
+import argparse
+import logging
+import os
+import tempfile
+from logging.handlers import QueueListener, RotatingFileHandler
+from queue import SimpleQueue
+from statistics import fmean, median
+from threading import Event
+from time import perf_counter, sleep
+
+from monitor_log import (
+    LOG_FORMAT,
+    LOGGER_NAME,
+    DeferredQueueHandler,
+    KeyValueFormatter,
+    MonitorLog,
+    fields,
+    get_logger,
+)
+
+log = get_logger("monitor_log_bench")
+
+
+class SlowConsole:
+    """Stream that takes the given seconds per write, like a terminal that is not read"""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def write(self, text):
+        sleep(self.delay)
+
+    def flush(self):
+        pass
+
+
+def log_tick(index):
+    """Logs what a check logs at the INFO level, the debug records are filtered out"""
+    log.debug("Probe stats: %s", "idle=0.01ms")
+    log.debug("Computer is not in idle mode")
+    log.info(
+        "Check finished",
+        extra=fields(
+            outcome="no_activation",
+            idle=12.5,
+            transcoder=False,
+            sessions=index % 3,
+            pending=False,
+            tick_ms=0.8,
+            idle_ms=0.01,
+        ),
+    )
+    log.debug("Next check in %.0f seconds", 60)
+
+
+class Written(logging.Handler):
+    """Handler placed after the real ones on the writer thread, tells when a record is written"""
+
+    def __init__(self):
+        super().__init__()
+        self.event = Event()
+
+    def emit(self, record):
+        self.event.set()
+
+    def wait(self):
+        """Waits for the next record to be written"""
+        self.event.wait()
+        self.event.clear()
+
+
+def run_ticks(ticks, written=None):
+    """Returns the median and the mean microseconds per check spent on the calling thread.
+    With written the next check waits until the writer thread is done, like the monitor that
+    sleeps for a minute between two checks, otherwise both threads compete for the GIL"""
+    durations = []
+    for index in range(ticks):
+        start = perf_counter()
+        log_tick(index)
+        durations.append(perf_counter() - start)
+        if written is not None:
+            written.wait()
+    return median(durations) * 1_000_000, fmean(durations) * 1_000_000
+
+
+def attach(handler, level):
+    """Sends the records of the monitor to the handler only"""
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(level)
+
+
+def main():
+    """Runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ticks", type=int, default=20_000)
+    parser.add_argument(
+        "--console-ms", type=float, default=5.0, help="time of a write to the console"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        log_path = os.path.join(directory, "monitor.log")
+        formatter = KeyValueFormatter(LOG_FORMAT)
+        print(f"{'mode':<28} {'median us':>10} {'mean us':>9} {'drain ms':>9}")
+
+        def report(mode, ticks, stop=None, written=None):
+            """Runs the checks and prints their cost, then the time stop takes to write the
+            records still queued"""
+            cost, mean = run_ticks(ticks, written)
+            drain = "-"
+            if stop is not None:
+                start = perf_counter()
+                stop()
+                drain = f"{(perf_counter() - start) * 1000:.1f}"
+            print(f"{mode:<28} {cost:>10.2f} {mean:>9.2f} {drain:>9}")
+
+        monitor_log = MonitorLog(log_path, level="WARNING", console=False).start()
+        report("disabled", args.ticks, monitor_log.stop)
+
+        file_handler = RotatingFileHandler(
+            log_path, maxBytes=1024 * 1024, backupCount=3
+        )
+        file_handler.setFormatter(formatter)
+        attach(file_handler, logging.INFO)
+        report("file, monitor thread", args.ticks)
+        file_handler.close()
+
+        monitor_log = MonitorLog(log_path, console=False).start()
+        report("file, queued, back to back", args.ticks, monitor_log.stop)
+
+        monitor_log = MonitorLog(log_path, console=False).start()
+        written = Written()
+        monitor_log.listener.handlers += (written,)
+        report("file, queued", args.ticks, monitor_log.stop, written)
+
+        # A few checks are enough to show a slow console stalls the monitor thread
+        slow_ticks = max(1, min(args.ticks, 100))
+        console = logging.StreamHandler(SlowConsole(args.console_ms / 1000))
+        console.setFormatter(formatter)
+        attach(console, logging.INFO)
+        report("slow console, monitor thread", slow_ticks)
+
+        queue = SimpleQueue()
+        listener = QueueListener(queue, console)
+        listener.start()
+        attach(DeferredQueueHandler(queue), logging.INFO)
+        report("slow console, queued", slow_ticks, listener.stop)
+        logging.getLogger(LOGGER_NAME).handlers = []
+
+
+if __name__ == "__main__":
+    main()
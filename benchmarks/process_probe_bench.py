@@ -0,0 +1,89 @@
+""" Microbenchmark comparing the in-process probe with the per-tick subprocess check
+
+Run from the repository root: python -m benchmarks.process_probe_bench
+"""
+import os
+import subprocess
+import sys
+from timeit import repeat
+
+from process_probe import (
+    PLEX_TRANSCODER_PROCESS,
+    ProcessProbe,
+    TasklistBackend,
+    TranscoderLoadProbe,
+    default_process_backend,
+    normalize_process_name,
+)
+
+ITERATIONS = 20
+REPEATS = 5
+
+
+def subprocess_check():
+    """The previous check, one process table listing through a spawned process per tick"""
+    if sys.platform == "win32":
+        result = subprocess.run(
+            ["tasklist", "/fi", "imagename eq Plex*"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    else:
+        result = subprocess.run(
+            ["ps", "-eo", "comm"], capture_output=True, text=True, check=True
+        )
+    output = result.stdout.lower()
+    return "plex media server" in output and "plex transcoder" in output
+
+
+def manager_check(probe, name):
+    """The path of a manager check, the running state and then the PIDs of the given process
+    whose load is sampled when every tracked process runs"""
+    if all(probe.running().values()):
+        probe.current_pids(name)
+
+
+def report(name, statement):
+    """Prints the best time per call of the given statement in microseconds"""
+    best = min(repeat(statement, number=ITERATIONS, repeat=REPEATS)) / ITERATIONS
+    print(f"{name:<32} {best * 1_000_000:>12.1f} us/check")
+
+
+def main():
+    """Runs the benchmark"""
+    backend = default_process_backend()
+    # Plex is usually not running on the benchmark machine, so the cached path
+    # tracks this interpreter, which is guaranteed to stay alive
+    interpreter = normalize_process_name(sys.executable)
+    cached_probe = ProcessProbe(backend, names=(interpreter,))
+    # The server without a transcoder, the name that has no PID is looked up periodically
+    missing_probe = ProcessProbe(backend, names=(interpreter, PLEX_TRANSCODER_PROCESS))
+
+    report("subprocess (current path)", subprocess_check)
+    report(
+        f"{type(backend).__name__} full scan",
+        lambda: ProcessProbe(backend).running(),
+    )
+    report(
+        f"{type(backend).__name__} cached PIDs",
+        lambda: manager_check(cached_probe, interpreter),
+    )
+    report(
+        f"{type(backend).__name__} one missing",
+        lambda: manager_check(missing_probe, PLEX_TRANSCODER_PROCESS),
+    )
+    load_probe = TranscoderLoadProbe(backend)
+    report(
+        f"{type(backend).__name__} load sample",
+        lambda: load_probe.sample([os.getpid()]),
+    )
+    if sys.platform == "win32":
+        report("TasklistBackend full scan", ProcessProbe(TasklistBackend()).rescan)
+    checks = ITERATIONS * REPEATS
+    print(f"full scans done by the cached probe: {cached_probe.full_scans}/{checks}")
+    print(f"full scans done with one missing: {missing_probe.full_scans}/{checks}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+""" Benchmark of the streaming session count against building every session with plexapi
+
+Run from the repository root: python -m benchmarks.session_count_bench
+"""
+import argparse
+import tracemalloc
+from functools import partial
+from time import perf_counter, process_time
+
+from fake_plex_server import start_server_process
+from plex_connection import PlexConnectionPool
+from plex_sessions import SessionTracker, count_sessions, read_sessions
+
+
+def measure(check, iterations):
+    """Returns the mean wall time, CPU time and allocation peak per call of the check"""
+    check()
+    cpu_start = process_time()
+    start = perf_counter()
+    for _ in range(iterations):
+        check()
+    wall = (perf_counter() - start) / iterations
+    cpu = (process_time() - cpu_start) / iterations
+    tracemalloc.start()
+    check()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return wall, cpu, peak
+
+
+def tracked_count(plex, tracker: SessionTracker):
+    """The monitor path, the session states diffed against the previous tick"""
+    tracker.update(read_sessions(plex), perf_counter())
+    return len(tracker.sessions)
+
+
+def main():
+    """Runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 50, 500, 2000])
+    args = parser.parse_args()
+
+    pool = PlexConnectionPool()
+    print(f"{'sessions':>8} {'path':<16} {'wall ms':>9} {'cpu ms':>9} {'peak KiB':>10}")
+    try:
+        for count in args.sessions:
+            process, url = start_server_process(count)
+            try:
+                plex = pool.connect(url, "fake-token")
+                tracker = SessionTracker()
+                paths = {
+                    "plexapi objects": lambda plex=plex: len(plex.sessions()),
+                    "streaming count": lambda plex=plex: count_sessions(plex),
+                    "tracked states": partial(tracked_count, plex, tracker),
+                }
+                for name, check in paths.items():
+                    assert check() == count
+                    wall, cpu, peak = measure(check, args.iterations)
+                    print(
+                        f"{count:>8} {name:<16} {wall * 1000:>9.3f} {cpu * 1000:>9.3f} "
+                        f"{peak / 1024:>10.1f}"
+                    )
+            finally:
+                process.terminate()
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
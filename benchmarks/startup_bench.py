@@ -0,0 +1,190 @@
+""" Startup time and resident memory of the GUI compared with the headless daemon, with a budget
+
+Every run starts a fresh interpreter that loads the entry point and reports back. The window
+mode builds the settings window from the config and exits once it is drawn. The exit status is
+1 when the median wall time of a mode is over its budget.
+Run from the repository root: python -m benchmarks.startup_bench [--importtime]
+"""
+import argparse
+import json
+import subprocess
+import sys
+from statistics import median
+from time import perf_counter
+
+MODES = ("headless", "gui", "window")
+# Median wall time budget in milliseconds, from interpreter start to the mode being ready
+STARTUP_BUDGETS_MS = {"headless": 1500, "gui": 2500, "window": 4000}
+IMPORTTIME_TOP = 15
+
+
+def peak_rss():
+    """Returns the peak resident memory of this process in bytes"""
+    if sys.platform == "win32":
+        # pylint: disable=import-outside-toplevel
+        from ctypes import Structure, byref, c_size_t, c_ulong, sizeof, windll
+
+        class PROCESS_MEMORY_COUNTERS(Structure):
+            """Struct filled by GetProcessMemoryInfo"""
+
+            _fields_ = [
+                ("cb", c_ulong),
+                ("PageFaultCount", c_ulong),
+                ("PeakWorkingSetSize", c_size_t),
+                ("WorkingSetSize", c_size_t),
+                ("QuotaPeakPagedPoolUsage", c_size_t),
+                ("QuotaPagedPoolUsage", c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", c_size_t),
+                ("QuotaNonPagedPoolUsage", c_size_t),
+                ("PagefileUsage", c_size_t),
+                ("PeakPagefileUsage", c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = sizeof(counters)
+        windll.psapi.GetProcessMemoryInfo(
+            windll.kernel32.GetCurrentProcess(), byref(counters), counters.cb
+        )
+        return counters.PeakWorkingSetSize
+
+    import resource  # pylint: disable=import-outside-toplevel
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def load_mode(mode):
+    """Loads the given mode the way its entry point does"""
+    # pylint: disable=import-outside-toplevel
+    if mode == "headless":
+        import daemon  # pylint: disable=unused-import
+    elif mode == "gui":
+        import app  # pylint: disable=unused-import
+    else:
+        from app import App
+        from config import load_settings
+
+        settings = load_settings()
+        window = App(
+            settings.plex_url,
+            settings.plex_token,
+            settings.computer_idle,
+            settings.interval_delay,
+            settings.shutdown_delay,
+            settings.use_alerts,
+            settings.extra_servers,
+            settings.metrics_port,
+            settings.stale_session_timeout,
+            settings.log_level,
+        )
+        window.update()
+        window.destroy()
+
+
+def child(mode):
+    """Loads the mode and prints the load time and peak memory as json"""
+    start = perf_counter()
+    try:
+        load_mode(mode)
+    except Exception as e:
+        print(json.dumps({"error": f"{type(e).__name__}: {e}"}))
+        return
+    print(json.dumps({"load": perf_counter() - start, "rss": peak_rss()}))
+
+
+def run_child(mode, *options):
+    """Runs the mode in a fresh interpreter, returns its wall time, report and stderr"""
+    start = perf_counter()
+    result = subprocess.run(
+        [sys.executable, *options, "-m", "benchmarks.startup_bench", "--child", mode],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    wall = perf_counter() - start
+    return wall, json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def measure(mode, runs):
+    """Returns the median wall time, load time and peak memory of the mode"""
+    walls = []
+    loads = []
+    rss = []
+    for _ in range(runs):
+        wall, report, _ = run_child(mode)
+        if "error" in report:
+            return report
+        walls.append(wall)
+        loads.append(report["load"])
+        rss.append(report["rss"])
+    return {"wall": median(walls), "load": median(loads), "rss": median(rss)}
+
+
+def import_breakdown(mode):
+    """Returns the top level packages that took the longest to import, as (ms, name)"""
+    _, report, stderr = run_child(mode, "-X", "importtime")
+    if "error" in report:
+        return report
+    package_times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        package = name.strip().split(".")[0]
+        package_times[package] = package_times.get(package, 0) + int(self_us) / 1000
+    return sorted(
+        ((ms, package) for package, ms in package_times.items()), reverse=True
+    )[:IMPORTTIME_TOP]
+
+
+def main():
+    """Runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument(
+        "--importtime",
+        action="store_true",
+        help="show the slowest top level imports of every mode",
+    )
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child)
+        return
+
+    over_budget = []
+    print(
+        f"{'mode':<10} {'wall ms':>9} {'load ms':>9} {'peak RSS MiB':>13} {'budget ms':>10}"
+    )
+    for mode in args.modes:
+        report = measure(mode, args.runs)
+        if "error" in report:
+            print(f"{mode:<10} unavailable: {report['error']}")
+            continue
+        budget = STARTUP_BUDGETS_MS[mode]
+        wall_ms = report["wall"] * 1000
+        if wall_ms > budget:
+            over_budget.append(mode)
+        print(
+            f"{mode:<10} {wall_ms:>9.1f} {report['load'] * 1000:>9.1f} "
+            f"{report['rss'] / 2**20:>13.1f} {budget:>10}"
+        )
+
+    if args.importtime:
+        for mode in args.modes:
+            breakdown = import_breakdown(mode)
+            if isinstance(breakdown, dict):
+                continue
+            print(f"\nSlowest packages to import in {mode} mode (ms)")
+            for ms, package in breakdown:
+                print(f"  {ms:>8.1f}  {package}")
+
+    if over_budget:
+        print(f"\nOver the startup budget: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
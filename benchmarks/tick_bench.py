@@ -0,0 +1,198 @@
+""" Offline benchmark of a monitor_plex_and_shutdown tick, using a fake Plex server and a fake OS layer
+
+Run from the repository root: python -m benchmarks.tick_bench
+"""
+import argparse
+import logging
+import tracemalloc
+from time import perf_counter, process_time
+
+from fake_plex_server import start_server_process
+from idle import SyntheticIdleSource
+from monitor_log import LOGGER_NAME
+from plex_connection import PlexConnectionPool
+from plex_shutdown_manager import NO_ACTIVATION, PlexShutdownManager
+from power import DryRunPowerBackend, PowerController
+from process_probe import (
+    FakeProcessBackend,
+    ProcessProbe,
+    default_process_backend,
+)
+
+MAX_IDLE_MINUTES = 30
+PLEX_ONLY = {10: "Plex Media Server.exe"}
+PLEX_AND_TRANSCODER = {10: "Plex Media Server.exe", 20: "Plex Transcoder.exe"}
+
+
+class BenchmarkHost:
+    """Minimal settings and status host for the manager, without any GUI"""
+
+    def __init__(self, plex):
+        self.plex = plex
+
+    def get_shutdown_status(self):
+        """Auto shutdown is always on while benchmarking"""
+        return True
+
+    def get_max_computer_idle(self):
+        """Returns the max idle time in minutes"""
+        return MAX_IDLE_MINUTES
+
+    def get_shutdown_delay(self):
+        """Returns the shutdown delay in minutes"""
+        return 30
+
+    def get_interval_delay(self):
+        """Returns the interval delay in minutes"""
+        return 1
+
+    def get_plex_instance(self):
+        """Returns the plex server instance"""
+        return self.plex
+
+    def get_extra_plex_instances(self):
+        """No extra servers are benchmarked"""
+        return []
+
+    def show_error(self, *args):
+        """Errors are not expected while benchmarking"""
+        raise RuntimeError(f"Unexpected error: {args}")
+
+    def show_plex_health(self, message):
+        """The fake server is always reachable"""
+
+    def reconnect_server(self, name):
+        """Returns the fake plex server"""
+        return self.plex
+
+
+def refuse_power_change(*_):
+    """The benchmark must never arm or cancel a real shutdown"""
+    raise RuntimeError("The benchmark tried to change the power state")
+
+
+def build_manager(plex, idle_seconds, processes, armed, native_processes):
+    """Builds a manager wired to the fake OS layer"""
+    backend = (
+        default_process_backend() if native_processes else FakeProcessBackend(processes)
+    )
+    manager = PlexShutdownManager(
+        BenchmarkHost(plex),
+        process_probe=ProcessProbe(backend),
+        idle_source=SyntheticIdleSource(idle_seconds),
+        power=PowerController(DryRunPowerBackend()),
+    )
+    manager.shutdown_enabled = armed
+    manager.activate_shutdown = refuse_power_change
+    manager.cancel_shutdown = refuse_power_change
+    return manager
+
+
+def percentile(values, fraction):
+    """Returns the given percentile of the values"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_path(name, manager, ticks):
+    """Runs the ticks of a code path and prints latency, CPU time and allocations per tick"""
+    latencies = []
+    cpu_times = []
+    # Warm up the connection pool and the probe costs
+    for _ in range(5):
+        manager.probe_scheduler.invalidate()
+        assert manager.monitor_plex_and_shutdown() == NO_ACTIVATION
+    for _ in range(ticks):
+        manager.probe_scheduler.invalidate()
+        cpu_start = process_time()
+        start = perf_counter()
+        manager.monitor_plex_and_shutdown()
+        latencies.append(perf_counter() - start)
+        cpu_times.append(process_time() - cpu_start)
+
+    tracemalloc.start()
+    peaks = []
+    for _ in range(max(1, ticks // 10)):
+        manager.probe_scheduler.invalidate()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        manager.monitor_plex_and_shutdown()
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    print(
+        f"{name:<28} "
+        f"{percentile(latencies, 0.5) * 1000:>8.3f} "
+        f"{percentile(latencies, 0.9) * 1000:>8.3f} "
+        f"{percentile(latencies, 0.99) * 1000:>8.3f} "
+        f"{sum(cpu_times) / len(cpu_times) * 1000:>9.3f} "
+        f"{sum(peaks) / len(peaks) / 1024:>10.1f}"
+    )
+
+
+def main():
+    """Runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ticks", type=int, default=200)
+    parser.add_argument(
+        "--sessions", type=int, nargs="+", default=[1, 50, 500], help="session counts"
+    )
+    parser.add_argument(
+        "--native-processes",
+        action="store_true",
+        help="use the process backend of this platform instead of the fake process table",
+    )
+    args = parser.parse_args()
+    # The table is the output of the benchmark, not the warnings of the checks
+    logging.getLogger(LOGGER_NAME).setLevel(logging.ERROR)
+
+    idle_seconds = MAX_IDLE_MINUTES * 60 + 1
+    servers = {
+        count: start_server_process(count) for count in sorted({0, *args.sessions})
+    }
+    pool = PlexConnectionPool()
+    try:
+        plex = {
+            count: pool.connect(url, "fake-token")
+            for count, (_, url) in servers.items()
+        }
+        print(
+            f"{'path':<28} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} "
+            f"{'cpu ms':>9} {'peak KiB':>10}"
+        )
+        run_path(
+            "idle short-circuit",
+            build_manager(plex[0], 10, PLEX_ONLY, False, args.native_processes),
+            args.ticks,
+        )
+        run_path(
+            "transcoder running",
+            build_manager(
+                plex[0], idle_seconds, PLEX_AND_TRANSCODER, False, args.native_processes
+            ),
+            args.ticks,
+        )
+        for count in args.sessions:
+            run_path(
+                f"sessions present ({count})",
+                build_manager(
+                    plex[count], idle_seconds, PLEX_ONLY, False, args.native_processes
+                ),
+                args.ticks,
+            )
+        run_path(
+            "shutdown armed",
+            build_manager(
+                plex[0], idle_seconds, PLEX_ONLY, True, args.native_processes
+            ),
+            args.ticks,
+        )
+        print(f"connection pool: {pool.snapshot()}")
+    finally:
+        pool.close()
+        for process, _ in servers.values():
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
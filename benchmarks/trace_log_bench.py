@@ -0,0 +1,62 @@
+""" Benchmark of appending monitor checks to the trace log and of reading it back
+
+Run from the repository root: python -m benchmarks.trace_log_bench
+"""
+import argparse
+import os
+import tempfile
+import tracemalloc
+from time import perf_counter, process_time
+
+from trace_log import TRACE_BACKUPS, TraceLog, TraceSummary, read_trace
+
+
+def main():
+    """Runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=200_000)
+    parser.add_argument(
+        "--max-bytes", type=int, default=1024 * 1024, help="rotation size of the files"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        trace_path = os.path.join(directory, "trace.bin")
+        trace_log = TraceLog(trace_path, max_bytes=args.max_bytes)
+        latencies = [0.00001, 0.001, 0.05]
+        # Warm up, then measure the steady state the monitor sees over months
+        for _ in range(1000):
+            trace_log.record(1800.0, False, 1, 0, False, latencies)
+        cpu_start = process_time()
+        start = perf_counter()
+        for index in range(args.records):
+            trace_log.record(float(index), False, index % 3, 0, False, latencies)
+        wall = perf_counter() - start
+        cpu = process_time() - cpu_start
+        # Traced separately, tracing slows every allocation down
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for index in range(args.records):
+            trace_log.record(float(index), False, index % 3, 0, False, latencies)
+        growth = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        trace_log.close()
+        print(
+            f"write: {wall / args.records * 1e6:.2f} us wall, "
+            f"{cpu / args.records * 1e6:.2f} us cpu per record, "
+            f"{growth} bytes of memory growth after {args.records} more records"
+        )
+
+        summary = TraceSummary()
+        start = perf_counter()
+        for record in read_trace(trace_path, TRACE_BACKUPS):
+            summary.add(record)
+        wall = perf_counter() - start
+        print(
+            f"read: {summary.records} records in {wall * 1000:.1f} ms, "
+            f"{summary.records / wall:,.0f} records/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+""" Benchmark of the UI dispatch queue, the Tk side cost of a drain as the monitor posts more events
+
+Run from the repository root: python -m benchmarks.ui_dispatch_bench
+"""
+import argparse
+from threading import Thread
+from time import perf_counter
+
+from ui_dispatch import HEALTH_SLOT, STATUS_SLOT, UiDispatcher
+
+THREADS = 4
+
+
+def post_events(ui: UiDispatcher, count):
+    """Posts the mix of a failing monitor, the same error and health line over and over"""
+    for index in range(count):
+        ui.show(STATUS_SLOT, "Error: Connection error", "red", 5)
+        ui.show(HEALTH_SLOT, f"Plex Primary: {index % 3} failed checks")
+
+
+def main():
+    """Runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, nargs="+", default=[10, 1000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'events':>8} {'post us/event':>14} {'drain ms':>9} {'renders':>8}")
+    for count in args.events:
+        ui = UiDispatcher()
+        widgets = {STATUS_SLOT: [], HEALTH_SLOT: []}
+        for slot, updates in widgets.items():
+            ui.add_status(slot, lambda text, color, updates=updates: updates.append(text))
+        per_thread = count // THREADS
+        threads = [
+            Thread(target=post_events, args=(ui, per_thread)) for _ in range(THREADS)
+        ]
+        start = perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        posting = perf_counter() - start
+        start = perf_counter()
+        ui.drain()
+        drain = perf_counter() - start
+        events = per_thread * THREADS * 2
+        print(
+            f"{events:>8} {posting / events * 1_000_000:>14.2f} {drain * 1000:>9.3f} "
+            f"{ui.renders:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
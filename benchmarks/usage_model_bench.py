@@ -0,0 +1,56 @@
+""" Benchmark of fitting the usage model from months of traced checks, vectorized and in pure Python
+
+Run from the repository root: python -m benchmarks.usage_model_bench
+"""
+import argparse
+import os
+import random
+import tempfile
+from time import perf_counter, time
+from unittest.mock import patch
+
+import usage_model
+from trace_log import TraceLog
+from usage_model import TraceUsageModel
+
+
+def fit_time(model, repeats):
+    """Returns the best time in seconds of fitting the model"""
+    best = float("inf")
+    for _ in range(repeats):
+        start = perf_counter()
+        model.refit()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def main():
+    """Runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    checks = args.days * 24 * 60
+    start = time() - args.days * 24 * 60 * 60
+    with tempfile.TemporaryDirectory() as directory:
+        trace_path = os.path.join(directory, "trace.bin")
+        now = iter(start + index * 60 for index in range(checks))
+        trace_log = TraceLog(trace_path, clock=lambda: next(now))
+        for _ in range(checks):
+            trace_log.record(0, False, int(rng.random() < 0.2), 0, False, [None] * 3)
+        trace_log.close()
+
+        model = TraceUsageModel(trace_path)
+        print(f"{checks} checks over {args.days} days")
+        if usage_model.numpy is not None:
+            print(f"numpy:       {fit_time(model, args.repeats) * 1000:8.1f} ms")
+        else:
+            print("numpy:       not installed")
+        with patch.object(usage_model, "numpy", None):
+            print(f"pure Python: {fit_time(model, args.repeats) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,15 @@
 """ Config file for PlexAutoShutdown """
+from __future__ import annotations
+
 import configparser
-from os import path
+import os
 import sys
+import tempfile
+from dataclasses import dataclass
+from os import path
+from threading import Lock
+
+from monitor_log import get_logger, level_name
 
 
 def resource_path(relative_path):
@@ -21,46 +29,200 @@ DEFAULT_INTERVAL_DELAY = 1
 DEFAULT_SHUTDOWN_DELAY = 30
 DEFAULT_PLEX_URL = "http://127.0.0.1:32400"
 DEFAULT_PLEX_TOKEN = "Your Plex Token Here"
+DEFAULT_USE_ALERTS = False
+DEFAULT_METRICS_PORT = 0
+DEFAULT_STALE_SESSION_TIMEOUT = 120
+DEFAULT_LOG_LEVEL = "INFO"
+PRIMARY_SERVER_NAME = "Primary"
+SERVER_SECTION_PREFIX = "SERVER "
 
+log = get_logger(__name__)
 
-def load_config():
-    """Loads the config file and returns the values"""
-    if path.exists(CONFIG_FILE_PATH):
-        print("Config file exists")
-        config = configparser.ConfigParser()
-        config.read(CONFIG_FILE_PATH)
-        plex_url = config["DEFAULT"]["Url"]
-        plex_token = config["DEFAULT"]["Token"]
-        computer_idle = float(config["ADDITIONAL"]["MaxIdle"])
-        interval_delay = float(config["ADDITIONAL"]["IntervalDelay"])
-        shutdown_delay = float(config["ADDITIONAL"]["ShutdownDelay"])
-        return plex_url, plex_token, computer_idle, interval_delay, shutdown_delay
-    else:
-        print("Config file does not exist")
-        return (
-            DEFAULT_PLEX_URL,
-            DEFAULT_PLEX_TOKEN,
-            DEFAULT_COMPUTER_IDLE,
-            DEFAULT_INTERVAL_DELAY,
-            DEFAULT_SHUTDOWN_DELAY,
+
+@dataclass(frozen=True)
+class Settings:
+    """Typed values of the config file, extra_servers is a tuple of (name, url, token)"""
+
+    plex_url: str = DEFAULT_PLEX_URL
+    plex_token: str = DEFAULT_PLEX_TOKEN
+    computer_idle: float = DEFAULT_COMPUTER_IDLE
+    interval_delay: float = DEFAULT_INTERVAL_DELAY
+    shutdown_delay: float = DEFAULT_SHUTDOWN_DELAY
+    use_alerts: bool = DEFAULT_USE_ALERTS
+    extra_servers: tuple = ()
+    metrics_port: int = DEFAULT_METRICS_PORT
+    stale_session_timeout: float = DEFAULT_STALE_SESSION_TIMEOUT
+    log_level: str = DEFAULT_LOG_LEVEL
+
+    def connection_changed(self, other: Settings):
+        """Returns true if the other settings point to different Plex servers"""
+        return (self.plex_url, self.plex_token, self.extra_servers) != (
+            other.plex_url,
+            other.plex_token,
+            other.extra_servers,
         )
 
 
-def write_config(plex_url, plex_token, computer_idle, interval_delay, shutdown_delay):
-    """Writes the config file"""
-    with open(CONFIG_FILE_PATH, "w", encoding="utf-8") as config_file:
-        config_file.write(
-            f"""[DEFAULT]
-Url = {plex_url}
+def file_signature(config_path):
+    """Returns what identifies a version of the file, or None if it does not exist"""
+    try:
+        stat = os.stat(config_path)
+    except FileNotFoundError:
+        return None
+    # A rename gives the file a new inode even when the mtime and size look unchanged
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def parse_log_level(level):
+    """Returns the name of the log level of the config file, INFO if it is unknown"""
+    try:
+        return level_name(level)
+    except ValueError as e:
+        log.warning("%s, logging at %s", e, DEFAULT_LOG_LEVEL)
+        return DEFAULT_LOG_LEVEL
+
+
+def parse_settings(text):
+    """Parses the contents of a config file"""
+    config = configparser.ConfigParser()
+    config.read_string(text)
+    # Sections inherit the DEFAULT values, so extra servers can omit a shared token
+    return Settings(
+        plex_url=config["DEFAULT"]["Url"],
+        plex_token=config["DEFAULT"]["Token"],
+        computer_idle=float(config["ADDITIONAL"]["MaxIdle"]),
+        interval_delay=float(config["ADDITIONAL"]["IntervalDelay"]),
+        shutdown_delay=float(config["ADDITIONAL"]["ShutdownDelay"]),
+        use_alerts=config["ADDITIONAL"].getboolean(
+            "UseAlerts", fallback=DEFAULT_USE_ALERTS
+        ),
+        extra_servers=tuple(
+            (
+                section[len(SERVER_SECTION_PREFIX) :].strip(),
+                config[section]["Url"],
+                config[section]["Token"],
+            )
+            for section in config.sections()
+            if section.startswith(SERVER_SECTION_PREFIX)
+        ),
+        metrics_port=config["ADDITIONAL"].getint(
+            "MetricsPort", fallback=DEFAULT_METRICS_PORT
+        ),
+        stale_session_timeout=config["ADDITIONAL"].getfloat(
+            "StaleSessionTimeout", fallback=DEFAULT_STALE_SESSION_TIMEOUT
+        ),
+        log_level=parse_log_level(
+            config["ADDITIONAL"].get("LogLevel", fallback=DEFAULT_LOG_LEVEL)
+        ),
+    )
+
+
+_cache_lock = Lock()
+# Path -> (file signature, settings) of the last parsed version of every config file
+_settings_cache = {}
+
+
+def load_settings(config_path=CONFIG_FILE_PATH):
+    """Returns the settings of the config file, parsed only when the file changed since the
+    last call. The defaults are returned when the file does not exist"""
+    signature = file_signature(config_path)
+    with _cache_lock:
+        cached = _settings_cache.get(config_path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    if signature is None:
+        settings = Settings()
+    else:
+        with open(config_path, encoding="utf-8") as config_file:
+            settings = parse_settings(config_file.read())
+    with _cache_lock:
+        _settings_cache[config_path] = (signature, settings)
+    return settings
+
+
+def render_config(settings: Settings):
+    """Returns the contents of the config file of the settings"""
+    servers = "".join(
+        f"""
+[{SERVER_SECTION_PREFIX}{name}]
+Url = {url}
+Token = {token}
+"""
+        for name, url, token in settings.extra_servers
+    )
+    return f"""[DEFAULT]
+Url = {settings.plex_url}
 ; How to get token: https://support.plex.tv/articles/204059436-finding-an-authentication-token-x-plex-token/
-Token = {plex_token}
+Token = {settings.plex_token}
 
 [ADDITIONAL]
 ;Max computer idle time in seconds. Default: 30 minutes. Set to 0 to disable.
-MaxIdle = {computer_idle}
+MaxIdle = {settings.computer_idle}
 ;Delay between function interval in seconds. Default: 1 minute
-IntervalDelay = {interval_delay}
+IntervalDelay = {settings.interval_delay}
 ;Delay in seconds, should be bigger than interval delay. Default: 30 minutes
-ShutdownDelay = {shutdown_delay}
-"""
+ShutdownDelay = {settings.shutdown_delay}
+;Detect new sessions from the Plex notification stream instead of polling. Default: False
+UseAlerts = {settings.use_alerts}
+;Local port serving the monitor metrics in Prometheus format. Default: 0, disabled
+MetricsPort = {settings.metrics_port}
+;Minutes a paused or frozen Plex session keeps the computer on. Default: 120. Set to 0 to disable.
+StaleSessionTimeout = {settings.stale_session_timeout}
+;Level of the log file: DEBUG, INFO, WARNING or ERROR. DEBUG also logs every probe. Default: INFO
+LogLevel = {settings.log_level}
+
+;Other Plex servers to monitor, one [SERVER name] section with Url and Token each.
+;Shutdown only happens when every server is quiet.
+{servers}"""
+
+
+def save_settings(settings: Settings, config_path=CONFIG_FILE_PATH):
+    """Writes the settings unless the file already holds them, returns true if it was written.
+    The file is replaced by a rename so a reader never sees it half written"""
+    if (
+        file_signature(config_path) is not None
+        and load_settings(config_path) == settings
+    ):
+        return False
+    directory = path.dirname(path.abspath(config_path))
+    with tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", dir=directory, suffix=".tmp", delete=False
+    ) as temp_file:
+        temp_file.write(render_config(settings))
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
+    try:
+        os.replace(temp_file.name, config_path)
+    except OSError:
+        os.remove(temp_file.name)
+        raise
+    return True
+
+
+def write_config(
+    plex_url,
+    plex_token,
+    computer_idle,
+    interval_delay,
+    shutdown_delay,
+    use_alerts=DEFAULT_USE_ALERTS,
+    extra_servers=(),
+    metrics_port=DEFAULT_METRICS_PORT,
+    stale_session_timeout=DEFAULT_STALE_SESSION_TIMEOUT,
+    log_level=DEFAULT_LOG_LEVEL,
+):
+    """Writes the config file, extra_servers is a list of (name, url, token)"""
+    return save_settings(
+        Settings(
+            plex_url,
+            plex_token,
+            computer_idle,
+            interval_delay,
+            shutdown_delay,
+            use_alerts,
+            tuple(tuple(server) for server in extra_servers),
+            metrics_port,
+            stale_session_timeout,
+            log_level,
         )
+    )
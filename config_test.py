@@ -0,0 +1,82 @@
+""" Test file for config.py """
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from config import (
+    Settings,
+    load_settings,
+    parse_settings,
+    render_config,
+    save_settings,
+)
+
+SETTINGS = Settings(
+    plex_url="http://192.168.1.10:32400",
+    plex_token="token",
+    computer_idle=20.0,
+    interval_delay=2.0,
+    shutdown_delay=15.0,
+    use_alerts=True,
+    extra_servers=(("Basement", "http://192.168.1.20:32400", "other-token"),),
+    metrics_port=9101,
+    stale_session_timeout=45.0,
+    log_level="DEBUG",
+)
+
+
+class ConfigTest(unittest.TestCase):
+    """Test class for config.py"""
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self.directory.name, "config.ini")
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_01_render_round_trip(self):
+        """Test that rendered settings parse back to the same settings"""
+        self.assertEqual(parse_settings(render_config(SETTINGS)), SETTINGS)
+
+    def test_02_defaults_without_file(self):
+        """Test that the defaults are used while the file does not exist"""
+        self.assertEqual(load_settings(self.config_path), Settings())
+
+    def test_03_parsed_once(self):
+        """Test that the file is only parsed again once it changed"""
+        save_settings(SETTINGS, self.config_path)
+        with patch("config.parse_settings", wraps=parse_settings) as parse_mock:
+            first = load_settings(self.config_path)
+            self.assertIs(load_settings(self.config_path), first)
+            self.assertEqual(parse_mock.call_count, 1)
+            save_settings(Settings(plex_token="other"), self.config_path)
+            self.assertEqual(load_settings(self.config_path).plex_token, "other")
+            self.assertEqual(parse_mock.call_count, 2)
+
+    def test_04_save_skipped_when_unchanged(self):
+        """Test that saving the settings already in the file does not write it"""
+        self.assertTrue(save_settings(SETTINGS, self.config_path))
+        stat = os.stat(self.config_path)
+        self.assertFalse(save_settings(SETTINGS, self.config_path))
+        self.assertEqual(os.stat(self.config_path).st_mtime_ns, stat.st_mtime_ns)
+
+    def test_05_save_is_atomic(self):
+        """Test that the file is replaced by a rename without leaving temporary files"""
+        save_settings(SETTINGS, self.config_path)
+        with patch("config.os.replace", side_effect=OSError("locked")):
+            with self.assertRaises(OSError):
+                save_settings(Settings(), self.config_path)
+        self.assertEqual(os.listdir(self.directory.name), ["config.ini"])
+        self.assertEqual(load_settings(self.config_path), SETTINGS)
+
+    def test_06_unknown_log_level(self):
+        """Test that an unknown log level falls back to INFO with a warning"""
+        text = render_config(SETTINGS).replace("LogLevel = DEBUG", "LogLevel = verbose")
+        with self.assertLogs("plex_auto_shutdown.config", "WARNING"):
+            self.assertEqual(parse_settings(text).log_level, "INFO")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+""" This file contains the watcher that reloads the config file when it is edited while running """
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+from os import path
+from threading import Event, Thread
+
+from config import CONFIG_FILE_PATH, Settings, file_signature, load_settings
+from monitor_log import get_logger
+
+log = get_logger(__name__)
+
+# Seconds between two checks of the file when inotify is not available
+CONFIG_POLL_INTERVAL = 2
+# inotify flags, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class PollingBackend:
+    """Waits for a change of the file by comparing its mtime, size and inode"""
+
+    def __init__(self, config_path, poll_interval=CONFIG_POLL_INTERVAL):
+        self.config_path = config_path
+        self.poll_interval = poll_interval
+        self.signature = file_signature(config_path)
+
+    def wait(self, stopped: Event):
+        """Returns true once the file may have changed, false if stopped first"""
+        while not stopped.wait(self.poll_interval):
+            signature = file_signature(self.config_path)
+            if signature != self.signature:
+                self.signature = signature
+                return True
+        return False
+
+    def close(self):
+        """Nothing to release"""
+
+
+class InotifyBackend:
+    """Waits for the kernel to report a write or a rename of the file in its directory"""
+
+    def __init__(self, config_path, poll_interval=CONFIG_POLL_INTERVAL):
+        self.name = os.fsencode(path.basename(config_path))
+        self.poll_interval = poll_interval
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        directory = os.fsencode(path.dirname(path.abspath(config_path)))
+        # Watching the directory also sees the file replaced by a rename
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self.fd, directory, mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch failed")
+
+    def wait(self, stopped: Event):
+        """Returns true once the file may have changed, false if stopped first"""
+        while not stopped.is_set():
+            readable, _, _ = select.select([self.fd], [], [], self.poll_interval)
+            if readable and self.config_changed(os.read(self.fd, 4096)):
+                return True
+        return False
+
+    def config_changed(self, data):
+        """Returns true if any of the read events is about the config file"""
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            _, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if name == self.name:
+                return True
+        return False
+
+    def close(self):
+        """Closes the inotify descriptor"""
+        os.close(self.fd)
+
+
+def default_watch_backend(config_path, poll_interval=CONFIG_POLL_INTERVAL):
+    """Returns inotify on Linux and the mtime polling elsewhere or when inotify fails"""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyBackend(config_path, poll_interval)
+        except (OSError, AttributeError) as e:
+            log.info(
+                "Cannot watch the config file with inotify, polling instead: %s", e
+            )
+    return PollingBackend(config_path, poll_interval)
+
+
+class ConfigWatcher:
+    """Reloads the config file when it changes and calls on_change with the new Settings, only
+    when the values are really different from the last ones"""
+
+    def __init__(self, on_change, config_path=CONFIG_FILE_PATH, backend=None):
+        self.on_change = on_change
+        self.config_path = config_path
+        self.backend = backend or default_watch_backend(config_path)
+        self.settings: Settings = load_settings(config_path)
+        self.stopped = Event()
+        self.thread = None
+        self.reloads = 0
+
+    def start(self):
+        """Starts watching in a background thread"""
+        self.thread = Thread(target=self.run, daemon=True, name="config-watcher")
+        self.thread.start()
+        return self
+
+    def run(self):
+        """Waits for changes until stopped"""
+        try:
+            while self.backend.wait(self.stopped):
+                self.reload()
+        finally:
+            self.backend.close()
+
+    def reload(self):
+        """Parses the file and reports the new settings if they changed"""
+        try:
+            settings = load_settings(self.config_path)
+        except Exception as e:
+            log.warning(
+                "Cannot reload the config file, keeping the current settings: %s", e
+            )
+            return
+        if settings == self.settings:
+            return
+        self.settings = settings
+        self.reloads += 1
+        log.info("Config file changed, applying the new settings")
+        self.on_change(settings)
+
+    def stop(self):
+        """Stops watching"""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
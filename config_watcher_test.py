@@ -0,0 +1,72 @@
+""" Test file for config_watcher.py """
+import os
+import sys
+import tempfile
+import unittest
+from queue import Queue
+
+from config import Settings, save_settings
+from config_watcher import ConfigWatcher, InotifyBackend, PollingBackend
+
+
+class ConfigWatcherTest(unittest.TestCase):
+    """Test class for config_watcher.py"""
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self.directory.name, "config.ini")
+        save_settings(Settings(plex_token="token"), self.config_path)
+        self.changes = Queue()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def watch(self, backend):
+        """Checks that the watcher reports a real change once and ignores other files"""
+        watcher = ConfigWatcher(self.changes.put, self.config_path, backend).start()
+        try:
+            with open(
+                os.path.join(self.directory.name, "other.ini"), "w", encoding="utf-8"
+            ) as other_file:
+                other_file.write("unrelated")
+            save_settings(
+                Settings(plex_token="token", computer_idle=5), self.config_path
+            )
+            self.assertEqual(self.changes.get(timeout=5).computer_idle, 5)
+            # Same values written again are not reported
+            with open(self.config_path, "a", encoding="utf-8") as config_file:
+                config_file.write("\n")
+            save_settings(
+                Settings(plex_token="token", computer_idle=7), self.config_path
+            )
+            self.assertEqual(self.changes.get(timeout=5).computer_idle, 7)
+            self.assertTrue(self.changes.empty())
+        finally:
+            watcher.stop()
+        self.assertEqual(watcher.reloads, 2)
+
+    def test_01_polling(self):
+        """Test the mtime polling backend"""
+        self.watch(PollingBackend(self.config_path, poll_interval=0.05))
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "inotify is Linux only")
+    def test_02_inotify(self):
+        """Test the inotify backend"""
+        self.watch(InotifyBackend(self.config_path, poll_interval=0.05))
+
+    def test_03_invalid_file_keeps_settings(self):
+        """Test that a broken file does not replace the current settings"""
+        watcher = ConfigWatcher(
+            self.changes.put,
+            self.config_path,
+            PollingBackend(self.config_path, poll_interval=0.05),
+        )
+        with open(self.config_path, "w", encoding="utf-8") as config_file:
+            config_file.write("[DEFAULT]\nUrl = http://127.0.0.1:32400\n")
+        watcher.reload()
+        self.assertTrue(self.changes.empty())
+        self.assertEqual(watcher.settings.plex_token, "token")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+""" Headless entry point, monitors Plex and shuts down the computer without loading the GUI stack """
+import signal
+
+from config import PRIMARY_SERVER_NAME, Settings, load_settings
+from config_watcher import ConfigWatcher
+from idle import IdleSourceError, default_idle_source, require_idle_source
+from metrics import MetricsServer
+from monitor_log import MonitorLog, get_logger
+from plex_connection import PlexConnectionPool
+from plex_shutdown_manager import PlexShutdownManager
+from trace_log import open_trace_log
+from usage_model import TraceUsageModel
+
+log = get_logger(__name__)
+
+
+class HeadlessHost:
+    """Plain settings and status interface used by PlexShutdownManager in place of the GUI.
+    Auto shutdown is always on and errors are logged instead of shown in a window"""
+
+    def __init__(self, settings: Settings, connection_pool: PlexConnectionPool = None):
+        self.settings = settings
+        self.connection_pool = connection_pool or PlexConnectionPool()
+        # (primary handle, list of (name, extra handle)), replaced as a whole on reconnect
+        self.plex_handles = (None, [])
+
+    def connect(self):
+        """Connects to every configured server, a server that cannot be reached is left as None"""
+        settings = self.settings
+        plex = self.connect_server(
+            PRIMARY_SERVER_NAME, settings.plex_url, settings.plex_token
+        )
+        extra_plex = [
+            (name, self.connect_server(name, url, token))
+            for name, url, token in settings.extra_servers
+        ]
+        self.plex_handles = (plex, extra_plex)
+
+    def connect_server(self, name, url, token):
+        """Returns a handle of the given server or None if it cannot be reached"""
+        try:
+            plex = self.connection_pool.connect(url, token)
+        except Exception as e:
+            self.show_error(f"Cannot connect to {name} Plex server at {url}: {e}")
+            return None
+        log.info("Connected to %s Plex server at %s", name, url)
+        return plex
+
+    def reconnect_server(self, name):
+        """Returns a new handle of the given server and keeps it, raises if it cannot be reached"""
+        settings = self.settings
+        servers = {PRIMARY_SERVER_NAME: (settings.plex_url, settings.plex_token)}
+        servers.update(
+            (server, (url, token)) for server, url, token in settings.extra_servers
+        )
+        url, token = servers[name]
+        plex = self.connection_pool.connect(url, token)
+        primary, extra_plex = self.plex_handles
+        if name == PRIMARY_SERVER_NAME:
+            primary = plex
+        else:
+            extra_plex = [
+                (server, plex if server == name else handle)
+                for server, handle in extra_plex
+            ]
+        self.plex_handles = (primary, extra_plex)
+        log.info("Reconnected to %s Plex server at %s", name, url)
+        return plex
+
+    def reload_settings(self, settings: Settings):
+        """Switches to settings changed in the config file, reconnects if the servers changed"""
+        previous = self.settings
+        self.settings = settings
+        if settings.connection_changed(previous):
+            self.connect()
+
+    def show_error(self, message):
+        """Logs the error"""
+        log.error("%s", message)
+
+    def show_plex_health(self, message):
+        """Shows the connection state of the servers, the manager already logged it"""
+
+    def get_shutdown_status(self):
+        """Auto shutdown is always on in headless mode"""
+        return True
+
+    def get_max_computer_idle(self):
+        """Returns the max computer idle time"""
+        return self.settings.computer_idle
+
+    def get_plex_instance(self):
+        """Returns the plex server instance"""
+        return self.plex_handles[0]
+
+    def get_extra_plex_instances(self):
+        """Returns a list of (name, plex server instance or None) of the extra servers"""
+        return self.plex_handles[1]
+
+    def get_connection_pool(self):
+        """Returns the connection pool shared by every Plex handle"""
+        return self.connection_pool
+
+    def get_shutdown_delay(self):
+        """Returns the shutdown delay"""
+        return self.settings.shutdown_delay
+
+    def get_interval_delay(self):
+        """Returns the interval delay"""
+        return self.settings.interval_delay
+
+
+def main():
+    """Runs the monitor in the foreground until interrupted"""
+    settings = load_settings()
+    monitor_log = MonitorLog(level=settings.log_level).start()
+    try:
+        require_idle_source(default_idle_source(), settings.computer_idle)
+    except IdleSourceError as e:
+        log.error("%s", e)
+        monitor_log.stop()
+        raise SystemExit(1) from e
+    host = HeadlessHost(settings)
+    host.connect()
+    trace_log = open_trace_log()
+    shutdown_manager = PlexShutdownManager(
+        host,
+        use_alerts=settings.use_alerts,
+        stale_session_minutes=settings.stale_session_timeout,
+        trace_log=trace_log,
+        # The usage model learns from the checks recorded in the trace log
+        usage_model=trace_log and TraceUsageModel(trace_log.trace_path),
+    )
+    if settings.metrics_port:
+        MetricsServer(shutdown_manager.metrics, settings.metrics_port).start()
+
+    def on_config_change(new_settings: Settings):
+        host.reload_settings(new_settings)
+        shutdown_manager.update_settings(
+            new_settings.use_alerts, new_settings.stale_session_timeout
+        )
+        monitor_log.set_level(new_settings.log_level)
+        try:
+            require_idle_source(
+                shutdown_manager.idle_source, new_settings.computer_idle
+            )
+        except IdleSourceError as e:
+            host.show_error(str(e))
+        shutdown_manager.wake()
+
+    watcher = ConfigWatcher(on_config_change).start()
+    signal.signal(signal.SIGTERM, lambda *_: shutdown_manager.stop())
+    try:
+        shutdown_manager.monitor_mainloop()
+    except KeyboardInterrupt:
+        log.info("Stopping the monitor")
+    finally:
+        watcher.stop()
+        try:
+            shutdown_manager.power.cancel()
+        except OSError as e:
+            log.error("Tear down failed to cancel shutdown: %s", e)
+        host.connection_pool.close()
+        if trace_log is not None:
+            trace_log.close()
+        monitor_log.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+""" Test file for daemon.py """
+import subprocess
+import sys
+import unittest
+from unittest.mock import MagicMock
+
+from config import PRIMARY_SERVER_NAME, Settings
+from daemon import HeadlessHost
+from fake_plex_server import FakePlexServer
+from idle import SyntheticIdleSource
+from plex_shutdown_manager import NO_ACTIVATION, PlexShutdownManager
+
+GUI_MODULES = ("app", "customtkinter", "pystray", "PIL", "win11toast")
+
+
+class DaemonTest(unittest.TestCase):
+    """Test class for daemon.py"""
+
+    def setUp(self) -> None:
+        self.pool = MagicMock()
+        self.settings = Settings(
+            plex_token="token",
+            extra_servers=(("Extra", "http://127.0.0.1:32401", "token"),),
+        )
+        self.host = HeadlessHost(self.settings, connection_pool=self.pool)
+
+    def test_01_no_gui_imports(self):
+        """Test that the daemon does not load the GUI stack"""
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, daemon; print(','.join(sorted(set(sys.modules) & set(sys.argv[1:]))))",
+                *GUI_MODULES,
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(result.stdout.strip(), "")
+
+    def test_02_connect(self):
+        """Test that every server is connected and an unreachable one is left as None"""
+        plex_mock = MagicMock()
+        self.pool.connect.side_effect = [plex_mock, ConnectionError("refused")]
+        self.host.connect()
+        self.assertIs(self.host.get_plex_instance(), plex_mock)
+        self.assertEqual(self.host.get_extra_plex_instances(), [("Extra", None)])
+
+    def test_03_drives_manager(self):
+        """Test that the manager runs a check through the headless host"""
+        server = FakePlexServer().start()
+        self.addCleanup(server.stop)
+        server.set_sessions(["1"])
+        self.host = HeadlessHost(Settings(plex_url=server.url, plex_token="token"))
+        self.addCleanup(self.host.connection_pool.close)
+        self.host.connect()
+        psm = PlexShutdownManager(
+            self.host,
+            parallel_probes=False,
+            idle_source=SyntheticIdleSource(idle_seconds=3600),
+        )
+        psm.check_if_transcoder_running = MagicMock(return_value=False)
+        self.assertEqual(psm.monitor_plex_and_shutdown(), NO_ACTIVATION)
+        self.assertIn(PRIMARY_SERVER_NAME, psm.metrics.last_plex_contact)
+
+
+    def test_04_reload_settings(self):
+        """Test that reloaded settings only reconnect when the servers changed"""
+        self.host.connect()
+        self.host.reload_settings(
+            Settings(
+                plex_token="token",
+                computer_idle=5,
+                extra_servers=self.settings.extra_servers,
+            )
+        )
+        self.assertEqual(self.host.get_max_computer_idle(), 5)
+        self.assertEqual(self.pool.connect.call_count, 2)
+        self.host.reload_settings(Settings(plex_token="new-token"))
+        self.assertEqual(self.pool.connect.call_count, 3)
+        self.assertEqual(self.host.get_extra_plex_instances(), [])
+
+    def test_05_reconnect_server(self):
+        """Test that a reconnected server replaces only its own handle"""
+        primary_mock, extra_mock = MagicMock(), MagicMock()
+        self.pool.connect.side_effect = [primary_mock, ConnectionError("refused")]
+        self.host.connect()
+        self.pool.connect.side_effect = None
+        self.pool.connect.return_value = extra_mock
+        self.assertIs(self.host.reconnect_server("Extra"), extra_mock)
+        self.pool.connect.assert_called_with("http://127.0.0.1:32401", "token")
+        self.assertIs(self.host.get_plex_instance(), primary_mock)
+        self.assertEqual(self.host.get_extra_plex_instances(), [("Extra", extra_mock)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,273 @@
+""" This file contains a local fake Plex server, used to test the Plex integration offline """
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import socket
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Pipe, Process
+from threading import Lock, Thread
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+NOTIFICATIONS_PATH = "/:/websockets/notifications"
+TEXT_OPCODE = 0x1
+CLOSE_OPCODE = 0x8
+PING_OPCODE = 0x9
+PONG_OPCODE = 0xA
+
+
+def encode_frame(payload: bytes, opcode=TEXT_OPCODE):
+    """Encodes an unmasked server to client websocket frame"""
+    header = bytearray([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        header.append(length)
+    elif length < 65536:
+        header.append(126)
+        header += length.to_bytes(2, "big")
+    else:
+        header.append(127)
+        header += length.to_bytes(8, "big")
+    return bytes(header) + payload
+
+
+def read_exactly(sock: socket.socket, size):
+    """Reads exactly size bytes from the socket, returns None if it was closed"""
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def read_frame(sock: socket.socket):
+    """Reads a masked client to server websocket frame, returns (opcode, payload) or None if closed"""
+    header = read_exactly(sock, 2)
+    if header is None:
+        return None
+    opcode = header[0] & 0x0F
+    masked = header[1] & 0x80
+    length = header[1] & 0x7F
+    if length == 126:
+        extended = read_exactly(sock, 2)
+        if extended is None:
+            return None
+        length = int.from_bytes(extended, "big")
+    elif length == 127:
+        extended = read_exactly(sock, 8)
+        if extended is None:
+            return None
+        length = int.from_bytes(extended, "big")
+    mask = read_exactly(sock, 4) if masked else b"\x00\x00\x00\x00"
+    payload = read_exactly(sock, length) if length else b""
+    if mask is None or payload is None:
+        return None
+    return opcode, bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+
+
+def sessions_xml(session_keys):
+    """Returns a /status/sessions payload with one video per session key"""
+    videos = "".join(
+        f'<Video sessionKey="{key}" key="/library/metadata/{key}" ratingKey="{key}" type="movie" title="Movie {key}">'
+        f'<User id="{key}" title="User {key}" />'
+        f'<Player state="playing" machineIdentifier="player-{key}" title="Player {key}" />'
+        "</Video>"
+        for key in session_keys
+    )
+    return f'<MediaContainer size="{len(session_keys)}">{videos}</MediaContainer>'
+
+
+class FakePlexRequestHandler(BaseHTTPRequestHandler):
+    """Serves the Plex endpoints used by PlexAutoShutdown and its alert websocket"""
+
+    server: FakePlexServer
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes, without this delayed ACKs add ~40 ms per request
+    disable_nagle_algorithm = True
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Handles every GET request sent to the fake server"""
+        path = self.path.split("?", 1)[0]
+        if path == NOTIFICATIONS_PATH:
+            self.handle_websocket()
+        elif path == "/":
+            self.send_xml(
+                f'<MediaContainer size="0" friendlyName="Fake Plex" '
+                f'machineIdentifier="{self.server.machine_identifier}" version="1.40.0.0" />'
+            )
+        elif path == "/status/sessions":
+            self.send_xml(self.server.sessions_payload())
+        elif path == "/transcode/sessions":
+            self.send_xml('<MediaContainer size="0" />')
+        else:
+            self.send_error(404)
+
+    def send_xml(self, body: str):
+        """Sends an XML response"""
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml;charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_websocket(self):
+        """Upgrades the connection to a websocket and keeps it open until the client leaves"""
+        key = self.headers.get("Sec-WebSocket-Key", "")
+        accept = base64.b64encode(
+            hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest()
+        ).decode("ascii")
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+
+        sock = self.connection
+        self.server.add_alert_client(sock)
+        try:
+            while True:
+                frame = read_frame(sock)
+                if frame is None or frame[0] == CLOSE_OPCODE:
+                    break
+                if frame[0] == PING_OPCODE:
+                    self.server.send_to(sock, encode_frame(frame[1], PONG_OPCODE))
+        except OSError:
+            pass
+        finally:
+            self.server.remove_alert_client(sock)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Keeps the fake server quiet"""
+
+
+class FakePlexServer(ThreadingHTTPServer):
+    """Local fake Plex server, serves sessions and pushes alerts to websocket listeners"""
+
+    daemon_threads = True
+    machine_identifier = "fake-plex-server"
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__((host, port), FakePlexRequestHandler)
+        self.clients_lock = Lock()
+        self.alert_clients = []
+        self.session_keys = []
+        self.payload = sessions_xml([])
+        self.thread = None
+
+    @property
+    def url(self):
+        """Returns the base url of the fake server"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Starts serving on a background thread"""
+        self.thread = Thread(
+            target=self.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Drops every alert client and stops serving"""
+        self.drop_alert_clients()
+        self.shutdown()
+        self.server_close()
+
+    def set_sessions(self, session_keys):
+        """Sets the sessions reported by /status/sessions"""
+        self.session_keys = list(session_keys)
+        self.payload = sessions_xml(self.session_keys)
+
+    def sessions_payload(self):
+        """Returns the current /status/sessions payload"""
+        return self.payload
+
+    def add_alert_client(self, sock: socket.socket):
+        """Registers a websocket client"""
+        with self.clients_lock:
+            self.alert_clients.append(sock)
+
+    def remove_alert_client(self, sock: socket.socket):
+        """Unregisters a websocket client"""
+        with self.clients_lock:
+            if sock in self.alert_clients:
+                self.alert_clients.remove(sock)
+
+    def alert_client_count(self):
+        """Returns the number of connected websocket clients"""
+        with self.clients_lock:
+            return len(self.alert_clients)
+
+    def send_to(self, sock: socket.socket, frame: bytes):
+        """Sends a raw frame to a websocket client"""
+        with self.clients_lock:
+            sock.sendall(frame)
+
+    def send_alert(self, notification_container: dict):
+        """Pushes a NotificationContainer to every websocket client"""
+        frame = encode_frame(
+            json.dumps({"NotificationContainer": notification_container}).encode(
+                "utf-8"
+            )
+        )
+        with self.clients_lock:
+            for sock in self.alert_clients:
+                sock.sendall(frame)
+
+    def send_playing(self, session_key, state="playing"):
+        """Pushes a playing alert for the given session"""
+        self.send_alert(
+            {
+                "type": "playing",
+                "size": 1,
+                "PlaySessionStateNotification": [
+                    {"sessionKey": str(session_key), "state": state}
+                ],
+            }
+        )
+
+    def send_transcode(self, alert_type, transcode_key):
+        """Pushes a transcodeSession.* alert for the given transcode session"""
+        self.send_alert(
+            {
+                "type": alert_type,
+                "size": 1,
+                "TranscodeSession": [{"key": transcode_key}],
+            }
+        )
+
+    def drop_alert_clients(self):
+        """Abruptly closes every websocket client, as if the server went away"""
+        with self.clients_lock:
+            clients, self.alert_clients = self.alert_clients, []
+        for sock in clients:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def run_server_process(connection, session_count):
+    """Entry point of a fake server process, sends its url through the connection"""
+    server = FakePlexServer()
+    server.set_sessions([str(key) for key in range(1, session_count + 1)])
+    connection.send(server.url)
+    server.serve_forever()
+
+
+def start_server_process(session_count=0):
+    """Starts a fake server serving session_count sessions in its own process, so serving
+    does not use the CPU time of the caller. Returns the process and the server url"""
+    parent_connection, child_connection = Pipe()
+    process = Process(
+        target=run_server_process, args=(child_connection, session_count), daemon=True
+    )
+    process.start()
+    return process, parent_connection.recv()
@@ -1,5 +1,28 @@
-""" This module contains functions to prevent the OS from going to sleep and to get the last input event. """
-from ctypes import Structure, windll, c_uint, sizeof, byref
+""" This module contains the sources of the time since the last input event and the functions to prevent the OS from going to sleep. """
+import os
+import select
+import sys
+from ctypes import Structure, c_uint, sizeof, byref
+from functools import lru_cache
+from glob import glob
+from threading import Lock, Thread
+from time import monotonic
+
+from monitor_log import get_logger
+
+try:
+    from ctypes import windll
+except ImportError:
+    # windll only exists on Windows, the functions below are not available elsewhere
+    windll = None
+
+log = get_logger(__name__)
+
+INPUT_DEVICE_PATTERN = "/dev/input/event*"
+# Bytes read per wakeup, a few dozen input_event records
+INPUT_READ_SIZE = 4096
+# Seconds between two looks for input devices plugged in after start
+INPUT_RESCAN_INTERVAL = 60
 
 
 class LASTINPUTINFO(Structure):
@@ -20,6 +43,206 @@ def get_idle_duration():
     return millis / 1000.0
 
 
+class IdleSource:
+    """Interface of a source of the time since the last user input"""
+
+    def idle_seconds(self):
+        """Returns the number of seconds since the last input event"""
+        raise NotImplementedError
+
+    def close(self):
+        """Releases what the source holds"""
+
+
+class WindowsIdleSource(IdleSource):
+    """Reads the last input time kept by Windows"""
+
+    def idle_seconds(self):
+        """Returns the number of seconds since the last input event"""
+        return get_idle_duration()
+
+
+class LinuxInputIdleSource(IdleSource):
+    """Keeps the time of the last event of the /dev/input event devices, updated by a thread
+    waiting on them with epoll, so reading the idle time does not touch the devices.
+    Reading the devices needs root or a user in the input group"""
+
+    def __init__(self, devices=None, clock=monotonic):
+        self.clock = clock
+        self.rescan = devices is None
+        self.last_input = clock()
+        self.lock = Lock()
+        self.epoll = select.epoll()
+        self.devices = {}
+        self.stop_read, self.stop_write = os.pipe()
+        self.epoll.register(self.stop_read, select.EPOLLIN)
+        errors = self.open_devices(
+            sorted(glob(INPUT_DEVICE_PATTERN)) if devices is None else devices
+        )
+        if not self.devices:
+            self.close_descriptors()
+            if errors:
+                raise errors[0]
+            raise FileNotFoundError(f"No input device matches {INPUT_DEVICE_PATTERN}")
+        self.thread = Thread(target=self.run, daemon=True, name="idle-input")
+        self.thread.start()
+
+    def open_devices(self, devices):
+        """Starts waiting on the devices not opened yet, returns the errors of the failed ones"""
+        errors = []
+        opened = set(self.devices.values())
+        for device in devices:
+            if device in opened:
+                continue
+            try:
+                fd = os.open(device, os.O_RDONLY | os.O_NONBLOCK | os.O_CLOEXEC)
+            except OSError as e:
+                errors.append(e)
+                continue
+            self.epoll.register(fd, select.EPOLLIN)
+            self.devices[fd] = device
+        return errors
+
+    def close_device(self, fd):
+        """Stops waiting on an unplugged device"""
+        self.epoll.unregister(fd)
+        os.close(fd)
+        del self.devices[fd]
+
+    def run(self):
+        """Waits for input events until closed"""
+        try:
+            while True:
+                events = self.epoll.poll(INPUT_RESCAN_INTERVAL if self.rescan else -1)
+                if not events and self.rescan:
+                    self.open_devices(glob(INPUT_DEVICE_PATTERN))
+                for fd, mask in events:
+                    if fd == self.stop_read:
+                        return
+                    if mask & select.EPOLLIN:
+                        self.read_events(fd)
+                    elif mask & (select.EPOLLHUP | select.EPOLLERR):
+                        self.close_device(fd)
+        finally:
+            self.close_descriptors()
+
+    def read_events(self, fd):
+        """Drains the pending events of a device and records the time of the input"""
+        try:
+            os.read(fd, INPUT_READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            # ENODEV once the device is unplugged
+            self.close_device(fd)
+            return
+        # Only the time matters, the records themselves are not decoded
+        self.last_input = self.clock()
+
+    def idle_seconds(self):
+        """Returns the number of seconds since the last input event"""
+        return self.clock() - self.last_input
+
+    def close_descriptors(self):
+        """Closes the devices, the wakeup pipe and the epoll descriptor"""
+        with self.lock:
+            if self.epoll.closed:
+                return
+            for fd in list(self.devices):
+                os.close(fd)
+            self.devices.clear()
+            os.close(self.stop_read)
+            os.close(self.stop_write)
+            self.epoll.close()
+
+    def close(self):
+        """Stops the thread and closes the devices"""
+        with self.lock:
+            if self.epoll.closed:
+                return
+            os.write(self.stop_write, b"\0")
+        self.thread.join()
+
+
+class SyntheticIdleSource(IdleSource):
+    """Idle source fed with input events by hand, used by the tests and the benchmarks"""
+
+    def __init__(self, idle_seconds=0.0, clock=monotonic):
+        self.clock = clock
+        self.last_input = clock() - idle_seconds
+
+    def input(self):
+        """Records an input event now"""
+        self.last_input = self.clock()
+
+    def idle_seconds(self):
+        """Returns the number of seconds since the last input event"""
+        return self.clock() - self.last_input
+
+
+class NoInputIdleSource(IdleSource):
+    """Source of a computer without any input device, nobody can use it so it is idle since
+    the monitor started. A device plugged in later is not seen until a restart"""
+
+    def __init__(self, clock=monotonic):
+        self.clock = clock
+        self.started = clock()
+
+    def idle_seconds(self):
+        """Returns the number of seconds since the source was created"""
+        return self.clock() - self.started
+
+
+class UnavailableIdleSource(IdleSource):
+    """Stands in for a source that could not be opened, every read fails with the reason"""
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+    def idle_seconds(self):
+        """Raises the error that made the source unavailable"""
+        raise self.error
+
+
+class IdleSourceError(RuntimeError):
+    """Raised at startup when MaxIdle needs the idle time but it cannot be read"""
+
+
+def require_idle_source(source: IdleSource, max_idle_minutes):
+    """Raises IdleSourceError if the max idle time is set but the source cannot read the idle
+    time, the monitor would otherwise never be able to decide"""
+    if max_idle_minutes and isinstance(source, UnavailableIdleSource):
+        raise IdleSourceError(
+            f"Cannot read the computer idle time: {source.error}. Add the user to the input "
+            "group or set MaxIdle = 0 to shut down without waiting for the computer to be idle"
+        )
+
+
+@lru_cache(maxsize=None)
+def default_idle_source() -> IdleSource:
+    """Returns the idle source of the platform, shared by every caller"""
+    if windll is not None:
+        return WindowsIdleSource()
+    if sys.platform.startswith("linux"):
+        try:
+            return LinuxInputIdleSource()
+        except FileNotFoundError:
+            # A headless server, nobody can be using it
+            log.info(
+                "No input device found, the computer is idle since the monitor started"
+            )
+            return NoInputIdleSource()
+        except OSError as e:
+            log.warning(
+                "Cannot read the input devices, the computer idle time is unknown: %s",
+                e,
+            )
+            return UnavailableIdleSource(e)
+    return UnavailableIdleSource(
+        OSError(f"Reading the idle time is not supported on {sys.platform}")
+    )
+
+
 class WindowsInhibitor:
     """Prevent OS sleep/hibernate in windows; code from:
     https://github.com/h3llrais3r/Deluge-PreventSuspendPlus/blob/master/preventsuspendplus/core.py
@@ -34,12 +257,16 @@ class WindowsInhibitor:
 
     def inhibit(self):
         """Disable Windows sleep/hibernate"""
-        print("Preventing Windows from going to sleep")
+        if windll is None:
+            return
+        log.info("Preventing Windows from going to sleep")
         windll.kernel32.SetThreadExecutionState(
             WindowsInhibitor.ES_CONTINUOUS | WindowsInhibitor.ES_SYSTEM_REQUIRED
         )
 
     def uninhibit(self):
         """Enable Windows sleep/hibernate"""
-        print("Allowing Windows to go to sleep")
+        if windll is None:
+            return
+        log.info("Allowing Windows to go to sleep")
         windll.kernel32.SetThreadExecutionState(WindowsInhibitor.ES_CONTINUOUS)
@@ -0,0 +1,100 @@
+""" Test file for idle.py """
+import os
+import sys
+import tempfile
+import unittest
+from time import sleep
+from unittest.mock import patch
+
+from idle import (
+    IdleSourceError,
+    LinuxInputIdleSource,
+    NoInputIdleSource,
+    SyntheticIdleSource,
+    UnavailableIdleSource,
+    default_idle_source,
+    require_idle_source,
+)
+
+
+class FakeClock:
+    """Clock moved by hand"""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class IdleSourceTest(unittest.TestCase):
+    """Test class for idle.py"""
+
+    def test_01_synthetic_source(self):
+        """Test the synthetic source counts the idle time since its last input"""
+        clock = FakeClock()
+        source = SyntheticIdleSource(idle_seconds=30, clock=clock)
+        self.assertEqual(source.idle_seconds(), 30)
+        clock.now += 10
+        self.assertEqual(source.idle_seconds(), 40)
+        source.input()
+        self.assertEqual(source.idle_seconds(), 0)
+
+    def test_02_unavailable_source(self):
+        """Test the unavailable source fails every read with its error"""
+        source = UnavailableIdleSource(OSError("no devices"))
+        with self.assertRaises(OSError):
+            source.idle_seconds()
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "Needs epoll")
+    def test_03_linux_source_records_input(self):
+        """Test the Linux source resets the idle time when a device sends an event"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # A FIFO stands in for an event device, both are read without blocking
+        device = os.path.join(directory.name, "event0")
+        os.mkfifo(device)
+        clock = FakeClock()
+        source = LinuxInputIdleSource([device], clock=clock)
+        self.addCleanup(source.close)
+        writer = os.open(device, os.O_WRONLY | os.O_NONBLOCK)
+        self.addCleanup(os.close, writer)
+        clock.now += 50
+        self.assertEqual(source.idle_seconds(), 50)
+        os.write(writer, b"\0" * 24)
+        for _ in range(100):
+            if source.idle_seconds() == 0:
+                break
+            sleep(0.01)
+        self.assertEqual(source.idle_seconds(), 0)
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "Needs epoll")
+    def test_04_linux_source_without_devices(self):
+        """Test the Linux source fails to open when no device can be read"""
+        with self.assertRaises(OSError):
+            LinuxInputIdleSource(["/nonexistent/event0"])
+
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "Needs epoll")
+    def test_05_headless_policy(self):
+        """Test a computer without input devices is idle since the start, while unreadable
+        devices stop the monitor from starting unless MaxIdle is 0"""
+        clock = FakeClock()
+        source = NoInputIdleSource(clock=clock)
+        clock.now += 120
+        self.assertEqual(source.idle_seconds(), 120)
+        with patch("idle.glob", return_value=[]):
+            self.assertIsInstance(default_idle_source.__wrapped__(), NoInputIdleSource)
+        with patch("idle.glob", return_value=["/nonexistent/event0"]), patch(
+            "idle.os.open", side_effect=PermissionError("denied")
+        ):
+            unreadable = default_idle_source.__wrapped__()
+        self.assertIsInstance(unreadable, UnavailableIdleSource)
+        with self.assertRaises(IdleSourceError):
+            require_idle_source(unreadable, 30)
+        require_idle_source(unreadable, 0)
+        require_idle_source(source, 30)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,35 +1,86 @@
 """ Main entry point for the application. """
-import subprocess
+from functools import partial
 from threading import Thread
 
-from app import App
-from config import load_config
+from config import load_settings
+from config_watcher import ConfigWatcher
+from idle import IdleSourceError, default_idle_source, require_idle_source
+from metrics import MetricsServer
+from monitor_log import MonitorLog, get_logger
 from plex_shutdown_manager import PlexShutdownManager
+from trace_log import open_trace_log
+from usage_model import TraceUsageModel
+
+log = get_logger(__name__)
 
 if __name__ == "__main__":
-    (
-        plex_url,
-        plex_token,
-        computer_idle,
-        interval_delay,
-        shutdown_delay,
-    ) = load_config()
+    settings = load_settings()
+    monitor_log = MonitorLog(level=settings.log_level).start()
+    try:
+        require_idle_source(default_idle_source(), settings.computer_idle)
+    except IdleSourceError as e:
+        log.error("%s", e)
+        monitor_log.stop()
+        raise SystemExit(1) from e
+    # The GUI stack is the slowest import, it is only loaded once the config is read
+    from app import App  # pylint: disable=import-outside-toplevel
+
     app = App(
-        plex_url,
-        plex_token,
-        computer_idle,
-        interval_delay,
-        shutdown_delay,
+        settings.plex_url,
+        settings.plex_token,
+        settings.computer_idle,
+        settings.interval_delay,
+        settings.shutdown_delay,
+        settings.use_alerts,
+        settings.extra_servers,
+        settings.metrics_port,
+        settings.stale_session_timeout,
+        settings.log_level,
     )
-    shutdown_manager = PlexShutdownManager(app)
+    trace_log = open_trace_log()
+    shutdown_manager = PlexShutdownManager(
+        app,
+        use_alerts=settings.use_alerts,
+        stale_session_minutes=settings.stale_session_timeout,
+        trace_log=trace_log,
+        # The usage model learns from the checks recorded in the trace log
+        usage_model=trace_log and TraceUsageModel(trace_log.trace_path),
+    )
+    app.add_settings_listener(shutdown_manager.wake)
+    if settings.metrics_port:
+        MetricsServer(shutdown_manager.metrics, settings.metrics_port).start()
+
+    def on_config_change(new_settings):
+        """Applies settings edited in the config file, runs on the watcher thread. The
+        window reloads them on the Tk thread, the manager on its next check"""
+        shutdown_manager.update_settings(
+            new_settings.use_alerts, new_settings.stale_session_timeout
+        )
+        monitor_log.set_level(new_settings.log_level)
+        try:
+            require_idle_source(
+                shutdown_manager.idle_source, new_settings.computer_idle
+            )
+        except IdleSourceError as e:
+            app.show_error(str(e))
+        app.post(partial(app.reload_settings, new_settings))
+
+    watcher = ConfigWatcher(on_config_change).start()
     background = Thread(
         target=shutdown_manager.monitor_mainloop,
         daemon=True,
     )
     app.after(1000, background.start)
     app.mainloop()
+    watcher.stop()
+    shutdown_manager.stop()
+    if background.is_alive():
+        background.join()
+    if trace_log is not None:
+        trace_log.close()
 
     try:
-        subprocess.run(["shutdown", "-a"], check=True)
-    except subprocess.CalledProcessError:
-        print("Tear down failed to cancel shutdown")
+        shutdown_manager.power.cancel()
+    except OSError as e:
+        log.error("Tear down failed to cancel shutdown: %s", e)
+    monitor_log.stop()
@@ -0,0 +1,232 @@
+""" This file contains the in-memory monitor metrics and the local endpoint serving them in Prometheus text format """
+from __future__ import annotations
+
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import monotonic
+from typing import TYPE_CHECKING
+
+from monitor_log import get_logger
+from plex_supervisor import SUPERVISOR_STATES
+
+if TYPE_CHECKING:
+    from plex_supervisor import SupervisorStatus
+
+log = get_logger(__name__)
+
+METRICS_PATH = "/metrics"
+METRICS_HOST = "127.0.0.1"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Upper bounds in seconds, from an in-memory idle read to a slow Plex server
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10)
+
+
+def format_value(value):
+    """Formats a sample value the way Prometheus expects it"""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Latency histogram with fixed buckets. Observing only increments preallocated counters"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        """Counts a value in its bucket, the last bucket holds the values above every bound"""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def samples(self):
+        """Returns the cumulative (upper bound, count) pairs, the sum and the count"""
+        cumulative = []
+        count = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), self.counts):
+            count += bucket_count
+            cumulative.append((bound, count))
+        return cumulative, self.total, count
+
+
+class ShutdownMetrics:
+    """Probe latencies, decision outcomes and Plex contact state of the monitor. Recording
+    holds the lock only to bump a counter, rendering copies the values before formatting them
+    so a scrape never holds up the monitor thread"""
+
+    def __init__(self, probes=(), outcomes=(), clock=monotonic):
+        self.clock = clock
+        self.lock = Lock()
+        self.probe_latency = {name: Histogram() for name in probes}
+        self.outcomes = {name: 0 for name in outcomes}
+        self.plex_errors = {}
+        self.last_plex_contact = {}
+        self.plex_states = {}
+
+    def observe_probe(self, name, latency):
+        """Records the latency in seconds of a probe run"""
+        with self.lock:
+            histogram = self.probe_latency.get(name)
+            if histogram is None:
+                histogram = self.probe_latency[name] = Histogram()
+            histogram.observe(latency)
+
+    def record_outcome(self, name):
+        """Counts a monitor decision"""
+        with self.lock:
+            self.outcomes[name] = self.outcomes.get(name, 0) + 1
+
+    def record_plex_error(self, server):
+        """Counts a failed sessions query of a Plex server"""
+        with self.lock:
+            self.plex_errors[server] = self.plex_errors.get(server, 0) + 1
+
+    def record_plex_contact(self, server):
+        """Records a successful sessions query of a Plex server"""
+        now = self.clock()
+        with self.lock:
+            self.last_plex_contact[server] = now
+            self.plex_errors.setdefault(server, 0)
+
+    def record_plex_state(self, status: SupervisorStatus):
+        """Records the connection state of a Plex server"""
+        with self.lock:
+            self.plex_states[status.name] = status
+
+    def render(self):
+        """Returns every metric in Prometheus text format"""
+        with self.lock:
+            histograms = {
+                name: histogram.samples()
+                for name, histogram in self.probe_latency.items()
+            }
+            outcomes = dict(self.outcomes)
+            plex_errors = dict(self.plex_errors)
+            last_plex_contact = dict(self.last_plex_contact)
+            plex_states = dict(self.plex_states)
+        now = self.clock()
+
+        lines = [
+            "# HELP plex_auto_shutdown_probe_latency_seconds Latency of the probes used by the shutdown decision",
+            "# TYPE plex_auto_shutdown_probe_latency_seconds histogram",
+        ]
+        for name, (buckets, total, count) in histograms.items():
+            for bound, bucket_count in buckets:
+                lines.append(
+                    f'plex_auto_shutdown_probe_latency_seconds_bucket{{probe="{name}",le="{format_value(bound)}"}} {bucket_count}'
+                )
+            lines.append(
+                f'plex_auto_shutdown_probe_latency_seconds_sum{{probe="{name}"}} {format_value(total)}'
+            )
+            lines.append(
+                f'plex_auto_shutdown_probe_latency_seconds_count{{probe="{name}"}} {count}'
+            )
+
+        lines.append(
+            "# HELP plex_auto_shutdown_decisions_total Outcomes of the monitor checks"
+        )
+        lines.append("# TYPE plex_auto_shutdown_decisions_total counter")
+        for name, count in outcomes.items():
+            lines.append(
+                f'plex_auto_shutdown_decisions_total{{outcome="{name}"}} {count}'
+            )
+
+        lines.append(
+            "# HELP plex_auto_shutdown_plex_errors_total Failed sessions queries per Plex server"
+        )
+        lines.append("# TYPE plex_auto_shutdown_plex_errors_total counter")
+        for server, count in plex_errors.items():
+            lines.append(
+                f'plex_auto_shutdown_plex_errors_total{{server="{server}"}} {count}'
+            )
+
+        lines.append(
+            "# HELP plex_auto_shutdown_seconds_since_plex_contact Seconds since the last successful sessions query per Plex server"
+        )
+        lines.append("# TYPE plex_auto_shutdown_seconds_since_plex_contact gauge")
+        for server, contact in last_plex_contact.items():
+            lines.append(
+                f'plex_auto_shutdown_seconds_since_plex_contact{{server="{server}"}} {format_value(now - contact)}'
+            )
+
+        lines.append(
+            "# HELP plex_auto_shutdown_plex_connection_state Connection state of the supervisor of every Plex server"
+        )
+        lines.append("# TYPE plex_auto_shutdown_plex_connection_state gauge")
+        for server, status in plex_states.items():
+            for state in SUPERVISOR_STATES:
+                lines.append(
+                    f'plex_auto_shutdown_plex_connection_state{{server="{server}",state="{state}"}} {int(status.state == state)}'
+                )
+        lines.append(
+            "# HELP plex_auto_shutdown_plex_consecutive_failures Failed checks in a row per Plex server"
+        )
+        lines.append("# TYPE plex_auto_shutdown_plex_consecutive_failures gauge")
+        for server, status in plex_states.items():
+            lines.append(
+                f'plex_auto_shutdown_plex_consecutive_failures{{server="{server}"}} {status.failures}'
+            )
+        lines.append(
+            "# HELP plex_auto_shutdown_plex_retry_in_seconds Seconds until an open circuit lets the next check through"
+        )
+        lines.append("# TYPE plex_auto_shutdown_plex_retry_in_seconds gauge")
+        for server, status in plex_states.items():
+            if status.retry_at is not None:
+                lines.append(
+                    f'plex_auto_shutdown_plex_retry_in_seconds{{server="{server}"}} {format_value(max(0.0, status.retry_at - now))}'
+                )
+        return "\n".join(lines) + "\n"
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serves the metrics of the server"""
+
+    server: MetricsServer
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Handles a scrape"""
+        if self.path.split("?")[0] != METRICS_PATH:
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """Local HTTP endpoint serving the metrics from its own thread, port 0 picks a free port"""
+
+    daemon_threads = True
+
+    def __init__(self, metrics: ShutdownMetrics, port=0, host=METRICS_HOST):
+        super().__init__((host, port), MetricsRequestHandler)
+        self.metrics = metrics
+        self.thread = None
+
+    @property
+    def url(self):
+        """Returns the url of the metrics endpoint"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{METRICS_PATH}"
+
+    def start(self):
+        """Starts serving in a background thread"""
+        self.thread = Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        log.info("Serving metrics on %s", self.url)
+
+    def stop(self):
+        """Stops serving and closes the socket"""
+        self.shutdown()
+        self.server_close()
+        if self.thread is not None:
+            self.thread.join()
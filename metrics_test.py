@@ -0,0 +1,98 @@
+""" Test file for metrics.py """
+import unittest
+import urllib.error
+import urllib.request
+
+from metrics import Histogram, MetricsServer, ShutdownMetrics
+from plex_supervisor import OPEN, SupervisorStatus
+
+
+class MetricsTest(unittest.TestCase):
+    """Test class for metrics.py"""
+
+    def setUp(self) -> None:
+        self.now = 100.0
+        self.metrics = ShutdownMetrics(
+            ["idle", "sessions"], ["no_activation"], clock=lambda: self.now
+        )
+
+    def test_01_histogram_buckets(self):
+        """Test that observations land in cumulative buckets and the overflow bucket"""
+        histogram = Histogram(buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+        buckets, total, count = histogram.samples()
+        self.assertEqual(buckets, [(0.1, 2), (1, 3), (float("inf"), 4)])
+        self.assertAlmostEqual(total, 3.65)
+        self.assertEqual(count, 4)
+
+    def test_02_render_prometheus_text(self):
+        """Test that every metric is rendered in Prometheus text format"""
+        self.metrics.observe_probe("idle", 0.00005)
+        self.metrics.record_outcome("no_activation")
+        self.metrics.record_outcome("activated_shutdown")
+        self.metrics.record_plex_contact("Primary")
+        self.metrics.record_plex_error("Extra")
+        self.now = 130.0
+        text = self.metrics.render()
+        self.assertIn(
+            'plex_auto_shutdown_probe_latency_seconds_bucket{probe="idle",le="0.0001"} 1',
+            text,
+        )
+        self.assertIn(
+            'plex_auto_shutdown_probe_latency_seconds_count{probe="sessions"} 0', text
+        )
+        self.assertIn(
+            'plex_auto_shutdown_decisions_total{outcome="activated_shutdown"} 1', text
+        )
+        self.assertIn('plex_auto_shutdown_plex_errors_total{server="Primary"} 0', text)
+        self.assertIn('plex_auto_shutdown_plex_errors_total{server="Extra"} 1', text)
+        self.assertIn(
+            'plex_auto_shutdown_seconds_since_plex_contact{server="Primary"} 30.0',
+            text,
+        )
+        self.assertNotIn('seconds_since_plex_contact{server="Extra"}', text)
+
+    def test_03_serve_metrics(self):
+        """Test that the endpoint serves the metrics and nothing else"""
+        self.metrics.record_outcome("no_activation")
+        server = MetricsServer(self.metrics)
+        server.start()
+        try:
+            with urllib.request.urlopen(server.url, timeout=5) as response:
+                self.assertTrue(
+                    response.headers["Content-Type"].startswith("text/plain")
+                )
+                body = response.read().decode("utf-8")
+            self.assertIn(
+                'plex_auto_shutdown_decisions_total{outcome="no_activation"} 1', body
+            )
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen(server.url.replace("/metrics", "/"), timeout=5)
+        finally:
+            server.stop()
+
+    def test_04_render_connection_state(self):
+        """Test that the supervisor state of every server is rendered"""
+        self.metrics.record_plex_state(
+            SupervisorStatus("Extra", OPEN, 3, "refused", None, 90.0, 120.0)
+        )
+        text = self.metrics.render()
+        self.assertIn(
+            'plex_auto_shutdown_plex_connection_state{server="Extra",state="open"} 1',
+            text,
+        )
+        self.assertIn(
+            'plex_auto_shutdown_plex_connection_state{server="Extra",state="healthy"} 0',
+            text,
+        )
+        self.assertIn(
+            'plex_auto_shutdown_plex_consecutive_failures{server="Extra"} 3', text
+        )
+        self.assertIn(
+            'plex_auto_shutdown_plex_retry_in_seconds{server="Extra"} 20.0', text
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
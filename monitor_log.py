@@ -0,0 +1,144 @@
+""" This file contains the log of the monitor, records are handed to a writer thread through a queue and written as text with key=value fields to a rotating file """
+from __future__ import annotations
+
+import logging
+import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import SimpleQueue
+
+LOGGER_NAME = "plex_auto_shutdown"
+# Relative like the config file, so both end up in the same folder
+LOG_PATH = "PlexAutoShutdown.log"
+# Size at which the log file is rotated and number of older files kept
+MAX_LOG_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+LOG_FORMAT = "%(asctime)s %(levelname)s %(module)s: %(message)s"
+
+
+def get_logger(name):
+    """Returns the logger of a module, a child of the monitor logger"""
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+def fields(**values):
+    """Returns the extra argument of a logging call that adds key=value fields to the record"""
+    return {"fields": values}
+
+
+def level_name(level):
+    """Returns the upper case name of a log level, raises ValueError if it is unknown"""
+    name = str(level).strip().upper()
+    if name not in LOG_LEVELS:
+        raise ValueError(f"Unknown log level {level}, expected one of {LOG_LEVELS}")
+    return name
+
+
+def format_value(value):
+    """Returns a field value as a single token, text with spaces is quoted"""
+    if value is None:
+        return "-"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float):
+        return f"{value:.4g}"
+    text = str(value)
+    if not text or any(char in text for char in ' "='):
+        return '"' + text.replace('"', '\\"') + '"'
+    return text
+
+
+class KeyValueFormatter(logging.Formatter):
+    """Formats the message followed by the key=value fields of the record"""
+
+    def format(self, record):
+        line = super().format(record)
+        values = getattr(record, "fields", None)
+        if not values:
+            return line
+        pairs = " ".join(
+            f"{key}={format_value(value)}" for key, value in values.items()
+        )
+        return f"{line} {pairs}"
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Puts records on the queue as they are, so the message and the fields are only formatted
+    on the writer thread. The arguments of a logging call must not change after the call"""
+
+    def prepare(self, record):
+        return record
+
+
+class MonitorLog:
+    """Log of every module of the monitor. The logging calls only put the record on a queue,
+    a listener thread formats it and writes it to the rotating log file and to the console
+    when there is one, so a slow disk or terminal never stalls the monitor thread"""
+
+    def __init__(
+        self,
+        log_path=LOG_PATH,
+        level="INFO",
+        max_bytes=MAX_LOG_BYTES,
+        backups=LOG_BACKUPS,
+        console=True,
+    ):
+        self.log_path = log_path
+        self.level = level
+        self.max_bytes = max_bytes
+        self.backups = backups
+        # The windowed build has no console, sys.stdout is None there
+        self.console = console
+        self.logger = logging.getLogger(LOGGER_NAME)
+        self.handler = None
+        self.listener = None
+
+    def start(self):
+        """Starts the writer thread and sends the records of every module to it"""
+        formatter = KeyValueFormatter(LOG_FORMAT)
+        handlers = []
+        file_error = None
+        try:
+            handlers.append(
+                RotatingFileHandler(
+                    self.log_path,
+                    maxBytes=self.max_bytes,
+                    backupCount=self.backups,
+                    encoding="utf-8",
+                )
+            )
+        except OSError as e:
+            file_error = e
+        if self.console and sys.stdout is not None:
+            handlers.append(logging.StreamHandler(sys.stdout))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        queue = SimpleQueue()
+        self.handler = DeferredQueueHandler(queue)
+        self.listener = QueueListener(queue, *handlers)
+        self.listener.start()
+        self.logger.addHandler(self.handler)
+        self.logger.propagate = False
+        self.set_level(self.level)
+        if file_error is not None:
+            self.logger.warning(
+                "Cannot open the log file, not logging to it: %s", file_error
+            )
+        return self
+
+    def set_level(self, level):
+        """Switches the level of every module, takes effect on the next logging call"""
+        self.level = level_name(level)
+        self.logger.setLevel(self.level)
+
+    def stop(self):
+        """Writes the queued records, then closes the log file"""
+        if self.listener is None:
+            return
+        self.logger.removeHandler(self.handler)
+        self.logger.propagate = True
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+        self.listener = None
+        self.handler = None
@@ -0,0 +1,100 @@
+""" Test file for monitor_log.py """
+import logging
+import os
+import tempfile
+import unittest
+from threading import current_thread
+from unittest.mock import patch
+
+from monitor_log import (
+    LOGGER_NAME,
+    KeyValueFormatter,
+    MonitorLog,
+    fields,
+    get_logger,
+    level_name,
+)
+
+
+class MonitorLogTest(unittest.TestCase):
+    """Test class for monitor_log.py"""
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.directory.name, "monitor.log")
+        self.log = get_logger("monitor_log_test")
+
+    def tearDown(self) -> None:
+        logging.getLogger(LOGGER_NAME).setLevel(logging.NOTSET)
+        self.directory.cleanup()
+
+    def read_lines(self):
+        with open(self.log_path, encoding="utf-8") as log_file:
+            return log_file.read().splitlines()
+
+    def test_01_key_value_fields(self):
+        """Test the fields of a record are written after the message, one token each"""
+        record = logging.LogRecord(
+            "test", logging.INFO, __file__, 1, "Check %s", ("finished",), None
+        )
+        record.fields = {
+            "outcome": "no_activation",
+            "idle": 70.123456,
+            "sessions": None,
+            "pending": False,
+            "server": 'Living "room"',
+        }
+        self.assertEqual(
+            KeyValueFormatter("%(message)s").format(record),
+            "Check finished outcome=no_activation idle=70.12 sessions=- pending=false "
+            'server="Living \\"room\\""',
+        )
+
+    def test_02_records_written_by_listener(self):
+        """Test records are formatted on the listener thread and written once stopped"""
+        monitor_log = MonitorLog(self.log_path, console=False).start()
+        threads = []
+        original = KeyValueFormatter.format
+
+        def format_record(formatter, record):
+            threads.append(current_thread())
+            return original(formatter, record)
+
+        with patch.object(KeyValueFormatter, "format", format_record):
+            self.log.debug("Probe stats")
+            self.log.info("Check finished", extra=fields(outcome="unknown"))
+            monitor_log.set_level("debug")
+            self.log.debug("Next check in %.0f seconds", 60)
+            monitor_log.stop()
+        lines = self.read_lines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].endswith("Check finished outcome=unknown"))
+        self.assertIn("DEBUG monitor_log_test: Next check in 60 seconds", lines[1])
+        self.assertNotIn(current_thread(), threads)
+        self.assertTrue(logging.getLogger(LOGGER_NAME).propagate)
+
+    def test_03_rotates_by_size(self):
+        """Test the log file is rotated once full and only the given backups are kept"""
+        monitor_log = MonitorLog(
+            self.log_path, max_bytes=512, backups=2, console=False
+        ).start()
+        for index in range(100):
+            self.log.info("Check finished", extra=fields(index=index))
+        monitor_log.stop()
+        self.assertEqual(
+            sorted(os.listdir(self.directory.name)),
+            ["monitor.log", "monitor.log.1", "monitor.log.2"],
+        )
+        self.assertTrue(self.read_lines()[-1].endswith("index=99"))
+
+    def test_04_level_names(self):
+        """Test log levels are read case insensitively and unknown levels are refused"""
+        self.assertEqual(level_name(" debug "), "DEBUG")
+        with self.assertRaises(ValueError):
+            level_name("verbose")
+        with self.assertRaises(ValueError):
+            MonitorLog(self.log_path, console=False).set_level("verbose")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,12 @@
+""" This file contains the desktop notifications, the notification backend is only loaded at the first one """
+
+
+def toast(title, message):
+    """Shows a Windows notification, prints it where the backend is not available"""
+    try:
+        # pylint: disable=import-outside-toplevel
+        from win11toast import toast as windows_toast
+    except ImportError:
+        print(f"{title}: {message}")
+        return
+    windows_toast(title, message)
@@ -0,0 +1,123 @@
+""" This file contains the notification-driven tracker of live Plex sessions """
+from __future__ import annotations
+
+from threading import Lock
+from time import monotonic
+from typing import TYPE_CHECKING
+
+from monitor_log import get_logger
+
+if TYPE_CHECKING:
+    from plexapi.alert import AlertListener
+    from plexapi.server import PlexServer
+
+log = get_logger(__name__)
+
+PLAYING_ALERT = "playing"
+TRANSCODE_START_ALERT = "transcodeSession.start"
+TRANSCODE_UPDATE_ALERT = "transcodeSession.update"
+TRANSCODE_END_ALERT = "transcodeSession.end"
+STOPPED_STATE = "stopped"
+ALERT_RECONNECT_DELAY = 60
+
+
+class AlertSessionTracker:
+    """Keeps an in-memory set of live Plex sessions, updated from the server websocket alerts.
+    While the alert socket is down the tracker reports itself as disconnected so the caller
+    can fall back to polling sessions()"""
+
+    plex: PlexServer = None
+    listener: AlertListener = None
+
+    def __init__(self, reconnect_delay=ALERT_RECONNECT_DELAY):
+        self.lock = Lock()
+        self.sessions = set()
+        self.transcode_sessions = set()
+        self.reconnect_delay = reconnect_delay
+        self.last_start_attempt = None
+        self.socket_error = None
+
+    def start(self, plex: PlexServer):
+        """Starts listening to the alerts of the given server and seeds the live sessions from it"""
+        self.stop()
+        self.plex = plex
+        self.last_start_attempt = monotonic()
+        self.socket_error = None
+        # The listener is started before seeding so no alert is lost in between
+        self.listener = plex.startAlertListener(
+            callback=self.on_alert, callbackError=self.on_error
+        )
+        try:
+            sessions = {str(session.sessionKey) for session in plex.sessions()}
+            transcode_sessions = {
+                str(transcode.key) for transcode in plex.transcodeSessions()
+            }
+        except Exception:
+            self.stop()
+            self.plex = plex
+            raise
+        with self.lock:
+            self.sessions |= sessions
+            self.transcode_sessions |= transcode_sessions
+
+    def stop(self):
+        """Stops the alert listener and forgets every tracked session"""
+        if self.listener is not None:
+            try:
+                self.listener.stop()
+            except Exception as e:
+                log.error("Error stopping the Plex alert listener: %s", e)
+        self.listener = None
+        self.plex = None
+        with self.lock:
+            self.sessions = set()
+            self.transcode_sessions = set()
+
+    def should_start(self, plex: PlexServer):
+        """Returns true if the listener has to be (re)started for the given server"""
+        if plex is not self.plex:
+            return True
+        if self.is_connected():
+            return False
+        return (
+            self.last_start_attempt is None
+            or monotonic() - self.last_start_attempt >= self.reconnect_delay
+        )
+
+    def is_connected(self):
+        """Returns true if the alert socket is up and the tracked sessions can be trusted"""
+        return (
+            self.listener is not None
+            and self.socket_error is None
+            and self.listener.is_alive()
+        )
+
+    def has_active_sessions(self):
+        """Returns true if there is any live session or transcode session"""
+        with self.lock:
+            return bool(self.sessions or self.transcode_sessions)
+
+    def on_alert(self, data):
+        """Updates the live sessions from a NotificationContainer received from the server"""
+        alert_type = data.get("type")
+        if alert_type == PLAYING_ALERT:
+            with self.lock:
+                for notification in data.get("PlaySessionStateNotification", []):
+                    session_key = str(notification.get("sessionKey"))
+                    if notification.get("state") == STOPPED_STATE:
+                        self.sessions.discard(session_key)
+                    else:
+                        self.sessions.add(session_key)
+        elif alert_type in (TRANSCODE_START_ALERT, TRANSCODE_UPDATE_ALERT):
+            with self.lock:
+                for transcode in data.get("TranscodeSession", []):
+                    self.transcode_sessions.add(str(transcode.get("key")))
+        elif alert_type == TRANSCODE_END_ALERT:
+            with self.lock:
+                for transcode in data.get("TranscodeSession", []):
+                    self.transcode_sessions.discard(str(transcode.get("key")))
+
+    def on_error(self, error):
+        """Marks the alert socket as dropped"""
+        log.error("Plex alert listener error: %s", error)
+        self.socket_error = error
@@ -0,0 +1,119 @@
+""" Test file for plex_alerts.py """
+import unittest
+from time import monotonic, sleep
+from unittest.mock import MagicMock
+
+from plexapi.server import PlexServer
+
+from fake_plex_server import FakePlexServer
+from plex_alerts import AlertSessionTracker
+
+WAIT_TIMEOUT = 5
+
+
+def wait_until(condition):
+    """Waits until the condition is true or the timeout expires"""
+    deadline = monotonic() + WAIT_TIMEOUT
+    while not condition():
+        if monotonic() > deadline:
+            return False
+        sleep(0.01)
+    return True
+
+
+class AlertSessionTrackerTest(unittest.TestCase):
+    """Test class for plex_alerts.py"""
+
+    def test_01_playing_alerts(self):
+        """Test that playing alerts add and remove sessions"""
+        tracker = AlertSessionTracker()
+        tracker.on_alert(
+            {
+                "type": "playing",
+                "PlaySessionStateNotification": [{"sessionKey": "1", "state": "playing"}],
+            }
+        )
+        self.assertTrue(tracker.has_active_sessions())
+        tracker.on_alert(
+            {
+                "type": "playing",
+                "PlaySessionStateNotification": [{"sessionKey": "1", "state": "paused"}],
+            }
+        )
+        self.assertTrue(tracker.has_active_sessions())
+        tracker.on_alert(
+            {
+                "type": "playing",
+                "PlaySessionStateNotification": [{"sessionKey": "1", "state": "stopped"}],
+            }
+        )
+        self.assertFalse(tracker.has_active_sessions())
+
+    def test_02_transcode_alerts(self):
+        """Test that transcode session alerts add and remove sessions"""
+        tracker = AlertSessionTracker()
+        tracker.on_alert(
+            {"type": "transcodeSession.start", "TranscodeSession": [{"key": "/t/1"}]}
+        )
+        self.assertTrue(tracker.has_active_sessions())
+        tracker.on_alert(
+            {"type": "transcodeSession.end", "TranscodeSession": [{"key": "/t/1"}]}
+        )
+        self.assertFalse(tracker.has_active_sessions())
+
+    def test_03_start_seeds_sessions(self):
+        """Test that starting the tracker seeds the sessions from the server"""
+        tracker = AlertSessionTracker()
+        plex_mock = MagicMock()
+        plex_mock.sessions.return_value = [MagicMock(sessionKey=7)]
+        plex_mock.transcodeSessions.return_value = []
+        tracker.start(plex_mock)
+        self.assertTrue(tracker.has_active_sessions())
+        plex_mock.startAlertListener.assert_called_once()
+        self.assertFalse(tracker.should_start(plex_mock))
+        self.assertTrue(tracker.should_start(MagicMock()))
+
+    def test_04_error_disconnects(self):
+        """Test that a listener error marks the tracker as disconnected"""
+        tracker = AlertSessionTracker(reconnect_delay=0)
+        plex_mock = MagicMock()
+        plex_mock.sessions.return_value = []
+        plex_mock.transcodeSessions.return_value = []
+        tracker.start(plex_mock)
+        self.assertTrue(tracker.is_connected())
+        tracker.on_error(ConnectionError("socket closed"))
+        self.assertFalse(tracker.is_connected())
+        self.assertTrue(tracker.should_start(plex_mock))
+
+    def test_05_fake_server(self):
+        """Test the tracker against the fake Plex alert server"""
+        server = FakePlexServer().start()
+        tracker = AlertSessionTracker()
+        try:
+            server.set_sessions(["1"])
+            tracker.start(PlexServer(server.url, "fake-token"))
+            self.assertTrue(wait_until(lambda: server.alert_client_count() == 1))
+            self.assertTrue(tracker.has_active_sessions())
+
+            server.send_playing("1", "stopped")
+            self.assertTrue(wait_until(lambda: not tracker.has_active_sessions()))
+
+            server.send_playing("2")
+            self.assertTrue(wait_until(tracker.has_active_sessions))
+
+            server.send_transcode("transcodeSession.start", "/transcode/sessions/a")
+            server.send_playing("2", "stopped")
+            sleep(0.1)
+            self.assertTrue(tracker.has_active_sessions())
+            server.send_transcode("transcodeSession.end", "/transcode/sessions/a")
+            self.assertTrue(wait_until(lambda: not tracker.has_active_sessions()))
+
+            server.drop_alert_clients()
+            self.assertTrue(wait_until(lambda: not tracker.is_connected()))
+        finally:
+            tracker.stop()
+            server.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,218 @@
+""" This file contains the shared keep-alive connection pool used for every Plex API call """
+from __future__ import annotations
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from time import perf_counter
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+if TYPE_CHECKING:
+    from plexapi.server import PlexServer
+
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10
+DEFAULT_MAX_RETRIES = 1
+DEFAULT_RETRY_BACKOFF = 0.5
+DEFAULT_POOL_SIZE = 4
+# A newer connect request does not wait behind a stale one stuck in its connect timeout
+CONNECTION_WORKERS = 2
+
+
+def validate_plex_url(plex_url):
+    """Raises ValueError if the url cannot point to a Plex server"""
+    parsed = urlparse(plex_url)
+    if parsed.scheme not in ("http", "https") or not parsed.netloc:
+        raise ValueError(f"Invalid Plex URL {plex_url!r}, expected http(s)://host:port")
+
+
+class ConnectionPoolStats:
+    """Request counters and latency of a PlexConnectionPool"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.requests = 0
+        self.failures = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.last_latency = 0.0
+
+    def record(self, latency, failed):
+        """Records a finished request"""
+        with self.lock:
+            self.requests += 1
+            if failed:
+                self.failures += 1
+            self.total_latency += latency
+            self.last_latency = latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def mean_latency(self):
+        """Returns the mean request latency in seconds"""
+        with self.lock:
+            return self.total_latency / self.requests if self.requests else 0.0
+
+
+class InstrumentedAdapter(HTTPAdapter):
+    """HTTP adapter that records the latency of every request it sends"""
+
+    def __init__(self, stats: ConnectionPoolStats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def send(self, request, *args, **kwargs):  # pylint: disable=arguments-differ
+        start = perf_counter()
+        failed = True
+        try:
+            response = super().send(request, *args, **kwargs)
+            failed = response.status_code >= 400
+            return response
+        finally:
+            self.stats.record(perf_counter() - start, failed)
+
+    def connections_opened(self):
+        """Returns the number of TCP connections opened by the live pools"""
+        pools = self.poolmanager.pools
+        return sum(pools[key].num_connections for key in list(pools.keys()))
+
+
+class PlexConnectionPool:
+    """Owns the keep-alive HTTP session shared by every PlexServer handle, with explicit
+    connect/read timeouts and bounded retries so a hung server cannot block the caller forever
+    """
+
+    def __init__(
+        self,
+        connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+        read_timeout=DEFAULT_READ_TIMEOUT,
+        max_retries=DEFAULT_MAX_RETRIES,
+        pool_size=DEFAULT_POOL_SIZE,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.stats = ConnectionPoolStats()
+        self.adapter = InstrumentedAdapter(
+            self.stats,
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=max_retries,
+                backoff_factor=DEFAULT_RETRY_BACKOFF,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=frozenset({"GET"}),
+                raise_on_status=False,
+            ),
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+    def connect(self, plex_url, plex_token) -> PlexServer:
+        """Returns a PlexServer handle that sends its requests through the pool,
+        plexapi is only loaded by the first connection"""
+        # pylint: disable=import-outside-toplevel,redefined-outer-name
+        from plexapi.server import PlexServer
+
+        return PlexServer(
+            plex_url, plex_token, session=self.session, timeout=self.timeout
+        )
+
+    def new_connections(self):
+        """Returns the number of connections that had to be opened"""
+        return self.adapter.connections_opened()
+
+    def reused_connections(self):
+        """Returns the number of requests served by an already open connection"""
+        return max(0, self.stats.requests - self.new_connections())
+
+    def snapshot(self):
+        """Returns the pool counters as a dict"""
+        return {
+            "requests": self.stats.requests,
+            "failures": self.stats.failures,
+            "new_connections": self.new_connections(),
+            "reused_connections": self.reused_connections(),
+            "mean_latency": self.stats.mean_latency(),
+            "max_latency": self.stats.max_latency,
+            "last_latency": self.stats.last_latency,
+        }
+
+    def close(self):
+        """Closes every pooled connection"""
+        self.session.close()
+
+
+class ConnectionResult:
+    """Plex handles built by a ConnectionWorker. error is set when the primary server cannot be
+    reached, extra servers that cannot be reached are kept without handle"""
+
+    def __init__(self, plex=None, extra_plex=(), error=None):
+        self.plex = plex
+        self.extra_plex = list(extra_plex)
+        self.error = error
+
+    def failed_extra_servers(self):
+        """Returns the names of the extra servers without handle"""
+        return [name for name, plex in self.extra_plex if plex is None]
+
+
+class ConnectionWorker:
+    """Connects to the Plex servers on background threads and hands the result to post, which
+    runs it on the caller's thread. Only the result of the latest request is delivered, so a
+    slow stale connect can never replace the handles of a newer one"""
+
+    def __init__(self, pool: PlexConnectionPool, post):
+        self.pool = pool
+        self.post = post
+        self.lock = Lock()
+        self.generation = 0
+        self.executor = ThreadPoolExecutor(
+            max_workers=CONNECTION_WORKERS, thread_name_prefix="plex-connect"
+        )
+
+    def connect(self, plex_url, plex_token, extra_servers, on_done) -> Future:
+        """Starts connecting, on_done is posted with the ConnectionResult once every handle is built"""
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+        return self.executor.submit(
+            self.run, generation, plex_url, plex_token, list(extra_servers), on_done
+        )
+
+    def is_current(self, generation):
+        """Returns true if no newer request was made"""
+        with self.lock:
+            return generation == self.generation
+
+    def run(self, generation, plex_url, plex_token, extra_servers, on_done):
+        """Builds the handles and posts the result unless a newer request was made"""
+        result = self.connect_all(plex_url, plex_token, extra_servers)
+
+        def deliver():
+            if self.is_current(generation):
+                on_done(result)
+
+        if self.is_current(generation):
+            self.post(deliver)
+        return result
+
+    def connect_all(self, plex_url, plex_token, extra_servers):
+        """Returns the ConnectionResult of the given servers"""
+        try:
+            plex = self.pool.connect(plex_url, plex_token)
+        except Exception as e:
+            return ConnectionResult(error=e)
+        extra_plex = []
+        for name, url, token in extra_servers:
+            try:
+                extra_plex.append((name, self.pool.connect(url, token)))
+            except Exception:
+                extra_plex.append((name, None))
+        return ConnectionResult(plex, extra_plex)
+
+    def shutdown(self):
+        """Stops the workers without waiting for the running connects"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
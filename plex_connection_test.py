@@ -0,0 +1,130 @@
+""" Test file for plex_connection.py """
+import subprocess
+import sys
+import unittest
+from threading import Event
+from unittest.mock import MagicMock
+
+from fake_plex_server import FakePlexServer
+from plex_connection import ConnectionWorker, PlexConnectionPool, validate_plex_url
+
+
+class PlexConnectionPoolTest(unittest.TestCase):
+    """Test class for plex_connection.py"""
+
+    def setUp(self) -> None:
+        self.server = FakePlexServer().start()
+        self.pool = PlexConnectionPool(connect_timeout=1, read_timeout=2)
+
+    def tearDown(self) -> None:
+        self.pool.close()
+        self.server.stop()
+
+    def test_01_connect_uses_pool(self):
+        """Test that the PlexServer handle uses the pool session and timeouts"""
+        plex = self.pool.connect(self.server.url, "fake-token")
+        self.assertIs(plex._session, self.pool.session)
+        self.assertEqual(plex._timeout, (1, 2))
+
+    def test_02_connections_are_reused(self):
+        """Test that later requests reuse the keep-alive connection"""
+        self.server.set_sessions(["1", "2"])
+        plex = self.pool.connect(self.server.url, "fake-token")
+        for _ in range(5):
+            self.assertEqual(len(plex.sessions()), 2)
+        self.assertEqual(self.pool.stats.requests, 6)
+        self.assertEqual(self.pool.new_connections(), 1)
+        self.assertEqual(self.pool.reused_connections(), 5)
+        self.assertGreater(self.pool.stats.mean_latency(), 0)
+
+    def test_03_failures_are_counted(self):
+        """Test that error responses are counted as failures"""
+        plex = self.pool.connect(self.server.url, "fake-token")
+        with self.assertRaises(Exception):
+            plex.query("/missing")
+        self.assertEqual(self.pool.stats.failures, 1)
+
+    def test_04_plexapi_loaded_on_connect(self):
+        """Test that plexapi is only imported by the first connection"""
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, plex_connection; print('plexapi' in sys.modules)",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(result.stdout.strip(), "False")
+
+
+
+class ConnectionWorkerTest(unittest.TestCase):
+    """Test class for the ConnectionWorker of plex_connection.py"""
+
+    def setUp(self) -> None:
+        self.server = FakePlexServer().start()
+        self.pool = PlexConnectionPool(connect_timeout=1, read_timeout=2)
+        self.posted = []
+        self.worker = ConnectionWorker(self.pool, self.posted.append)
+        self.results = []
+
+    def tearDown(self) -> None:
+        self.worker.shutdown()
+        self.pool.close()
+        self.server.stop()
+
+    def deliver(self):
+        """Runs the posted callbacks like the UI thread would"""
+        for callback in self.posted:
+            callback()
+
+    def test_01_connect_in_background(self):
+        """Test that the handles are built off the calling thread and posted back"""
+        self.worker.connect(
+            self.server.url,
+            "fake-token",
+            [("Extra", "http://127.0.0.1:1", "fake-token")],
+            self.results.append,
+        ).result(timeout=10)
+        self.assertEqual(self.results, [])
+        self.deliver()
+        result = self.results[0]
+        self.assertIsNone(result.error)
+        self.assertIs(result.plex._session, self.pool.session)
+        self.assertEqual(result.failed_extra_servers(), ["Extra"])
+
+    def test_02_primary_unreachable(self):
+        """Test that a primary server that cannot be reached is reported as an error"""
+        self.worker.connect(
+            "http://127.0.0.1:1", "fake-token", [], self.results.append
+        ).result(timeout=10)
+        self.deliver()
+        self.assertIsNotNone(self.results[0].error)
+        self.assertIsNone(self.results[0].plex)
+
+    def test_03_stale_result_is_dropped(self):
+        """Test that only the result of the latest request is delivered"""
+        release = Event()
+        pool = MagicMock()
+        pool.connect.side_effect = lambda url, token: release.wait(5) and url
+        worker = ConnectionWorker(pool, self.posted.append)
+        stale = worker.connect("http://old:32400", "token", [], self.results.append)
+        latest = worker.connect("http://new:32400", "token", [], self.results.append)
+        release.set()
+        stale.result(timeout=10)
+        latest.result(timeout=10)
+        self.deliver()
+        worker.shutdown()
+        self.assertEqual([result.plex for result in self.results], ["http://new:32400"])
+
+    def test_04_validate_url(self):
+        """Test that urls without scheme or host are rejected"""
+        validate_plex_url("http://127.0.0.1:32400")
+        for url in ("127.0.0.1:32400", "http://", "ftp://plex:32400"):
+            with self.assertRaises(ValueError):
+                validate_plex_url(url)
+
+if __name__ == "__main__":
+    unittest.main()
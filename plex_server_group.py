@@ -0,0 +1,149 @@
+""" This file contains the concurrent session check over every monitored Plex server """
+from __future__ import annotations
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from time import monotonic, perf_counter
+
+# How long in seconds the answer of a single server is waited for
+SERVER_QUERY_DEADLINE = 4
+DEFAULT_GROUP_WORKERS = 4
+
+
+class ServersUnavailableError(Exception):
+    """Raised when no server has active sessions but some of them could not answer"""
+
+
+class ServerStatus:
+    """Latency and failure state of a monitored Plex server"""
+
+    future: Future = None
+
+    def __init__(self, name):
+        self.name = name
+        self.active = None
+        self.latency = None
+        self.error = None
+        self.failures = 0
+        self.last_success = None
+
+    def record_success(self, active, latency, now):
+        """Records a successful sessions query"""
+        self.active = active
+        self.latency = latency
+        self.error = None
+        self.failures = 0
+        self.last_success = now
+
+    def record_failure(self, error, latency=None):
+        """Records a failed or late sessions query"""
+        self.active = None
+        self.latency = latency
+        self.error = error
+        self.failures += 1
+
+    def is_healthy(self):
+        """Returns true if the last query succeeded"""
+        return self.error is None and self.last_success is not None
+
+    def describe(self):
+        """Returns the status as a short text"""
+        if self.error is not None:
+            return f"{self.name}: failed {self.failures} times ({self.error})"
+        if self.latency is None:
+            return f"{self.name}: not checked"
+        sessions = "active sessions" if self.active else "no sessions"
+        return f"{self.name}: {sessions} in {self.latency * 1000:.1f} ms"
+
+
+class PlexServerGroup:
+    """Asks every monitored Plex server for active sessions at the same time. The answer is
+    known as soon as one server has sessions, a slow server only delays the answer when every
+    other server is quiet and never for longer than its deadline"""
+
+    def __init__(
+        self,
+        deadline=SERVER_QUERY_DEADLINE,
+        max_workers=DEFAULT_GROUP_WORKERS,
+        clock=monotonic,
+    ):
+        self.deadline = deadline
+        self.max_workers = max_workers
+        self.clock = clock
+        self.pool = None
+        self.statuses = {}
+
+    def query(self, status: ServerStatus, check):
+        """Runs the sessions check of a server and records its status"""
+        start = perf_counter()
+        try:
+            active = check()
+        except Exception as e:
+            status.record_failure(e, perf_counter() - start)
+            raise
+        status.record_success(active, perf_counter() - start, self.clock())
+        return active
+
+    def submit(self, status: ServerStatus, check):
+        """Starts the check of a server unless its previous check is still running"""
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="plex-server"
+            )
+        if status.future is None or status.future.done():
+            status.future = self.pool.submit(self.query, status, check)
+        return status.future
+
+    def any_active(self, checks):
+        """Returns true if any server has active sessions and false if every server is quiet.
+        checks maps every server name to a callable returning if it has active sessions.
+        Raises ServersUnavailableError if no server has sessions but some could not answer"""
+        self.statuses = {
+            name: self.statuses.get(name) or ServerStatus(name) for name in checks
+        }
+        if len(checks) == 1:
+            name, check = next(iter(checks.items()))
+            try:
+                return self.query(self.statuses[name], check)
+            except Exception as e:
+                raise ServersUnavailableError(f"{name}: {e}") from e
+
+        futures = {
+            self.submit(self.statuses[name], check): name
+            for name, check in checks.items()
+        }
+        pending = set(futures)
+        start = perf_counter()
+        while pending:
+            remaining = self.deadline - (perf_counter() - start)
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and future.result():
+                    return True
+
+        unavailable = [
+            futures[future]
+            for future in futures
+            if future not in pending and future.exception() is not None
+        ]
+        for future in pending:
+            name = futures[future]
+            self.statuses[name].record_failure(
+                f"no answer after {self.deadline} seconds"
+            )
+            unavailable.append(name)
+        if unavailable:
+            raise ServersUnavailableError(
+                f"cannot check sessions of {', '.join(unavailable)}"
+            )
+        return False
+
+    def format_status(self):
+        """Returns the status of every server as a single line"""
+        return ", ".join(status.describe() for status in self.statuses.values())
+
+    def shutdown(self):
+        """Stops the workers without waiting for the running checks"""
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,80 @@
+""" Test file for plex_server_group.py """
+import unittest
+from time import perf_counter, sleep
+
+from fake_plex_server import FakePlexServer
+from plex_connection import PlexConnectionPool
+from plex_server_group import PlexServerGroup, ServersUnavailableError
+
+
+def slow_check(seconds, active):
+    """Returns a sessions check that takes the given seconds to answer"""
+
+    def check():
+        sleep(seconds)
+        return active
+
+    return check
+
+
+class PlexServerGroupTest(unittest.TestCase):
+    """Test class for plex_server_group.py"""
+
+    def setUp(self) -> None:
+        self.group = PlexServerGroup(deadline=0.2)
+
+    def tearDown(self) -> None:
+        self.group.shutdown()
+
+    def test_01_slow_server_does_not_delay_active_sessions(self):
+        """Test that an active server answers without waiting for a slow one"""
+        start = perf_counter()
+        self.assertTrue(
+            self.group.any_active(
+                {"fast": slow_check(0.01, True), "slow": slow_check(1, False)}
+            )
+        )
+        self.assertLess(perf_counter() - start, 0.15)
+
+    def test_02_slow_server_misses_deadline(self):
+        """Test that a quiet answer needs every server before the deadline"""
+        with self.assertRaises(ServersUnavailableError):
+            self.group.any_active(
+                {"fast": slow_check(0.01, False), "slow": slow_check(1, False)}
+            )
+        self.assertTrue(self.group.statuses["fast"].is_healthy())
+        self.assertEqual(self.group.statuses["slow"].failures, 1)
+
+    def test_03_failed_server(self):
+        """Test that a failing server is reported"""
+
+        def failing_check():
+            raise ConnectionError("refused")
+
+        with self.assertRaises(ServersUnavailableError):
+            self.group.any_active({"ok": slow_check(0, False), "down": failing_check})
+        self.assertIn("refused", self.group.format_status())
+
+    def test_04_fake_servers_share_the_pool(self):
+        """Test several fake Plex servers queried over one connection pool"""
+        servers = [FakePlexServer().start() for _ in range(3)]
+        pool = PlexConnectionPool()
+        try:
+            servers[2].set_sessions(["1"])
+            plex = [pool.connect(server.url, "fake-token") for server in servers]
+            checks = {
+                f"server{i}": (lambda p=p: len(p.sessions()) > 0)
+                for i, p in enumerate(plex)
+            }
+            self.assertTrue(self.group.any_active(checks))
+            servers[2].set_sessions([])
+            self.assertFalse(self.group.any_active(checks))
+            self.assertEqual(pool.new_connections(), 3)
+        finally:
+            pool.close()
+            for server in servers:
+                server.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+""" This file contains the lightweight session count and session tracking of a Plex server, read with a streaming XML parser """
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, NamedTuple
+from xml.etree.ElementTree import XMLPullParser
+
+if TYPE_CHECKING:
+    from plexapi.server import PlexServer
+
+SESSIONS_PATH = "/status/sessions"
+STREAM_CHUNK_SIZE = 1024
+UNKNOWN_PLAYER_STATE = "unknown"
+
+
+class SessionState(NamedTuple):
+    """What a tick needs of a session: its key, the playback position in milliseconds and the
+    state of its player (playing, paused or buffering)"""
+
+    key: str
+    view_offset: int
+    player_state: str
+
+
+class TrackedSession(NamedTuple):
+    """A session as last seen by the tracker, progressed_at is the clock time its position or
+    player state last changed"""
+
+    view_offset: int
+    player_state: str
+    progressed_at: float
+
+
+class SessionDelta(NamedTuple):
+    """Keys of the sessions added, removed and changed since the previous tick"""
+
+    added: list
+    removed: list
+    changed: list
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+
+def read_container_size(chunks):
+    """Returns the size attribute of the root MediaContainer of the XML chunks, parsing stops at
+    its start tag. When the attribute is missing the direct children are counted instead"""
+    parser = XMLPullParser(events=("start", "end"))
+    depth = 0
+    children = 0
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if event == "end":
+                depth -= 1
+                # Nothing below the root is kept, only counted
+                if depth == 1:
+                    element.clear()
+                continue
+            depth += 1
+            if depth == 1:
+                size = element.get("size")
+                if size is not None:
+                    return int(size)
+            elif depth == 2:
+                children += 1
+    parser.close()
+    return children
+
+
+def parse_sessions(chunks):
+    """Yields a SessionState per session of the XML chunks, each session element is dropped
+    once it is read"""
+    parser = XMLPullParser(events=("start", "end"))
+    depth = 0
+    key = view_offset = None
+    player_state = UNKNOWN_PLAYER_STATE
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if event == "start":
+                depth += 1
+                if depth == 2:
+                    key = element.get("sessionKey")
+                    view_offset = int(element.get("viewOffset") or 0)
+                    player_state = UNKNOWN_PLAYER_STATE
+                elif depth == 3 and element.tag == "Player":
+                    player_state = element.get("state", UNKNOWN_PLAYER_STATE)
+                continue
+            depth -= 1
+            if depth == 1:
+                element.clear()
+                if key is not None:
+                    yield SessionState(key, view_offset, player_state)
+    parser.close()
+
+
+def stream_sessions(plex: PlexServer, reader):
+    """Returns what reader reads from the chunks of the sessions of the server. The request goes
+    through the handle's pooled session, token and timeouts"""
+    # pylint: disable=protected-access
+    response = plex._session.get(
+        plex.url(SESSIONS_PATH),
+        headers=plex._headers(),
+        timeout=plex._timeout,
+        stream=True,
+    )
+    try:
+        response.raise_for_status()
+        chunks = response.iter_content(STREAM_CHUNK_SIZE)
+        result = reader(chunks)
+        # Reading the rest without parsing it hands the keep-alive connection back to the pool
+        for _ in chunks:
+            pass
+        return result
+    finally:
+        response.close()
+
+
+def count_sessions(plex: PlexServer):
+    """Returns the number of active sessions of the server without building a plexapi object
+    per session"""
+    return stream_sessions(plex, read_container_size)
+
+
+def read_sessions(plex: PlexServer):
+    """Returns a SessionState per active session of the server without building a plexapi
+    object per session"""
+    return stream_sessions(plex, lambda chunks: list(parse_sessions(chunks)))
+
+
+class SessionTracker:
+    """Keeps the sessions of a server seen by the previous tick, keyed by session key, and only
+    what is needed to tell if they progress. A session whose position and player state have not
+    changed for stale_after seconds, a client paused overnight or a zombie session, is stale
+    and no longer counts as active"""
+
+    def __init__(self):
+        self.sessions: dict[str, TrackedSession] = {}
+
+    def update(self, states, now):
+        """Replaces the sessions with the ones of this tick, returns the SessionDelta"""
+        previous = self.sessions
+        sessions = {}
+        added = []
+        changed = []
+        for state in states:
+            tracked = previous.get(state.key)
+            if tracked is None:
+                added.append(state.key)
+            elif (tracked.view_offset, tracked.player_state) != (
+                state.view_offset,
+                state.player_state,
+            ):
+                changed.append(state.key)
+            else:
+                sessions[state.key] = tracked
+                continue
+            sessions[state.key] = TrackedSession(
+                state.view_offset, state.player_state, now
+            )
+        removed = [key for key in previous if key not in sessions]
+        self.sessions = sessions
+        return SessionDelta(added, removed, changed)
+
+    def stale_keys(self, now, stale_after):
+        """Returns the keys of the sessions that have not progressed for stale_after seconds,
+        none when stale_after is 0"""
+        if stale_after <= 0:
+            return []
+        return [
+            key
+            for key, tracked in self.sessions.items()
+            if now - tracked.progressed_at >= stale_after
+        ]
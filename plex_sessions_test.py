@@ -0,0 +1,109 @@
+""" Test file for plex_sessions.py """
+import unittest
+
+from fake_plex_server import FakePlexServer, sessions_xml
+from plex_connection import PlexConnectionPool
+from plex_sessions import (
+    SessionState,
+    SessionTracker,
+    count_sessions,
+    parse_sessions,
+    read_container_size,
+    read_sessions,
+)
+
+
+def chunked(text, size=7):
+    """Returns the text as byte chunks of the given size"""
+    data = text.encode("utf-8")
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+class PlexSessionsTest(unittest.TestCase):
+    """Test class for plex_sessions.py"""
+
+    def test_01_size_attribute(self):
+        """Test that the size is read from the root element split across chunks"""
+        self.assertEqual(read_container_size(chunked(sessions_xml(range(12)))), 12)
+
+    def test_02_stops_after_root(self):
+        """Test that no chunk after the root start tag is read"""
+
+        def chunks():
+            yield b'<MediaContainer size="3">'
+            raise AssertionError("read past the root element")
+
+        self.assertEqual(read_container_size(chunks()), 3)
+
+    def test_03_counts_children_without_size(self):
+        """Test that the sessions are counted when the size attribute is missing"""
+        payload = "<MediaContainer><Video><User /></Video><Track /></MediaContainer>"
+        self.assertEqual(read_container_size(chunked(payload)), 2)
+
+    def test_04_count_sessions(self):
+        """Test the session count of a server through the pooled keep-alive connection"""
+        server = FakePlexServer().start()
+        pool = PlexConnectionPool()
+        try:
+            plex = pool.connect(server.url, "fake-token")
+            self.assertEqual(count_sessions(plex), 0)
+            server.set_sessions(["1", "2", "3"])
+            for _ in range(3):
+                self.assertEqual(count_sessions(plex), 3)
+            self.assertEqual(pool.new_connections(), 1)
+        finally:
+            pool.close()
+            server.stop()
+
+    def test_05_parse_sessions(self):
+        """Test that the key, position and player state of every session are read"""
+        payload = (
+            '<MediaContainer size="2">'
+            '<Video sessionKey="7" viewOffset="1500"><Media><Part /></Media>'
+            '<Player state="paused" /></Video>'
+            '<Track sessionKey="8"><User /></Track>'
+            "</MediaContainer>"
+        )
+        self.assertEqual(
+            list(parse_sessions(chunked(payload))),
+            [SessionState("7", 1500, "paused"), SessionState("8", 0, "unknown")],
+        )
+
+    def test_06_session_tracker(self):
+        """Test the deltas between ticks and the sessions that stopped progressing"""
+        tracker = SessionTracker()
+        delta = tracker.update(
+            [SessionState("1", 0, "playing"), SessionState("2", 0, "playing")], 0
+        )
+        self.assertEqual(delta, (["1", "2"], [], []))
+        delta = tracker.update(
+            [SessionState("1", 0, "paused"), SessionState("3", 0, "playing")], 60
+        )
+        self.assertEqual(delta, (["3"], ["2"], ["1"]))
+        self.assertFalse(
+            tracker.update(
+                [SessionState("1", 0, "paused"), SessionState("3", 0, "playing")], 90
+            )
+        )
+        self.assertEqual(tracker.stale_keys(120, 60), ["1", "3"])
+        self.assertEqual(tracker.stale_keys(100, 60), [])
+        self.assertEqual(tracker.stale_keys(1000, 0), [])
+
+    def test_07_read_sessions(self):
+        """Test the session states of a server through the pooled keep-alive connection"""
+        server = FakePlexServer().start()
+        pool = PlexConnectionPool()
+        try:
+            plex = pool.connect(server.url, "fake-token")
+            server.set_sessions(["1", "2"])
+            self.assertEqual(
+                read_sessions(plex),
+                [SessionState("1", 0, "playing"), SessionState("2", 0, "playing")],
+            )
+        finally:
+            pool.close()
+            server.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
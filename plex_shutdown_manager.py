@@ -1,20 +1,93 @@
 """ This file contains all the functions related to the Plex monitor and shutdown """
 from __future__ import annotations
 
-import subprocess
-from time import sleep
-from typing import TYPE_CHECKING
+from functools import partial
+from logging import DEBUG
+from threading import Event, Lock
+from time import monotonic, perf_counter
+from typing import TYPE_CHECKING, NamedTuple
 
-from win11toast import toast
-
-from idle import get_idle_duration, WindowsInhibitor
+from config import DEFAULT_STALE_SESSION_TIMEOUT, PRIMARY_SERVER_NAME
+from idle import IdleSource, WindowsInhibitor, default_idle_source
+from metrics import ShutdownMetrics
+from monitor_log import fields, get_logger
+from notifications import toast
+from plex_alerts import AlertSessionTracker
+from plex_server_group import PlexServerGroup
+from plex_sessions import SessionTracker, count_sessions, read_sessions
+from plex_supervisor import UNREACHABLE_GRACE, CircuitOpenError, PlexSupervisor
+from power import PowerController, default_power_backend
+from probe_scheduler import UNKNOWN, Probe, ProbeExecutor, ProbeScheduler
+from process_probe import (
+    PLEX_SERVER_PROCESS,
+    PLEX_TRANSCODER_PROCESS,
+    TRANSCODER_ACTIVE,
+    ProcessProbe,
+    TranscoderLoadProbe,
+)
+from trace_log import TRACE_PROBES, TraceLog
+from usage_model import UsageModel
 
 if TYPE_CHECKING:
     from app import App
 
+log = get_logger(__name__)
+
 ACTIVATED_SHUTDOWN = 1
 CANCELED_SHUTDOWN = -1
 NO_ACTIVATION = 0
+UNKNOWN_OUTCOME = 2
+OUTCOME_NAMES = {
+    ACTIVATED_SHUTDOWN: "activated_shutdown",
+    CANCELED_SHUTDOWN: "canceled_shutdown",
+    NO_ACTIVATION: "no_activation",
+    UNKNOWN_OUTCOME: "unknown",
+}
+
+IDLE_PROBE = "idle"
+TRANSCODER_PROBE = "transcoder"
+SESSIONS_PROBE = "sessions"
+
+# Expected latency in seconds, refined by the scheduler with the measured latency
+IDLE_PROBE_COST = 0.00001
+TRANSCODER_PROBE_COST = 0.001
+SESSIONS_PROBE_COST = 0.05
+
+# How long in seconds a probe result can be reused
+IDLE_PROBE_TTL = 0
+TRANSCODER_PROBE_TTL = 5
+SESSIONS_PROBE_TTL = 5
+
+# How long in seconds a tick waits for each probe before its outcome is unknown
+IDLE_PROBE_DEADLINE = 1
+TRANSCODER_PROBE_DEADLINE = 2
+SESSIONS_PROBE_DEADLINE = 5
+
+# Shortest sleep between checks in seconds
+MIN_CHECK_DELAY = 1
+# Seconds after the idle threshold is crossed to wake up, so the check sees it crossed
+IDLE_THRESHOLD_MARGIN = 1
+# Seconds before the pending shutdown to run a last check
+SHUTDOWN_DEADLINE_MARGIN = 5
+
+
+class MonitorSettings(NamedTuple):
+    """Immutable snapshot of the settings read by the monitor, published as a whole so a check
+    never mixes old and new values"""
+
+    shutdown_enabled: bool
+    max_computer_idle: float
+    interval_delay: float
+    shutdown_delay: float
+
+
+class TickValues(NamedTuple):
+    """What the probes used by a check saw, None for a probe it did not use"""
+
+    idle_duration: float | None
+    transcoder_running: bool | None
+    sessions: int | None
+    latencies: dict
 
 
 class PlexShutdownManager:
@@ -22,53 +95,278 @@ class PlexShutdownManager:
 
     shutdown_enabled: bool
     app: App
+    alert_trackers: dict[str, AlertSessionTracker]
+    session_trackers: dict[str, SessionTracker]
+    supervisors: dict[str, PlexSupervisor]
+    server_group: PlexServerGroup
+    process_probe: ProcessProbe
+    transcoder_load: TranscoderLoadProbe
+    probe_scheduler: ProbeScheduler
+    metrics: ShutdownMetrics
 
-    def __init__(self, app: App):
+    def __init__(
+        self,
+        app: App,
+        use_alerts=False,
+        process_probe: ProcessProbe = None,
+        clock=monotonic,
+        parallel_probes=True,
+        idle_source: IdleSource = None,
+        metrics: ShutdownMetrics = None,
+        power: PowerController = None,
+        session_reader=None,
+        session_counter=None,
+        notify=None,
+        trace_log: TraceLog = None,
+        usage_model: UsageModel = None,
+        transcoder_load: TranscoderLoadProbe = None,
+        stale_session_minutes=DEFAULT_STALE_SESSION_TIMEOUT,
+    ):
         self.shutdown_enabled = False
+        self.shutdown_deadline = None
+        self.wakeup = Event()
+        self.stopped = Event()
+        self.last_idle_duration = None
+        self.last_idle_read = None
         self.app = app
+        self.clock = clock
+        self.idle_source = idle_source or default_idle_source()
+        self.power = power or PowerController(default_power_backend(), clock=clock)
+        # Returns a SessionState per active session of a Plex handle
+        self.session_reader = session_reader or read_sessions
+        # Returns the number of active sessions of a Plex handle
+        self.session_counter = session_counter or count_sessions
+        self.session_trackers = {}
+        self.stale_session_minutes = stale_session_minutes
+        # Settings changed by another thread, applied by the monitor thread on the next check
+        self.settings_lock = Lock()
+        self.pending_settings = None
+        self.supervisors = {}
+        self.notify = notify or toast
+        self.trace_log = trace_log
+        self.usage_model = usage_model
+        # What the current check saw, None until its probe runs, kept for the trace log
+        self.tick_idle_duration = None
+        self.last_transcoder_running = None
+        self.session_counts = {}
+        self.tick_latencies = {}
+        self.use_alerts = use_alerts
+        self.alert_trackers = {}
+        self.server_group = PlexServerGroup(clock=clock)
+        self.process_probe = process_probe or ProcessProbe()
+        self.transcoder_load = transcoder_load or TranscoderLoadProbe(
+            self.process_probe.backend, clock=clock
+        )
+        self.metrics = metrics or ShutdownMetrics(
+            [IDLE_PROBE, TRANSCODER_PROBE, SESSIONS_PROBE],
+            OUTCOME_NAMES.values(),
+            clock=clock,
+        )
+        # The checks are wrapped in lambdas so they can be replaced on the instance
+        self.probe_scheduler = ProbeScheduler(
+            [
+                Probe(
+                    IDLE_PROBE,
+                    lambda: self.check_if_not_idling(),
+                    IDLE_PROBE_COST,
+                    IDLE_PROBE_TTL,
+                    IDLE_PROBE_DEADLINE,
+                ),
+                Probe(
+                    TRANSCODER_PROBE,
+                    lambda: self.check_if_transcoder_running(),
+                    TRANSCODER_PROBE_COST,
+                    TRANSCODER_PROBE_TTL,
+                    TRANSCODER_PROBE_DEADLINE,
+                ),
+                Probe(
+                    SESSIONS_PROBE,
+                    lambda: self.check_if_are_active_sessions(),
+                    SESSIONS_PROBE_COST,
+                    SESSIONS_PROBE_TTL,
+                    SESSIONS_PROBE_DEADLINE,
+                ),
+            ],
+            clock=clock,
+            executor=ProbeExecutor(max_workers=3) if parallel_probes else None,
+            observer=self.observe_probe,
+        )
+
+    def check_if_not_idling(self):
+        """Returns true if the computer received input within the max idle time, a max idle of 0 is never reached"""
+        max_idle_seconds = self.minutes_to_seconds(self.app.get_max_computer_idle())
+        if max_idle_seconds == 0:
+            return False
+        self.last_idle_duration = self.idle_source.idle_seconds()
+        self.last_idle_read = self.clock()
+        self.tick_idle_duration = self.last_idle_duration
+        return self.last_idle_duration < max_idle_seconds
+
+    def plex_servers(self):
+        """Returns a list of (name, plex server instance) of every monitored server"""
+        servers = [(PRIMARY_SERVER_NAME, self.app.get_plex_instance())]
+        servers.extend(self.app.get_extra_plex_instances())
+        return servers
 
     def check_if_are_active_sessions(self):
-        """Returns true if there is any Plex active session"""
+        """Returns true if there is any Plex active session on any monitored server"""
         if not self.app:
             return False
 
-        if self.app.get_plex_instance() is None:
-            self.app.show_error(
-                self.app,
-                "Cannot check if there are active sessions, Plex connection error",
+        # A server check still running past the deadline only writes to this dict
+        counts = {}
+        checks = {
+            name: partial(self.check_supervised_server, name, counts, plex)
+            for name, plex in self.plex_servers()
+        }
+        self.session_trackers = {
+            name: tracker
+            for name, tracker in self.session_trackers.items()
+            if name in checks
+        }
+        self.stop_alert_trackers(
+            [name for name in self.alert_trackers if name not in checks]
+        )
+        self.supervisors = {
+            name: self.supervisors.get(name) or self.new_supervisor(name)
+            for name in checks
+        }
+        try:
+            return self.server_group.any_active(checks)
+        finally:
+            self.session_counts = dict(counts)
+            # The status line is only built when it is logged
+            if log.isEnabledFor(DEBUG):
+                log.debug("Plex servers: %s", self.server_group.format_status())
+
+    def new_supervisor(self, name):
+        """Returns the connection supervisor of the given server"""
+        return PlexSupervisor(
+            name,
+            partial(self.app.reconnect_server, name),
+            clock=self.clock,
+            on_change=self.on_supervisor_change,
+        )
+
+    def check_supervised_server(self, name, counts, plex):
+        """Returns true if the given server has any active session, asked through its
+        supervisor. A server unreachable for longer than UNREACHABLE_GRACE counts as quiet,
+        nobody can be streaming from it"""
+        supervisor = self.supervisors[name]
+        try:
+            active = supervisor.call(
+                partial(self.check_server_sessions, name, counts), plex
             )
+        except Exception as e:
+            # A check skipped by the open circuit did not contact the server
+            if not isinstance(e, CircuitOpenError):
+                self.metrics.record_plex_error(name)
+            if supervisor.unreachable_for() < UNREACHABLE_GRACE:
+                raise
+            log.warning("%s, counted as quiet", supervisor.describe())
             return False
-        return len(self.app.get_plex_instance().sessions()) > 0
+        self.metrics.record_plex_contact(name)
+        return active
+
+    def on_supervisor_change(self, supervisor: PlexSupervisor):
+        """Reports a new connection state of a server to the metrics and the host"""
+        log.info("Plex connection %s", supervisor.describe())
+        self.metrics.record_plex_state(supervisor.status())
+        self.app.show_plex_health(self.format_plex_health())
+
+    def format_plex_health(self):
+        """Returns the connection state of every server as a single line"""
+        return ", ".join(
+            supervisor.describe() for supervisor in self.supervisors.values()
+        )
+
+    def check_server_sessions(self, name, counts, plex):
+        """Returns true if the given server has any active session, the number of sessions
+        is added to counts when it is known"""
+        if self.use_alerts:
+            # The notification stream only tells if there are sessions, not how many
+            return self.check_alert_sessions(self.alert_tracker_for(name), plex)
+        if self.stale_session_minutes <= 0:
+            # Without a stale timeout the sessions need not be tracked, the count is enough
+            self.session_trackers.pop(name, None)
+            count = self.session_counter(plex)
+        else:
+            # Stale sessions count neither for the decision nor in the trace log
+            count = self.count_progressing_sessions(name, plex)
+        counts[name] = count
+        return count > 0
+
+    def alert_tracker_for(self, name):
+        """Returns the alert tracker of the given server"""
+        if name not in self.alert_trackers:
+            self.alert_trackers[name] = AlertSessionTracker()
+        return self.alert_trackers[name]
+
+    def stop_alert_trackers(self, names):
+        """Stops the alert listeners of the given servers and forgets them"""
+        for name in names:
+            self.alert_trackers.pop(name).stop()
+
+    def check_alert_sessions(self, alert_tracker: AlertSessionTracker, plex):
+        """Returns true if the notification stream reports any live session,
+        polls the server instead while the alert socket is down"""
+        if alert_tracker.should_start(plex):
+            try:
+                alert_tracker.start(plex)
+            except Exception as e:
+                log.error("Error starting the Plex alert listener: %s", e)
+        if alert_tracker.is_connected():
+            return alert_tracker.has_active_sessions()
+        log.debug("Plex alert listener is not connected, polling sessions")
+        return self.session_counter(plex) > 0
+
+    def count_progressing_sessions(self, name, plex):
+        """Returns the number of sessions of the given server that are not stale, a session
+        is stale once its position and player state have not changed for the stale timeout"""
+        tracker = self.session_trackers.setdefault(name, SessionTracker())
+        now = self.clock()
+        delta = tracker.update(self.session_reader(plex), now)
+        if delta:
+            log.debug(
+                "%s sessions: %d added, %d removed, %d changed",
+                name,
+                len(delta.added),
+                len(delta.removed),
+                len(delta.changed),
+            )
+        stale = tracker.stale_keys(
+            now, self.minutes_to_seconds(self.stale_session_minutes)
+        )
+        if stale:
+            log.info("%s sessions not progressing, ignored: %s", name, ", ".join(stale))
+        return len(tracker.sessions) - len(stale)
 
     def check_if_transcoder_running(self):
-        """Returns true if Plex is running and transcoder not"""
+        """Returns true if Plex is running with an active transcoder, idle or stalled
+        transcoders do not keep the computer on"""
         if not self.app:
             return False
         if self.app.get_plex_instance() is None:
-            self.app.show_error(
-                self, "Cannot check if there are active sessions, Plex connection error"
-            )
+            # The sessions probe reports the connection state
             return False
-        plex_running = False
-        transcoder_running = False
         try:
-            # Run the task list command and capture the output
-            result = subprocess.run(
-                ["tasklist", "/fi", "imagename eq Plex*"],
-                capture_output=True,
-                text=True,
-                shell=True,
-                check=True,
-            )
-            # Check if the process name is in the output
-            if "Plex Media Server.exe".lower() in result.stdout.lower():
-                plex_running = True
-            if "Plex Transcoder.exe".lower() in result.stdout.lower():
-                transcoder_running = True
-        except subprocess.CalledProcessError as e:
-            print(f"Error checking process: {e}")
+            running = self.process_probe.running()
+            if running[PLEX_SERVER_PROCESS] and running[PLEX_TRANSCODER_PROCESS]:
+                # Another transcoder may have started while a cached one is still alive
+                loads = self.transcoder_load.sample(
+                    self.process_probe.current_pids(PLEX_TRANSCODER_PROCESS)
+                )
+            else:
+                loads = {}
+        except OSError as e:
+            log.warning("Error checking process: %s", e)
             return False
-        return plex_running and transcoder_running
+        for pid, load in loads.items():
+            if load != TRANSCODER_ACTIVE:
+                log.debug("Plex transcoder %s is %s", pid, load)
+        # The trace log and the usage model only count transcoders doing work
+        self.last_transcoder_running = TRANSCODER_ACTIVE in loads.values()
+        return self.last_transcoder_running
 
     def minutes_to_seconds(self, minutes):
         """Converts minutes to seconds"""
@@ -80,94 +378,246 @@ class PlexShutdownManager:
             return False
 
         try:
-            subprocess.run(["shutdown", "-a"], check=True)
-            print("Auto-shutdown aborted")
-            self.shutdown_enabled = False
-            return True
-        except subprocess.CalledProcessError:
-            print("Shutdown was not canceled because it was not activated")
+            self.power.cancel()
+        except OSError as e:
+            log.error("Shutdown was not canceled, error: %s", e)
             return False
+        log.info("Auto-shutdown aborted")
+        self.shutdown_enabled = False
+        self.shutdown_deadline = None
+        return True
 
     def activate_shutdown(self, time_in_minutes):
         """Activates the shutdown"""
         if self.shutdown_enabled:
             return
 
-        toast("Plex Auto Shutdown", "Auto-shutdown initiated")
-        print(
-            "Auto-shutdown initiated, computer will shutdown in "
-            + str(time_in_minutes)
-            + " seconds"
+        self.notify("Plex Auto Shutdown", "Auto-shutdown initiated")
+        log.info(
+            "Auto-shutdown initiated, computer will shutdown in %.1f minutes",
+            time_in_minutes,
         )
         try:
             shutdown_delay = int(self.minutes_to_seconds(time_in_minutes))
-            subprocess.run(
-                [
-                    "shutdown",
-                    "-s",
-                    "-t",
-                    str(shutdown_delay),
-                    "-c",
-                    " ",
-                ],
-                check=True,
-            )
+            self.power.arm(shutdown_delay)
             self.shutdown_enabled = True
-        except subprocess.CalledProcessError as e:
-            print("Shutdown was not activated, error: ", e)
+            self.shutdown_deadline = self.clock() + shutdown_delay
+        except OSError as e:
+            log.error("Shutdown was not activated, error: %s", e)
+
+    def observe_probe(self, name, latency):
+        """Records the latency of a probe run in the metrics and for the trace log"""
+        self.metrics.observe_probe(name, latency)
+        self.tick_latencies[name] = latency
+
+    def shutdown_delay(self):
+        """Returns the shutdown delay in minutes, scaled by the usage model when there is one"""
+        delay = self.app.get_shutdown_delay()
+        if self.usage_model is None:
+            return delay
+        scaled = self.usage_model.shutdown_delay(delay)
+        if scaled != delay:
+            log.info("Usage model changed the shutdown delay to %.1f minutes", scaled)
+        return scaled
 
     def monitor_plex_and_shutdown(self):
+        """Runs a monitor check, counts its outcome, appends it to the trace log and logs
+        it, see evaluate_shutdown"""
+        start = perf_counter()
+        self.start_tick()
+        outcome = self.evaluate_shutdown()
+        values = self.consumed_tick_values()
+        self.metrics.record_outcome(OUTCOME_NAMES[outcome])
+        if self.trace_log is not None:
+            self.record_trace(outcome, values)
+        self.log_tick(outcome, perf_counter() - start, values)
+        return outcome
+
+    def update_settings(self, use_alerts, stale_session_minutes):
+        """Hands settings changed while running to the monitor thread, safe from any thread.
+        They take effect on the next check"""
+        with self.settings_lock:
+            self.pending_settings = (use_alerts, stale_session_minutes)
+
+    def start_tick(self):
+        """Applies the pending settings and forgets what the previous check saw, a probe
+        skipped by this check is unknown in its trace record instead of repeating an old
+        value"""
+        with self.settings_lock:
+            pending, self.pending_settings = self.pending_settings, None
+        if pending is not None:
+            self.use_alerts, self.stale_session_minutes = pending
+            if not self.use_alerts:
+                self.stop_alert_trackers(list(self.alert_trackers))
+        self.tick_idle_duration = None
+        self.last_transcoder_running = None
+        self.session_counts = {}
+        self.tick_latencies = {}
+        self.probe_scheduler.clear_consumed()
+
+    def session_total(self):
+        """Returns the sessions counted by the last check on every server, None if none
+        was counted"""
+        counts = self.session_counts
+        return sum(counts.values()) if counts else None
+
+    def consumed_tick_values(self):
+        """Returns what the probes used by the check saw. A probe that missed its deadline
+        may still finish and write its values while the check is recorded, they are left
+        out"""
+        consumed = self.probe_scheduler.consumed
+        latencies = dict(self.tick_latencies)
+        return TickValues(
+            self.tick_idle_duration if IDLE_PROBE in consumed else None,
+            self.last_transcoder_running if TRANSCODER_PROBE in consumed else None,
+            self.session_total() if SESSIONS_PROBE in consumed else None,
+            {name: latency for name, latency in latencies.items() if name in consumed},
+        )
+
+    def log_tick(self, outcome, duration, values: TickValues):
+        """Logs what the check saw and decided as a single record of key=value fields"""
+        latencies = {
+            f"{name}_ms": latency * 1000 for name, latency in values.latencies.items()
+        }
+        log.info(
+            "Check finished",
+            extra=fields(
+                outcome=OUTCOME_NAMES[outcome],
+                idle=values.idle_duration,
+                transcoder=values.transcoder_running,
+                sessions=values.sessions,
+                pending=self.shutdown_enabled,
+                tick_ms=duration * 1000,
+                **latencies,
+            ),
+        )
+
+    def record_trace(self, outcome, values: TickValues):
+        """Appends what the check saw and decided to the trace log"""
+        try:
+            self.trace_log.record(
+                values.idle_duration,
+                values.transcoder_running,
+                values.sessions,
+                outcome,
+                self.shutdown_enabled,
+                [values.latencies.get(name) for name in TRACE_PROBES],
+            )
+        except OSError as e:
+            log.warning("Cannot write the trace log: %s", e)
+
+    def evaluate_shutdown(self):
         """Checks if there is any active Plex session and computer is idling, if so, activates the shutdown
         returns NO_ACTIVATION if no action was taken, ACTIVATED_SHUTDOWN if the shutdown was activated and CANCELED_SHUTDOWN if the shutdown was canceled
+        returns UNKNOWN_OUTCOME, taking no action, if a probe needed for the decision failed or missed its deadline
         """
-        print("\nMonitoring...")
-        print("======================")
         if not self.app:
             return NO_ACTIVATION
         if not self.app.get_shutdown_status():
             self.cancel_shutdown()
             return NO_ACTIVATION
 
-        max_idle_seconds = self.minutes_to_seconds(self.app.get_max_computer_idle())
-        not_idling = max_idle_seconds != 0 and get_idle_duration() < max_idle_seconds
-
         # Si el max idle es 0 no se tiene en cuenta -> No se cancela el shutdown a menos que haya session nueva -> Tampoco se cuenta para activar el shutdown
         # Si el max idle es diferente de 0 entonces idle time tiene que ser menor al max -> Se cancela shutdown si el idle es menor al max o hay sesiones
         if self.shutdown_enabled:
-            if not_idling or self.check_if_are_active_sessions():
+            blocking_probe = self.probe_scheduler.evaluate(
+                [IDLE_PROBE, SESSIONS_PROBE]
+            )
+            self.log_probe_stats()
+            if blocking_probe == UNKNOWN:
+                log.info("Cannot decide, keeping the pending shutdown")
+                return UNKNOWN_OUTCOME
+            if blocking_probe is not None:
                 self.cancel_shutdown()
                 return CANCELED_SHUTDOWN
             return NO_ACTIVATION
 
-        if not_idling:
-            print("Computer is not in idle mode")
+        blocking_probe = self.probe_scheduler.evaluate(
+            [IDLE_PROBE, TRANSCODER_PROBE, SESSIONS_PROBE]
+        )
+        self.log_probe_stats()
+        if blocking_probe == IDLE_PROBE:
+            log.debug("Computer is not in idle mode")
             return NO_ACTIVATION
-        print("Computer is in idle mode")
-
-        if self.check_if_transcoder_running():
-            print("Plex transcoder is running")
+        if blocking_probe == TRANSCODER_PROBE:
+            log.debug("Plex transcoder is running")
             return NO_ACTIVATION
-        print("Plex transcoder is not running")
-
-        if self.check_if_are_active_sessions():
-            print("There are an active plex session")
+        if blocking_probe == SESSIONS_PROBE:
+            log.debug("There are an active plex session")
             return NO_ACTIVATION
-        print("No plex session is active")
+        if blocking_probe == UNKNOWN:
+            log.info("Cannot decide, a probe failed or missed its deadline")
+            return UNKNOWN_OUTCOME
+        log.debug(
+            "Computer is in idle mode, Plex transcoder is not running and no plex session is active"
+        )
 
         if not self.shutdown_enabled:
-            self.activate_shutdown(self.app.get_shutdown_delay())
+            self.activate_shutdown(self.shutdown_delay())
             return ACTIVATED_SHUTDOWN
 
         return NO_ACTIVATION
 
+    def log_probe_stats(self):
+        """Logs the cost and blocking rate of every probe, only built at the debug level"""
+        if log.isEnabledFor(DEBUG):
+            log.debug("Probe stats: %s", self.probe_scheduler.format_stats())
+
+    def next_check_delay(self):
+        """Returns how many seconds the monitor can sleep before a state change is possible.
+        While the computer is not idle no Plex activity can trigger the shutdown, so the monitor
+        sleeps until the max idle time can be reached, input only resets the idle time and a
+        settings change goes through wake. Otherwise the interval delay is the upper bound,
+        shortened to run a last check right before the pending shutdown"""
+        interval = self.minutes_to_seconds(self.app.get_interval_delay())
+        if not self.app.get_shutdown_status():
+            return interval
+
+        now = self.clock()
+        if self.shutdown_enabled:
+            if self.shutdown_deadline is None:
+                return interval
+            until_deadline = self.shutdown_deadline - SHUTDOWN_DEADLINE_MARGIN - now
+            if until_deadline <= 0:
+                return interval
+            return max(MIN_CHECK_DELAY, min(interval, until_deadline))
+
+        max_idle_seconds = self.minutes_to_seconds(self.app.get_max_computer_idle())
+        if max_idle_seconds == 0 or self.last_idle_duration is None:
+            return interval
+        # Without new input the idle time keeps growing since it was read
+        idle = self.last_idle_duration + now - self.last_idle_read
+        if idle >= max_idle_seconds:
+            return interval
+        return max(MIN_CHECK_DELAY, max_idle_seconds - idle + IDLE_THRESHOLD_MARGIN)
+
+    def wake(self):
+        """Runs the next check right away, used when the settings change"""
+        self.wakeup.set()
+
+    def stop(self):
+        """Ends the monitor loop, it returns once the running check finishes"""
+        self.stopped.set()
+        self.wakeup.set()
+
     def monitor_mainloop(self):
-        """Main loop for the monitor thread"""
+        """Main loop for the monitor thread, sleeps until the next check, a wake or a stop"""
         if not self.app:
             return
 
         osSleep = WindowsInhibitor()
         osSleep.inhibit()
-        while True:
-            self.monitor_plex_and_shutdown()
-            sleep(self.minutes_to_seconds(self.app.get_interval_delay()))
-        osSleep.uninhibit()
+        try:
+            while not self.stopped.is_set():
+                self.monitor_plex_and_shutdown()
+                delay = self.next_check_delay()
+                log.debug("Next check in %.0f seconds", delay)
+                self.wakeup.wait(delay)
+                self.wakeup.clear()
+        finally:
+            osSleep.uninhibit()
+            self.stop_alert_trackers(list(self.alert_trackers))
+            # Probes and server checks still running are not waited for
+            if self.probe_scheduler.executor is not None:
+                self.probe_scheduler.executor.shutdown()
+            self.server_group.shutdown()
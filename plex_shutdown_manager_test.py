@@ -1,12 +1,28 @@
 """     Test file for plex_shutdown_manager.py """
+import math
+import os
+import tempfile
 import unittest
-import subprocess
+from threading import Event, Thread
 from unittest.mock import MagicMock, patch
 from plex_shutdown_manager import (
     PlexShutdownManager,
     NO_ACTIVATION,
     ACTIVATED_SHUTDOWN,
     CANCELED_SHUTDOWN,
+    UNKNOWN_OUTCOME,
+)
+from config import PRIMARY_SERVER_NAME
+from plex_server_group import ServersUnavailableError
+from plex_sessions import SessionState
+from power import DryRunPowerBackend, PowerController
+from trace_log import TraceLog, read_records
+from process_probe import (
+    RESCAN_EVERY,
+    FakeProcessBackend,
+    ProcessProbe,
+    ProcessSample,
+    TranscoderLoadProbe,
 )
 
 SHUTDOWN_DELAY = 3600
@@ -18,14 +34,32 @@ class PlexShutdownManagerTest(unittest.TestCase):
     def setUp(self) -> None:
         self.patcher = patch("plex_shutdown_manager.toast")
         self.mock_toast = self.patcher.start()
+        # The sessions of the Plex mocks are the items of their sessions() list, all playing
+        self.count_patcher = patch(
+            "plex_shutdown_manager.read_sessions",
+            side_effect=lambda plex: [
+                SessionState(str(key), 0, "playing") for key in plex.sessions()
+            ],
+        )
+        self.count_patcher.start()
+        self.counter_patcher = patch(
+            "plex_shutdown_manager.count_sessions",
+            side_effect=lambda plex: len(plex.sessions()),
+        )
+        self.counter_patcher.start()
+        # Every manager records its power actions instead of scheduling a real shutdown
+        self.power_patcher = patch(
+            "plex_shutdown_manager.default_power_backend",
+            side_effect=DryRunPowerBackend,
+        )
+        self.power_patcher.start()
         self.app_mock = MagicMock()
 
     def tearDown(self) -> None:
         self.patcher.stop()
-        try:
-            subprocess.run(["shutdown", "-a"], check=True)
-        except subprocess.CalledProcessError:
-            print("Shutdown was not canceled")
+        self.count_patcher.stop()
+        self.counter_patcher.stop()
+        self.power_patcher.stop()
 
     def test_01_framework(self):
         """Test if the test framework is working"""
@@ -36,20 +70,16 @@ class PlexShutdownManagerTest(unittest.TestCase):
         psm = PlexShutdownManager(self.app_mock)
         psm.activate_shutdown(SHUTDOWN_DELAY)
         self.assertTrue(psm.shutdown_enabled)
-        try:
-            subprocess.run(["shutdown", "-a"], check=True)
-        except subprocess.CalledProcessError:
-            self.fail("Shutdown was not activated")
+        self.assertEqual(psm.power.backend.calls, [("schedule", SHUTDOWN_DELAY * 60)])
         assert self.mock_toast.call_count == 1
 
     def test_03_cancel_shutdown(self):
         """Test if the shutdown is canceled"""
         psm = PlexShutdownManager(self.app_mock)
         psm.activate_shutdown(SHUTDOWN_DELAY)
-        try:
-            psm.cancel_shutdown()
-        except subprocess.CalledProcessError:
-            self.fail("Shutdown was not canceled")
+        self.assertTrue(psm.cancel_shutdown())
+        self.assertFalse(psm.shutdown_enabled)
+        self.assertEqual(psm.power.backend.calls[-1], ("abort", None))
         assert self.mock_toast.call_count == 1
 
     def test_04_cancel_shutdown_without_activation(self):
@@ -57,6 +87,7 @@ class PlexShutdownManagerTest(unittest.TestCase):
         psm = PlexShutdownManager(self.app_mock)
         self.assertFalse(psm.cancel_shutdown())
         assert self.mock_toast.call_count == 0
+        self.assertEqual(psm.power.backend.calls, [])
 
     def test_05_no_app(self):
         """Test plex_shutdown_manager with app being none"""
@@ -67,36 +98,35 @@ class PlexShutdownManagerTest(unittest.TestCase):
 
     def test_06_transcoder_running_plex_not(self):
         """Test plex_shutdown_manager with transcoder running but not the plex"""
-        psm = PlexShutdownManager(self.app_mock)
-        with patch("subprocess.run") as mock_run:
-            mock_run.return_value = subprocess.CompletedProcess(
-                args=[""],
-                returncode=1,
-                stdout="Plex Transcoder.exe",
-            )
-            self.assertFalse(psm.check_if_transcoder_running())
+        psm = PlexShutdownManager(
+            self.app_mock,
+            process_probe=ProcessProbe(
+                FakeProcessBackend({20: "Plex Transcoder.exe"})
+            ),
+        )
+        self.assertFalse(psm.check_if_transcoder_running())
 
     def test_07_plex_running_transcoder_not(self):
         """Test plex_shutdown_manager with plex running but not transcoder"""
-        psm = PlexShutdownManager(self.app_mock)
-        with patch("subprocess.run") as mock_run:
-            mock_run.return_value = subprocess.CompletedProcess(
-                args=[""],
-                returncode=1,
-                stdout="Plex Media Server.exe\n",
-            )
-            self.assertFalse(psm.check_if_transcoder_running())
+        psm = PlexShutdownManager(
+            self.app_mock,
+            process_probe=ProcessProbe(
+                FakeProcessBackend({10: "Plex Media Server.exe"})
+            ),
+        )
+        self.assertFalse(psm.check_if_transcoder_running())
 
     def test_08_plex_running_transcoder_running(self):
         """Test plex_shutdown_manager with plex and transcoder running"""
-        psm = PlexShutdownManager(self.app_mock)
-        with patch("subprocess.run") as mock_run:
-            mock_run.return_value = subprocess.CompletedProcess(
-                args=[""],
-                returncode=1,
-                stdout="Plex Media Server.exe\n Plex Transcoder.exe",
-            )
-            self.assertTrue(psm.check_if_transcoder_running())
+        psm = PlexShutdownManager(
+            self.app_mock,
+            process_probe=ProcessProbe(
+                FakeProcessBackend(
+                    {10: "Plex Media Server.exe", 20: "Plex Transcoder.exe"}
+                )
+            ),
+        )
+        self.assertTrue(psm.check_if_transcoder_running())
 
     def test_09_no_active_sessions(self):
         """Test plex_shutdown_manager with no active sessions"""
@@ -130,24 +160,24 @@ class PlexShutdownManagerTest(unittest.TestCase):
     def test_13_monitor_not_idling(self):
         """Test plex_shutdown_manager monitor with app shutdown switch enabled and not idling"""
         psm = PlexShutdownManager(self.app_mock)
-        with patch.object(psm, "minutes_to_seconds", return_value=60), patch(
-            "plex_shutdown_manager.get_idle_duration", return_value=10
+        with patch.object(psm, "minutes_to_seconds", return_value=60), patch.object(
+            psm.idle_source, "idle_seconds", return_value=10
         ):
             self.assertEqual(psm.monitor_plex_and_shutdown(), NO_ACTIVATION)
 
     def test_14_monitor_transcoder_not_running(self):
         """Test plex_shutdown_manager monitor with app shutdown switch enabled and idling and transcoder running"""
         psm = PlexShutdownManager(self.app_mock)
-        with patch.object(psm, "minutes_to_seconds", return_value=60), patch(
-            "plex_shutdown_manager.get_idle_duration", return_value=70
+        with patch.object(psm, "minutes_to_seconds", return_value=60), patch.object(
+            psm.idle_source, "idle_seconds", return_value=70
         ), patch.object(psm, "check_if_transcoder_running", return_value=True):
             self.assertEqual(psm.monitor_plex_and_shutdown(), NO_ACTIVATION)
 
     def test_15_monitor_no_active_sessions(self):
         """Test plex_shutdown_manager monitor with app shutdown switch enabled and idling and an active session"""
         psm = PlexShutdownManager(self.app_mock)
-        with patch.object(psm, "minutes_to_seconds", return_value=60), patch(
-            "plex_shutdown_manager.get_idle_duration", return_value=70
+        with patch.object(psm, "minutes_to_seconds", return_value=60), patch.object(
+            psm.idle_source, "idle_seconds", return_value=70
         ), patch.object(
             psm, "check_if_transcoder_running", return_value=False
         ), patch.object(
@@ -158,8 +188,8 @@ class PlexShutdownManagerTest(unittest.TestCase):
     def test_16_monitor_shutdown_enabled(self):
         """Test plex_shutdown_manager monitor with app shutdown switch enabled and idling but no active sessions"""
         psm = PlexShutdownManager(self.app_mock)
-        with patch.object(psm, "minutes_to_seconds", return_value=60), patch(
-            "plex_shutdown_manager.get_idle_duration", return_value=70
+        with patch.object(psm, "minutes_to_seconds", return_value=60), patch.object(
+            psm.idle_source, "idle_seconds", return_value=70
         ), patch.object(
             psm, "check_if_transcoder_running", return_value=False
         ), patch.object(
@@ -172,8 +202,8 @@ class PlexShutdownManagerTest(unittest.TestCase):
     def test_17_monitor_cancel_activation(self):
         """Test plex_shutdown_manager monitor with app shutdown switch enabled and shutdown activated but not idling"""
         psm = PlexShutdownManager(self.app_mock)
-        with patch.object(psm, "minutes_to_seconds", return_value=60), patch(
-            "plex_shutdown_manager.get_idle_duration", return_value=10
+        with patch.object(psm, "minutes_to_seconds", return_value=60), patch.object(
+            psm.idle_source, "idle_seconds", return_value=10
         ), patch.object(
             psm, "check_if_transcoder_running", return_value=False
         ), patch.object(
@@ -186,8 +216,8 @@ class PlexShutdownManagerTest(unittest.TestCase):
     def test_18_monitor_activate_shutdown(self):
         """Test plex_shutdown_manager monitor with app shutdown switch enabled and shutdown not activated and idling"""
         psm = PlexShutdownManager(self.app_mock)
-        with patch.object(psm, "minutes_to_seconds", return_value=60), patch(
-            "plex_shutdown_manager.get_idle_duration", return_value=70
+        with patch.object(psm, "minutes_to_seconds", return_value=60), patch.object(
+            psm.idle_source, "idle_seconds", return_value=70
         ), patch.object(
             psm, "check_if_transcoder_running", return_value=False
         ), patch.object(
@@ -199,15 +229,15 @@ class PlexShutdownManagerTest(unittest.TestCase):
 
     def test_19_shutdown_enabled_now_not_idling(self):
         psm = PlexShutdownManager(self.app_mock)
-        with patch.object(psm, "minutes_to_seconds", return_value=60), patch(
-            "plex_shutdown_manager.get_idle_duration", return_value=1
+        with patch.object(psm, "minutes_to_seconds", return_value=60), patch.object(
+            psm.idle_source, "idle_seconds", return_value=1
         ), patch.object(psm, "shutdown_enabled", True):
             self.assertEqual(psm.monitor_plex_and_shutdown(), CANCELED_SHUTDOWN)
 
     def test_20_shutdown_enabled_new_session(self):
         psm = PlexShutdownManager(self.app_mock)
-        with patch.object(psm, "minutes_to_seconds", return_value=60), patch(
-            "plex_shutdown_manager.get_idle_duration", return_value=120
+        with patch.object(psm, "minutes_to_seconds", return_value=60), patch.object(
+            psm.idle_source, "idle_seconds", return_value=120
         ), patch.object(psm, "shutdown_enabled", True), patch.object(
             psm, "check_if_are_active_sessions", return_value=True
         ):
@@ -215,13 +245,496 @@ class PlexShutdownManagerTest(unittest.TestCase):
 
     def test_21_shutdown_enabled_still_idling_no_new_session(self):
         psm = PlexShutdownManager(self.app_mock)
-        with patch.object(psm, "minutes_to_seconds", return_value=60), patch(
-            "plex_shutdown_manager.get_idle_duration", return_value=120
+        with patch.object(psm, "minutes_to_seconds", return_value=60), patch.object(
+            psm.idle_source, "idle_seconds", return_value=120
         ), patch.object(psm, "shutdown_enabled", True), patch.object(
             psm, "check_if_are_active_sessions", return_value=False
         ):
             self.assertEqual(psm.monitor_plex_and_shutdown(), NO_ACTIVATION)
 
+    def test_22_alert_sessions(self):
+        """Test plex_shutdown_manager with sessions detected from the notification stream"""
+        psm = PlexShutdownManager(self.app_mock, use_alerts=True)
+        plex_mock = MagicMock()
+        self.app_mock.get_plex_instance.return_value = plex_mock
+        alert_tracker = psm.alert_tracker_for(PRIMARY_SERVER_NAME)
+        with patch.object(alert_tracker, "start") as mock_start, patch.object(
+            alert_tracker, "is_connected", return_value=True
+        ), patch.object(alert_tracker, "has_active_sessions", return_value=True):
+            self.assertTrue(psm.check_if_are_active_sessions())
+            mock_start.assert_called_once_with(plex_mock)
+        plex_mock.sessions.assert_not_called()
+
+    def test_23_alert_sessions_socket_dropped(self):
+        """Test plex_shutdown_manager falls back to polling when the alert socket is down"""
+        psm = PlexShutdownManager(self.app_mock, use_alerts=True)
+        plex_mock = MagicMock()
+        plex_mock.sessions.return_value = []
+        self.app_mock.get_plex_instance.return_value = plex_mock
+        alert_tracker = psm.alert_tracker_for(PRIMARY_SERVER_NAME)
+        with patch.object(alert_tracker, "start"), patch.object(
+            alert_tracker, "is_connected", return_value=False
+        ):
+            self.assertFalse(psm.check_if_are_active_sessions())
+        plex_mock.sessions.assert_called_once()
+
+    def test_24_probe_results_are_reused(self):
+        """Test plex_shutdown_manager reuses fresh probe results between ticks"""
+        psm = PlexShutdownManager(self.app_mock)
+        with patch.object(psm, "minutes_to_seconds", return_value=60), patch.object(
+            psm.idle_source, "idle_seconds", return_value=70
+        ), patch.object(
+            psm, "check_if_transcoder_running", return_value=True
+        ) as mock_transcoder:
+            self.assertEqual(psm.monitor_plex_and_shutdown(), NO_ACTIVATION)
+            self.assertEqual(psm.monitor_plex_and_shutdown(), NO_ACTIVATION)
+            self.assertEqual(mock_transcoder.call_count, 1)
+        self.assertEqual(psm.probe_scheduler.stats()["transcoder"]["hits"], 1)
+
+    def test_25_next_check_waits_for_idle_threshold(self):
+        """Test plex_shutdown_manager sleeps until the max idle time can be reached, even past
+        the interval delay"""
+        self.app_mock.get_max_computer_idle.return_value = 30
+        self.app_mock.get_interval_delay.return_value = 1
+        psm = PlexShutdownManager(self.app_mock, clock=lambda: 100)
+        with patch.object(psm.idle_source, "idle_seconds", return_value=2):
+            self.assertEqual(psm.monitor_plex_and_shutdown(), NO_ACTIVATION)
+        self.assertEqual(psm.next_check_delay(), 30 * 60 - 2 + 1)
+
+    def test_26_next_check_interval_when_idling(self):
+        """Test plex_shutdown_manager uses the interval delay once the computer is idle"""
+        self.app_mock.get_max_computer_idle.return_value = 30
+        self.app_mock.get_interval_delay.return_value = 1
+        psm = PlexShutdownManager(self.app_mock, clock=lambda: 100)
+        with patch.object(
+            psm.idle_source, "idle_seconds", return_value=40 * 60
+        ), patch.object(psm, "check_if_transcoder_running", return_value=True):
+            self.assertEqual(psm.monitor_plex_and_shutdown(), NO_ACTIVATION)
+        self.assertEqual(psm.next_check_delay(), 60)
+
+    def test_27_next_check_before_shutdown_deadline(self):
+        """Test plex_shutdown_manager checks right before the pending shutdown"""
+        self.app_mock.get_interval_delay.return_value = 1
+        psm = PlexShutdownManager(self.app_mock, clock=lambda: 100)
+        psm.shutdown_enabled = True
+        psm.shutdown_deadline = 120
+        self.assertEqual(psm.next_check_delay(), 15)
+
+    def test_28_monitor_unknown_when_plex_fails(self):
+        """Test plex_shutdown_manager takes no action when the sessions probe fails"""
+        psm = PlexShutdownManager(self.app_mock)
+        with patch.object(psm, "minutes_to_seconds", return_value=60), patch.object(
+            psm.idle_source, "idle_seconds", return_value=70
+        ), patch.object(
+            psm, "check_if_transcoder_running", return_value=False
+        ), patch.object(
+            psm, "check_if_are_active_sessions", side_effect=ConnectionError
+        ):
+            self.assertEqual(psm.monitor_plex_and_shutdown(), UNKNOWN_OUTCOME)
+        self.assertFalse(psm.shutdown_enabled)
+
+    def test_29_sessions_on_any_server(self):
+        """Test plex_shutdown_manager with active sessions only on an extra server"""
+        psm = PlexShutdownManager(self.app_mock)
+        primary_mock = MagicMock()
+        primary_mock.sessions.return_value = []
+        extra_mock = MagicMock()
+        extra_mock.sessions.return_value = ["test"]
+        self.app_mock.get_plex_instance.return_value = primary_mock
+        self.app_mock.get_extra_plex_instances.return_value = [("Extra", extra_mock)]
+        self.assertTrue(psm.check_if_are_active_sessions())
+
+    def test_30_all_servers_quiet(self):
+        """Test plex_shutdown_manager with every server quiet"""
+        psm = PlexShutdownManager(self.app_mock)
+        plex_mock = MagicMock()
+        plex_mock.sessions.return_value = []
+        self.app_mock.get_plex_instance.return_value = plex_mock
+        self.app_mock.get_extra_plex_instances.return_value = [("Extra", plex_mock)]
+        self.assertFalse(psm.check_if_are_active_sessions())
+        self.assertTrue(psm.server_group.statuses["Extra"].is_healthy())
+
+    def test_31_extra_server_unavailable(self):
+        """Test plex_shutdown_manager cannot tell the sessions while a server is unreachable"""
+        psm = PlexShutdownManager(self.app_mock)
+        plex_mock = MagicMock()
+        plex_mock.sessions.return_value = []
+        self.app_mock.get_plex_instance.return_value = plex_mock
+        self.app_mock.get_extra_plex_instances.return_value = [("Extra", None)]
+        self.app_mock.reconnect_server.side_effect = ConnectionError("unreachable")
+        with self.assertRaises(ServersUnavailableError):
+            psm.check_if_are_active_sessions()
+        self.assertEqual(psm.server_group.statuses["Extra"].failures, 1)
+
+    def test_32_metrics_record_tick(self):
+        """Test plex_shutdown_manager records the outcome, probe latencies and Plex contact"""
+        psm = PlexShutdownManager(self.app_mock, parallel_probes=False)
+        plex_mock = MagicMock()
+        plex_mock.sessions.return_value = ["test"]
+        self.app_mock.get_plex_instance.return_value = plex_mock
+        self.app_mock.get_extra_plex_instances.return_value = [("Extra", None)]
+        self.app_mock.reconnect_server.side_effect = ConnectionError("unreachable")
+        with patch.object(psm, "minutes_to_seconds", return_value=60), patch.object(
+            psm.idle_source, "idle_seconds", return_value=70
+        ), patch.object(psm, "check_if_transcoder_running", return_value=False):
+            self.assertEqual(psm.monitor_plex_and_shutdown(), NO_ACTIVATION)
+        self.assertEqual(psm.metrics.outcomes["no_activation"], 1)
+        self.assertEqual(psm.metrics.probe_latency["sessions"].samples()[2], 1)
+        self.assertIn(PRIMARY_SERVER_NAME, psm.metrics.last_plex_contact)
+        # The answer of the primary server does not wait for the failing extra server
+        psm.server_group.statuses["Extra"].future.exception(timeout=5)
+        self.assertEqual(psm.metrics.plex_errors["Extra"], 1)
+
+    def test_33_wake_runs_check_at_once(self):
+        """Test plex_shutdown_manager runs a check right away when woken and stops cleanly"""
+        psm = PlexShutdownManager(self.app_mock)
+        self.app_mock.get_interval_delay.return_value = 60
+        self.app_mock.get_shutdown_status.return_value = False
+        checks = [Event(), Event()]
+
+        def check():
+            checks[monitor_mock.call_count - 1].set()
+            return NO_ACTIVATION
+
+        with patch(
+            "plex_shutdown_manager.WindowsInhibitor"
+        ) as inhibitor_mock, patch.object(
+            psm, "monitor_plex_and_shutdown", side_effect=check
+        ) as monitor_mock:
+            monitor = Thread(target=psm.monitor_mainloop)
+            monitor.start()
+            self.assertTrue(checks[0].wait(timeout=1))
+            psm.wake()
+            self.assertTrue(checks[1].wait(timeout=1))
+            psm.stop()
+            monitor.join(timeout=1)
+            self.assertFalse(monitor.is_alive())
+            inhibitor_mock.return_value.uninhibit.assert_called_once()
+
+    def test_34_power_calls_not_repeated(self):
+        """Test plex_shutdown_manager makes one power call per real change of the pending shutdown"""
+        psm = PlexShutdownManager(self.app_mock)
+        psm.activate_shutdown(SHUTDOWN_DELAY)
+        psm.shutdown_enabled = False
+        psm.activate_shutdown(SHUTDOWN_DELAY)
+        self.assertTrue(psm.cancel_shutdown())
+        psm.shutdown_enabled = True
+        self.assertTrue(psm.cancel_shutdown())
+        self.assertEqual(
+            psm.power.backend.calls,
+            [("schedule", SHUTDOWN_DELAY * 60), ("abort", None)],
+        )
+
+    def test_35_power_backend_error(self):
+        """Test plex_shutdown_manager keeps its state when the power backend fails"""
+        backend = DryRunPowerBackend(PermissionError("denied"))
+        psm = PlexShutdownManager(self.app_mock, power=PowerController(backend))
+        psm.activate_shutdown(SHUTDOWN_DELAY)
+        self.assertFalse(psm.shutdown_enabled)
+        backend.error = None
+        psm.activate_shutdown(SHUTDOWN_DELAY)
+        backend.error = PermissionError("denied")
+        self.assertFalse(psm.cancel_shutdown())
+        self.assertTrue(psm.shutdown_enabled)
+        self.assertTrue(psm.power.pending)
+
+    def test_36_trace_log_records_tick(self):
+        """Test plex_shutdown_manager appends what a check saw and decided to the trace log"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        trace_path = os.path.join(directory.name, "trace.bin")
+        trace_log = TraceLog(trace_path)
+        psm = PlexShutdownManager(
+            self.app_mock, parallel_probes=False, trace_log=trace_log
+        )
+        plex_mock = MagicMock()
+        plex_mock.sessions.return_value = ["1", "2"]
+        self.app_mock.get_plex_instance.return_value = plex_mock
+        self.app_mock.get_extra_plex_instances.return_value = []
+        with patch.object(psm, "minutes_to_seconds", return_value=60), patch.object(
+            psm.idle_source, "idle_seconds", return_value=70
+        ), patch.object(psm, "check_if_transcoder_running", return_value=False):
+            self.assertEqual(psm.monitor_plex_and_shutdown(), NO_ACTIVATION)
+        trace_log.close()
+        (record,) = read_records(trace_path)
+        self.assertEqual((record.idle_seconds, record.sessions), (70, 2))
+        self.assertEqual(record.outcome, NO_ACTIVATION)
+        self.assertFalse(record.shutdown_pending)
+        self.assertGreaterEqual(record.sessions_latency, 0)
+
+    def test_37_usage_model_scales_delay(self):
+        """Test plex_shutdown_manager arms the shutdown with the delay of the usage model"""
+        usage_model = MagicMock()
+        usage_model.shutdown_delay.return_value = 15
+        self.app_mock.get_shutdown_delay.return_value = 30
+        psm = PlexShutdownManager(self.app_mock, usage_model=usage_model)
+        with patch.object(psm, "minutes_to_seconds", return_value=60), patch.object(
+            psm.idle_source, "idle_seconds", return_value=70
+        ), patch.object(
+            psm, "check_if_transcoder_running", return_value=False
+        ), patch.object(
+            psm, "check_if_are_active_sessions", return_value=False
+        ), patch.object(
+            psm, "activate_shutdown"
+        ) as activate_mock:
+            self.assertEqual(psm.monitor_plex_and_shutdown(), ACTIVATED_SHUTDOWN)
+        usage_model.shutdown_delay.assert_called_once_with(30)
+        activate_mock.assert_called_once_with(15)
+
+    def test_38_stalled_transcoder_does_not_block(self):
+        """Test plex_shutdown_manager ignores a transcoder whose counters stopped moving"""
+        now = [0.0]
+        backend = FakeProcessBackend(
+            {10: "Plex Media Server.exe", 20: "Plex Transcoder.exe"},
+            {20: ProcessSample(10.0, 4096)},
+        )
+        psm = PlexShutdownManager(
+            self.app_mock,
+            process_probe=ProcessProbe(backend),
+            transcoder_load=TranscoderLoadProbe(backend, clock=lambda: now[0]),
+        )
+        self.assertTrue(psm.check_if_transcoder_running())
+        now[0] += 60
+        backend.samples[20] = ProcessSample(40.0, 4096)
+        self.assertTrue(psm.check_if_transcoder_running())
+        # Once the busy samples leave the window the transcoder is stalled
+        for _ in range(6):
+            now[0] += 60
+            psm.check_if_transcoder_running()
+        self.assertFalse(psm.check_if_transcoder_running())
+        self.assertFalse(psm.last_transcoder_running)
+
+    def test_39_stale_sessions_do_not_block(self):
+        """Test plex_shutdown_manager ignores sessions that stopped progressing"""
+        now = [0.0]
+        offsets = {"1": 0, "2": 0}
+        plex_mock = MagicMock()
+        self.app_mock.get_plex_instance.return_value = plex_mock
+        self.app_mock.get_extra_plex_instances.return_value = []
+        psm = PlexShutdownManager(
+            self.app_mock,
+            clock=lambda: now[0],
+            stale_session_minutes=30,
+            session_reader=lambda plex: [
+                SessionState(key, offset, "playing") for key, offset in offsets.items()
+            ],
+        )
+        self.assertTrue(psm.check_if_are_active_sessions())
+        now[0] += 20 * 60
+        offsets["1"] = 20 * 60 * 1000
+        self.assertTrue(psm.check_if_are_active_sessions())
+        self.assertEqual(psm.session_counts, {PRIMARY_SERVER_NAME: 2})
+        now[0] += 15 * 60
+        self.assertTrue(psm.check_if_are_active_sessions())
+        self.assertEqual(psm.session_counts, {PRIMARY_SERVER_NAME: 1})
+        now[0] += 20 * 60
+        self.assertFalse(psm.check_if_are_active_sessions())
+        # A paused session that resumes counts again
+        offsets["2"] = 1000
+        self.assertTrue(psm.check_if_are_active_sessions())
+
+    def test_40_unreachable_server_policy(self):
+        """Test plex_shutdown_manager backs off an unreachable server, cannot decide during the
+        grace period and counts the server as quiet after it"""
+        now = [0.0]
+        self.app_mock.get_plex_instance.return_value = None
+        self.app_mock.get_extra_plex_instances.return_value = []
+        self.app_mock.reconnect_server.side_effect = ConnectionError("refused")
+        psm = PlexShutdownManager(self.app_mock, clock=lambda: now[0])
+        for _ in range(5):
+            with self.assertRaises(ServersUnavailableError):
+                psm.check_if_are_active_sessions()
+        self.assertEqual(self.app_mock.reconnect_server.call_count, 3)
+        self.assertEqual(psm.metrics.plex_errors[PRIMARY_SERVER_NAME], 3)
+        self.assertEqual(psm.metrics.plex_states[PRIMARY_SERVER_NAME].state, "open")
+        self.assertIn("unreachable", self.app_mock.show_plex_health.call_args[0][0])
+        now[0] += 16 * 60
+        self.assertFalse(psm.check_if_are_active_sessions())
+        self.assertEqual(self.app_mock.reconnect_server.call_count, 4)
+        self.app_mock.reconnect_server.side_effect = None
+        self.app_mock.reconnect_server.return_value.sessions.return_value = ["1"]
+        now[0] += 10 * 60
+        self.assertTrue(psm.check_if_are_active_sessions())
+        self.assertEqual(psm.supervisors[PRIMARY_SERVER_NAME].state, "healthy")
+
+    def test_41_tick_is_logged(self):
+        """Test plex_shutdown_manager logs a check as one record of key=value fields"""
+        psm = PlexShutdownManager(self.app_mock, parallel_probes=False)
+        plex_mock = MagicMock()
+        plex_mock.sessions.return_value = ["1", "2"]
+        self.app_mock.get_plex_instance.return_value = plex_mock
+        self.app_mock.get_extra_plex_instances.return_value = []
+        with patch.object(psm, "minutes_to_seconds", return_value=60), patch.object(
+            psm.idle_source, "idle_seconds", return_value=70
+        ), patch.object(
+            psm, "check_if_transcoder_running", return_value=False
+        ), self.assertLogs(
+            "plex_auto_shutdown.plex_shutdown_manager", "INFO"
+        ) as logs:
+            self.assertEqual(psm.monitor_plex_and_shutdown(), NO_ACTIVATION)
+        (record,) = [r for r in logs.records if r.getMessage() == "Check finished"]
+        self.assertEqual(record.fields["outcome"], "no_activation")
+        self.assertEqual((record.fields["idle"], record.fields["sessions"]), (70, 2))
+        self.assertFalse(record.fields["pending"])
+        self.assertGreaterEqual(record.fields["sessions_ms"], 0)
+        self.assertGreaterEqual(record.fields["tick_ms"], record.fields["sessions_ms"])
+
+    def test_42_skipped_probes_are_unknown(self):
+        """Test plex_shutdown_manager traces a probe skipped by a check as unknown instead of
+        the value of the previous check"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        trace_path = os.path.join(directory.name, "trace.bin")
+        trace_log = TraceLog(trace_path)
+        now = [0.0]
+        psm = PlexShutdownManager(
+            self.app_mock,
+            parallel_probes=False,
+            trace_log=trace_log,
+            clock=lambda: now[0],
+        )
+        plex_mock = MagicMock()
+        plex_mock.sessions.return_value = ["1"]
+        self.app_mock.get_plex_instance.return_value = plex_mock
+        self.app_mock.get_extra_plex_instances.return_value = []
+        with patch.object(psm, "minutes_to_seconds", return_value=60), patch.object(
+            psm.idle_source, "idle_seconds", return_value=70
+        ) as idle_mock, patch.object(
+            psm, "check_if_transcoder_running", return_value=False
+        ):
+            self.assertEqual(psm.monitor_plex_and_shutdown(), NO_ACTIVATION)
+            plex_mock.sessions.return_value = []
+            # The user is back a minute later, the idle probe blocks and the other probes
+            # are skipped
+            now[0] += 60
+            idle_mock.return_value = 10
+            self.assertEqual(psm.monitor_plex_and_shutdown(), NO_ACTIVATION)
+        trace_log.close()
+        busy, active = read_records(trace_path)
+        self.assertEqual(busy.sessions, 1)
+        self.assertEqual((active.idle_seconds, active.sessions), (10, -1))
+        self.assertEqual(active.transcoder, -1)
+        self.assertTrue(math.isnan(active.sessions_latency))
+
+    def test_43_new_transcoder_found_while_stalled_one_runs(self):
+        """Test a transcoder started while a stalled one is still alive keeps the computer on"""
+        now = [0.0]
+        backend = FakeProcessBackend(
+            {10: "Plex Media Server.exe", 20: "Plex Transcoder.exe"},
+            {20: ProcessSample(10.0, 4096)},
+        )
+        psm = PlexShutdownManager(
+            self.app_mock,
+            process_probe=ProcessProbe(backend),
+            transcoder_load=TranscoderLoadProbe(backend, clock=lambda: now[0]),
+        )
+        for _ in range(6):
+            now[0] += 60
+            psm.check_if_transcoder_running()
+        self.assertFalse(psm.check_if_transcoder_running())
+        backend.processes[21] = "Plex Transcoder.exe"
+        backend.samples[21] = ProcessSample(5.0, 0)
+        checks = 1
+        while not psm.check_if_transcoder_running():
+            checks += 1
+            self.assertLessEqual(checks, RESCAN_EVERY)
+        now[0] += 60
+        backend.samples[21] = ProcessSample(35.0, 0)
+        self.assertTrue(psm.check_if_transcoder_running())
+        # The table is not scanned on every check
+        self.assertLess(psm.process_probe.full_scans, 4)
+
+    def test_44_sessions_counted_without_stale_timeout(self):
+        """Test plex_shutdown_manager only counts the sessions when the stale timeout is off
+        and while the alert socket is down"""
+        plex_mock = MagicMock()
+        self.app_mock.get_plex_instance.return_value = plex_mock
+        self.app_mock.get_extra_plex_instances.return_value = []
+        reader = MagicMock(return_value=[])
+        counter = MagicMock(return_value=2)
+        psm = PlexShutdownManager(
+            self.app_mock,
+            stale_session_minutes=0,
+            session_reader=reader,
+            session_counter=counter,
+        )
+        self.assertTrue(psm.check_if_are_active_sessions())
+        self.assertEqual(psm.session_counts, {PRIMARY_SERVER_NAME: 2})
+        psm.use_alerts = True
+        psm.stale_session_minutes = 30
+        with patch("plex_shutdown_manager.AlertSessionTracker") as tracker_mock:
+            tracker_mock.return_value.is_connected.return_value = False
+            counter.return_value = 0
+            self.assertFalse(psm.check_if_are_active_sessions())
+        self.assertEqual(counter.call_count, 2)
+        reader.assert_not_called()
+
+    def test_45_settings_updated_on_next_check(self):
+        """Test settings handed over by another thread only change on the next check"""
+        psm = PlexShutdownManager(self.app_mock, stale_session_minutes=30)
+        psm.update_settings(True, 0)
+        self.assertEqual((psm.use_alerts, psm.stale_session_minutes), (False, 30))
+        psm.start_tick()
+        self.assertEqual((psm.use_alerts, psm.stale_session_minutes), (True, 0))
+        self.assertIsNone(psm.pending_settings)
+
+    def test_46_late_probe_not_recorded(self):
+        """Test a probe that missed its deadline does not write into the recorded check"""
+        release = Event()
+        psm = PlexShutdownManager(self.app_mock)
+        sessions_probe = psm.probe_scheduler.probes["sessions"]
+        sessions_probe.deadline = 0.05
+
+        def late_sessions():
+            release.wait(timeout=1)
+            psm.session_counts = {PRIMARY_SERVER_NAME: 3}
+            return True
+
+        with patch.object(psm, "minutes_to_seconds", return_value=60), patch.object(
+            psm.idle_source, "idle_seconds", return_value=70
+        ), patch.object(
+            psm, "check_if_transcoder_running", return_value=False
+        ), patch.object(
+            psm, "check_if_are_active_sessions", side_effect=late_sessions
+        ):
+            self.assertEqual(psm.monitor_plex_and_shutdown(), UNKNOWN_OUTCOME)
+            release.set()
+            self.assertTrue(sessions_probe.future.result(timeout=1))
+        values = psm.consumed_tick_values()
+        self.assertEqual(psm.session_counts, {PRIMARY_SERVER_NAME: 3})
+        self.assertIsNone(values.sessions)
+        self.assertNotIn("sessions", values.latencies)
+        self.assertIn("transcoder", values.latencies)
+
+    def test_47_alert_listeners_stopped(self):
+        """Test the alert listeners of a removed server, then of every server once alerts
+        are turned off, are stopped"""
+        primary_mock = MagicMock()
+        extra_mock = MagicMock()
+        self.app_mock.get_plex_instance.return_value = primary_mock
+        self.app_mock.get_extra_plex_instances.return_value = [("Den", extra_mock)]
+        psm = PlexShutdownManager(self.app_mock, use_alerts=True)
+
+        def quiet_tracker():
+            tracker = MagicMock()
+            tracker.has_active_sessions.return_value = False
+            return tracker
+
+        with patch(
+            "plex_shutdown_manager.AlertSessionTracker", side_effect=quiet_tracker
+        ):
+            self.assertFalse(psm.check_if_are_active_sessions())
+            trackers = dict(psm.alert_trackers)
+            self.assertEqual(set(trackers), {PRIMARY_SERVER_NAME, "Den"})
+            self.app_mock.get_extra_plex_instances.return_value = []
+            self.assertFalse(psm.check_if_are_active_sessions())
+        trackers["Den"].stop.assert_called_once()
+        self.assertEqual(set(psm.alert_trackers), {PRIMARY_SERVER_NAME})
+        psm.update_settings(False, 120)
+        psm.start_tick()
+        trackers[PRIMARY_SERVER_NAME].stop.assert_called_once()
+        self.assertEqual(psm.alert_trackers, {})
+
 
 if __name__ == "__main__":
     unittest.main()
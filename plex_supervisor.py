@@ -0,0 +1,159 @@
+""" This file contains the connection supervisor of a Plex server, a circuit breaker with exponential backoff that stops the monitor from paying connect timeouts while the server is down """
+from __future__ import annotations
+
+import random
+from time import monotonic
+from typing import NamedTuple
+
+HEALTHY = "healthy"
+DEGRADED = "degraded"
+OPEN = "open"
+HALF_OPEN = "half_open"
+SUPERVISOR_STATES = (HEALTHY, DEGRADED, OPEN, HALF_OPEN)
+
+# Consecutive failures after which the circuit opens and the server is left alone
+FAILURE_THRESHOLD = 3
+# Seconds the circuit stays open after it first opens, doubled on every failed retry
+BASE_BACKOFF = 5
+MAX_BACKOFF = 300
+# Seconds a server can be unreachable before the shutdown decision counts it as quiet,
+# until then a decision that needs it is unknown and no action is taken
+UNREACHABLE_GRACE = 15 * 60
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of contacting a server whose circuit is open"""
+
+
+class SupervisorStatus(NamedTuple):
+    """State and timings of a supervised server, times are on the supervisor clock"""
+
+    name: str
+    state: str
+    failures: int
+    last_error: str | None
+    last_success: float | None
+    down_since: float | None
+    retry_at: float | None
+
+
+class PlexSupervisor:
+    """Supervises the connection to a Plex server. A failure makes the server degraded, and
+    FAILURE_THRESHOLD failures in a row open the circuit: calls fail right away until the
+    backoff runs out. The first call after it is a half-open trial that rebuilds the PlexServer
+    handle through reconnect, its success closes the circuit and its failure opens it again
+    for twice as long, with jitter so several monitors do not retry in step"""
+
+    def __init__(
+        self,
+        name,
+        reconnect,
+        clock=monotonic,
+        on_change=None,
+        failure_threshold=FAILURE_THRESHOLD,
+        base_backoff=BASE_BACKOFF,
+        max_backoff=MAX_BACKOFF,
+        jitter=random.random,
+    ):
+        self.name = name
+        # Returns a new handle of the server, raises if it cannot be reached
+        self.reconnect = reconnect
+        self.clock = clock
+        # Called with the supervisor after every state change
+        self.on_change = on_change
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.state = HEALTHY
+        self.failures = 0
+        self.backoff = base_backoff
+        self.last_error = None
+        self.last_success = None
+        self.down_since = None
+        self.retry_at = None
+
+    def call(self, check, plex):
+        """Returns check(plex), rebuilding the handle first when there is none or the call is
+        a half-open trial. Raises CircuitOpenError while the circuit is open"""
+        now = self.clock()
+        if self.state == OPEN:
+            if now < self.retry_at:
+                raise CircuitOpenError(
+                    f"circuit open, next try in {self.retry_at - now:.0f} seconds"
+                )
+            self.set_state(HALF_OPEN)
+        try:
+            if plex is None or self.state == HALF_OPEN:
+                plex = self.reconnect()
+            result = check(plex)
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+    def record_success(self):
+        """Closes the circuit and resets the backoff"""
+        self.failures = 0
+        self.backoff = self.base_backoff
+        self.last_error = None
+        self.last_success = self.clock()
+        self.down_since = None
+        self.retry_at = None
+        self.set_state(HEALTHY)
+
+    def record_failure(self, error):
+        """Counts a failure, opens the circuit once there are too many in a row"""
+        now = self.clock()
+        self.failures += 1
+        self.last_error = str(error) or type(error).__name__
+        if self.down_since is None:
+            self.down_since = now
+        if self.state == HALF_OPEN:
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+        elif self.failures < self.failure_threshold:
+            self.set_state(DEGRADED)
+            return
+        # Equal jitter, the wait is between half and all of the backoff
+        self.retry_at = now + self.backoff * (0.5 + 0.5 * self.jitter())
+        self.set_state(OPEN)
+
+    def set_state(self, state):
+        """Moves to the given state and reports the change"""
+        changed = state != self.state
+        self.state = state
+        if changed and self.on_change is not None:
+            self.on_change(self)
+
+    def unreachable_for(self):
+        """Returns the seconds since the server stopped answering, 0 while it answers"""
+        if self.down_since is None:
+            return 0
+        return self.clock() - self.down_since
+
+    def status(self):
+        """Returns the state and timings of the server"""
+        return SupervisorStatus(
+            self.name,
+            self.state,
+            self.failures,
+            self.last_error,
+            self.last_success,
+            self.down_since,
+            self.retry_at,
+        )
+
+    def describe(self):
+        """Returns the state as a short text"""
+        if self.state == HEALTHY:
+            return f"{self.name}: connected"
+        if self.state == OPEN:
+            retry = max(0.0, self.retry_at - self.clock())
+            return (
+                f"{self.name}: unreachable for {self.unreachable_for():.0f} s, "
+                f"next try in {retry:.0f} s ({self.last_error})"
+            )
+        if self.state == HALF_OPEN:
+            return f"{self.name}: reconnecting"
+        return f"{self.name}: {self.failures} failed checks ({self.last_error})"
@@ -0,0 +1,90 @@
+""" Test file for plex_supervisor.py """
+import unittest
+from unittest.mock import MagicMock
+
+from plex_supervisor import (
+    DEGRADED,
+    HALF_OPEN,
+    HEALTHY,
+    OPEN,
+    CircuitOpenError,
+    PlexSupervisor,
+)
+
+
+class PlexSupervisorTest(unittest.TestCase):
+    """Test class for plex_supervisor.py"""
+
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.states = []
+        self.reconnect = MagicMock(return_value="new handle")
+        self.supervisor = PlexSupervisor(
+            "Primary",
+            self.reconnect,
+            clock=lambda: self.now,
+            on_change=lambda supervisor: self.states.append(supervisor.state),
+            jitter=lambda: 1.0,
+        )
+
+    def fail(self, plex="handle"):
+        """Runs a failing check through the supervisor"""
+        check = MagicMock(side_effect=ConnectionError("refused"))
+        with self.assertRaises(ConnectionError):
+            self.supervisor.call(check, plex)
+        return check
+
+    def test_01_opens_after_threshold(self):
+        """Test failures degrade the server and the circuit opens after three in a row"""
+        self.fail()
+        self.fail()
+        self.assertEqual(self.supervisor.state, DEGRADED)
+        self.fail()
+        self.assertEqual(self.states, [DEGRADED, OPEN])
+        self.assertEqual(self.supervisor.retry_at, 5)
+        check = MagicMock(return_value=True)
+        with self.assertRaises(CircuitOpenError):
+            self.supervisor.call(check, "handle")
+        check.assert_not_called()
+        self.assertIn("next try in 5 s", self.supervisor.describe())
+
+    def test_02_half_open_trial_reconnects(self):
+        """Test the trial after the backoff rebuilds the handle and closes the circuit"""
+        for _ in range(3):
+            self.fail()
+        self.now = 5
+        check = MagicMock(return_value=False)
+        self.assertFalse(self.supervisor.call(check, "old handle"))
+        check.assert_called_once_with("new handle")
+        self.assertEqual(self.states, [DEGRADED, OPEN, HALF_OPEN, HEALTHY])
+        self.assertEqual(
+            (self.supervisor.failures, self.supervisor.unreachable_for()), (0, 0)
+        )
+        self.assertEqual(self.supervisor.last_success, 5)
+
+    def test_03_backoff_doubles_with_jitter(self):
+        """Test every failed trial doubles the backoff up to the maximum"""
+        jitter = iter([1.0, 1.0, 0.0] + [1.0] * 10)
+        self.supervisor.jitter = lambda: next(jitter)
+        for _ in range(3):
+            self.fail()
+        waits = []
+        for _ in range(8):
+            self.now = self.supervisor.retry_at
+            self.reconnect.side_effect = ConnectionError("refused")
+            self.fail()
+            waits.append(self.supervisor.retry_at - self.now)
+        self.assertEqual(waits, [10, 10, 40, 80, 160, 300, 300, 300])
+        self.assertEqual(self.supervisor.unreachable_for(), sum(waits[:-1]) + 5)
+
+    def test_04_missing_handle_reconnects(self):
+        """Test a server without handle is reconnected before it is checked"""
+        check = MagicMock(return_value=True)
+        self.assertTrue(self.supervisor.call(check, None))
+        check.assert_called_once_with("new handle")
+        self.assertEqual(self.supervisor.state, HEALTHY)
+        self.assertEqual(self.states, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
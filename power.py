@@ -0,0 +1,307 @@
+""" This file contains the backends that schedule and abort the computer shutdown, and the controller that remembers the shutdown it scheduled """
+import ctypes
+import subprocess
+import sys
+from ctypes import wintypes
+from math import ceil
+from threading import Lock
+from time import monotonic, time
+
+from monitor_log import get_logger
+
+log = get_logger(__name__)
+
+SHUTDOWN_MESSAGE = "Plex Auto Shutdown"
+# Win32 values, from <winnt.h>, <winuser.h>, <reason.h> and <winerror.h>
+SE_SHUTDOWN_NAME = "SeShutdownPrivilege"
+SE_PRIVILEGE_ENABLED = 0x00000002
+TOKEN_ADJUST_PRIVILEGES = 0x0020
+TOKEN_QUERY = 0x0008
+SHTDN_REASON_FLAG_PLANNED = 0x80000000
+SHTDN_REASON_MAJOR_OTHER = 0x00000000
+SHTDN_REASON_MINOR_OTHER = 0x00000000
+ERROR_NOT_ALL_ASSIGNED = 1300
+ERROR_NO_SHUTDOWN_IN_PROGRESS = 1116
+# logind D-Bus names
+LOGIND_BUS_NAME = "org.freedesktop.login1"
+LOGIND_OBJECT_PATH = "/org/freedesktop/login1"
+LOGIND_INTERFACE = "org.freedesktop.login1.Manager"
+# Fixed-width Win32 types of the structs, wintypes uses c_ulong which is 8 bytes off Windows
+DWORD = ctypes.c_uint32
+LONG = ctypes.c_int32
+
+
+class LUID(ctypes.Structure):
+    """Struct of a locally unique identifier, two 32-bit halves so it is only 4-byte aligned."""
+
+    _fields_ = [("LowPart", DWORD), ("HighPart", LONG)]
+
+
+class LUID_AND_ATTRIBUTES(ctypes.Structure):
+    """Struct of a privilege and its state."""
+
+    _fields_ = [("Luid", LUID), ("Attributes", DWORD)]
+
+
+class TOKEN_PRIVILEGES(ctypes.Structure):
+    """Struct of the privileges to change."""
+
+    _fields_ = [
+        ("PrivilegeCount", DWORD),
+        ("Privileges", LUID_AND_ATTRIBUTES * 1),
+    ]
+
+
+class PowerBackend:
+    """Interface of the operating system call that schedules or aborts a shutdown"""
+
+    def schedule_shutdown(self, delay_seconds):
+        """Schedules the shutdown in the given number of seconds, raises OSError on failure"""
+        raise NotImplementedError
+
+    def abort_shutdown(self):
+        """Aborts the scheduled shutdown, raises OSError on failure"""
+        raise NotImplementedError
+
+
+class WindowsPowerBackend(PowerBackend):
+    """Calls InitiateSystemShutdownEx and AbortSystemShutdown in process"""
+
+    def __init__(self):
+        self.advapi32 = ctypes.WinDLL("advapi32", use_last_error=True)
+        self.kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        self.declare_functions()
+        self.privilege_enabled = False
+
+    def declare_functions(self):
+        """Declares the signatures of the Win32 calls, so handles are not truncated to int"""
+        advapi32 = self.advapi32
+        kernel32 = self.kernel32
+        advapi32.OpenProcessToken.argtypes = [
+            wintypes.HANDLE,
+            wintypes.DWORD,
+            ctypes.POINTER(wintypes.HANDLE),
+        ]
+        advapi32.OpenProcessToken.restype = wintypes.BOOL
+        advapi32.LookupPrivilegeValueW.argtypes = [
+            wintypes.LPCWSTR,
+            wintypes.LPCWSTR,
+            ctypes.POINTER(LUID),
+        ]
+        advapi32.LookupPrivilegeValueW.restype = wintypes.BOOL
+        advapi32.AdjustTokenPrivileges.argtypes = [
+            wintypes.HANDLE,
+            wintypes.BOOL,
+            ctypes.POINTER(TOKEN_PRIVILEGES),
+            wintypes.DWORD,
+            ctypes.POINTER(TOKEN_PRIVILEGES),
+            ctypes.POINTER(wintypes.DWORD),
+        ]
+        advapi32.AdjustTokenPrivileges.restype = wintypes.BOOL
+        advapi32.InitiateSystemShutdownExW.argtypes = [
+            wintypes.LPWSTR,
+            wintypes.LPWSTR,
+            wintypes.DWORD,
+            wintypes.BOOL,
+            wintypes.BOOL,
+            wintypes.DWORD,
+        ]
+        advapi32.InitiateSystemShutdownExW.restype = wintypes.BOOL
+        advapi32.AbortSystemShutdownW.argtypes = [wintypes.LPWSTR]
+        advapi32.AbortSystemShutdownW.restype = wintypes.BOOL
+        kernel32.GetCurrentProcess.argtypes = []
+        kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+        kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+        kernel32.CloseHandle.restype = wintypes.BOOL
+
+    def enable_shutdown_privilege(self):
+        """Enables the shutdown privilege of the process, which both calls need"""
+        if self.privilege_enabled:
+            return
+        kernel32 = self.kernel32
+        token = wintypes.HANDLE()
+        if not self.advapi32.OpenProcessToken(
+            kernel32.GetCurrentProcess(),
+            TOKEN_ADJUST_PRIVILEGES | TOKEN_QUERY,
+            ctypes.byref(token),
+        ):
+            raise ctypes.WinError(ctypes.get_last_error())
+        try:
+            privileges = TOKEN_PRIVILEGES(1)
+            privileges.Privileges[0].Attributes = SE_PRIVILEGE_ENABLED
+            if not self.advapi32.LookupPrivilegeValueW(
+                None, SE_SHUTDOWN_NAME, ctypes.byref(privileges.Privileges[0].Luid)
+            ):
+                raise ctypes.WinError(ctypes.get_last_error())
+            adjusted = self.advapi32.AdjustTokenPrivileges(
+                token, False, ctypes.byref(privileges), 0, None, None
+            )
+            if not adjusted:
+                raise ctypes.WinError(ctypes.get_last_error())
+            # AdjustTokenPrivileges also succeeds when the privilege was not granted
+            if ctypes.get_last_error() == ERROR_NOT_ALL_ASSIGNED:
+                raise ctypes.WinError(ERROR_NOT_ALL_ASSIGNED)
+        finally:
+            kernel32.CloseHandle(token)
+        self.privilege_enabled = True
+
+    def schedule_shutdown(self, delay_seconds):
+        """Schedules the shutdown in the given number of seconds, raises OSError on failure"""
+        self.enable_shutdown_privilege()
+        if not self.advapi32.InitiateSystemShutdownExW(
+            None,
+            SHUTDOWN_MESSAGE,
+            int(delay_seconds),
+            False,
+            False,
+            wintypes.DWORD(
+                SHTDN_REASON_FLAG_PLANNED
+                | SHTDN_REASON_MAJOR_OTHER
+                | SHTDN_REASON_MINOR_OTHER
+            ),
+        ):
+            raise ctypes.WinError(ctypes.get_last_error())
+
+    def abort_shutdown(self):
+        """Aborts the scheduled shutdown, raises OSError on failure"""
+        self.enable_shutdown_privilege()
+        if not self.advapi32.AbortSystemShutdownW(None):
+            error = ctypes.get_last_error()
+            # Nothing to abort is what was asked for
+            if error != ERROR_NO_SHUTDOWN_IN_PROGRESS:
+                raise ctypes.WinError(error)
+
+
+class LogindPowerBackend(PowerBackend):
+    """Calls ScheduleShutdown and CancelScheduledShutdown of systemd-logind over the system
+    D-Bus, the connection is opened on the first call"""
+
+    def __init__(self):
+        # pylint: disable=import-outside-toplevel
+        from jeepney import DBusAddress
+
+        self.address = DBusAddress(
+            LOGIND_OBJECT_PATH, bus_name=LOGIND_BUS_NAME, interface=LOGIND_INTERFACE
+        )
+        self.connection = None
+
+    def call(self, method, signature="", body=()):
+        """Calls a logind method and returns its reply, D-Bus failures are raised as OSError"""
+        # pylint: disable=import-outside-toplevel
+        from jeepney import DBusErrorResponse, new_method_call, unwrap_msg
+        from jeepney.io.blocking import open_dbus_connection
+
+        try:
+            if self.connection is None:
+                self.connection = open_dbus_connection(bus="SYSTEM")
+            reply = self.connection.send_and_get_reply(
+                new_method_call(self.address, method, signature, body)
+            )
+        except OSError as e:
+            self.connection = None
+            raise OSError(f"Cannot reach logind: {e}") from e
+        try:
+            return unwrap_msg(reply)
+        except DBusErrorResponse as e:
+            raise OSError(f"logind {method} failed: {e}") from e
+
+    def schedule_shutdown(self, delay_seconds):
+        """Schedules the shutdown in the given number of seconds, raises OSError on failure"""
+        # logind takes the wall clock time of the shutdown in microseconds
+        when = int((time() + delay_seconds) * 1_000_000)
+        self.call("ScheduleShutdown", "st", ("poweroff", when))
+
+    def abort_shutdown(self):
+        """Aborts the scheduled shutdown, raises OSError on failure"""
+        self.call("CancelScheduledShutdown")
+
+
+class CommandPowerBackend(PowerBackend):
+    """Runs the shutdown command, used when no in-process call is available"""
+
+    def schedule_shutdown(self, delay_seconds):
+        """Schedules the shutdown in the given number of seconds, raises OSError on failure"""
+        # The POSIX shutdown command only takes whole minutes
+        self.run(["shutdown", "-h", f"+{ceil(delay_seconds / 60)}"])
+
+    def abort_shutdown(self):
+        """Aborts the scheduled shutdown, raises OSError on failure"""
+        self.run(["shutdown", "-c"])
+
+    def run(self, command):
+        """Runs the command, a failure exit code is raised as OSError"""
+        try:
+            subprocess.run(command, check=True)
+        except subprocess.CalledProcessError as e:
+            raise OSError(f"{' '.join(command)} failed with exit code {e.returncode}")
+
+
+class DryRunPowerBackend(PowerBackend):
+    """Records the calls instead of touching the computer, used by the tests and the benchmarks.
+    Every call raises the error when one is set"""
+
+    def __init__(self, error: OSError = None):
+        self.calls = []
+        self.error = error
+
+    def schedule_shutdown(self, delay_seconds):
+        """Records the scheduled shutdown"""
+        if self.error is not None:
+            raise self.error
+        self.calls.append(("schedule", delay_seconds))
+
+    def abort_shutdown(self):
+        """Records the aborted shutdown"""
+        if self.error is not None:
+            raise self.error
+        self.calls.append(("abort", None))
+
+
+def default_power_backend() -> PowerBackend:
+    """Returns the in-process backend of the platform, the shutdown command when there is none"""
+    if sys.platform == "win32":
+        return WindowsPowerBackend()
+    if sys.platform.startswith("linux"):
+        try:
+            return LogindPowerBackend()
+        except ImportError:
+            log.info(
+                "jeepney is not installed, scheduling the shutdown with the command"
+            )
+    return CommandPowerBackend()
+
+
+class PowerController:
+    """Schedules and aborts the shutdown through a backend and remembers the shutdown it
+    scheduled, so arming twice or canceling when nothing is pending makes no call"""
+
+    def __init__(self, backend: PowerBackend = None, clock=monotonic):
+        self.backend = backend or default_power_backend()
+        self.clock = clock
+        self.lock = Lock()
+        self.deadline = None
+
+    @property
+    def pending(self):
+        """Returns true if a shutdown scheduled by this controller was not aborted"""
+        return self.deadline is not None
+
+    def arm(self, delay_seconds):
+        """Schedules the shutdown unless one is pending, returns true if it was scheduled.
+        A failure of the backend is raised as OSError"""
+        with self.lock:
+            if self.deadline is not None:
+                return False
+            self.backend.schedule_shutdown(delay_seconds)
+            self.deadline = self.clock() + delay_seconds
+            return True
+
+    def cancel(self):
+        """Aborts the pending shutdown, returns true if one was aborted.
+        A failure of the backend is raised as OSError"""
+        with self.lock:
+            if self.deadline is None:
+                return False
+            self.backend.abort_shutdown()
+            self.deadline = None
+            return True
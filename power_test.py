@@ -0,0 +1,76 @@
+""" Test file for power.py """
+import ctypes
+import subprocess
+import unittest
+from unittest.mock import patch
+
+from power import (
+    LUID_AND_ATTRIBUTES,
+    TOKEN_PRIVILEGES,
+    CommandPowerBackend,
+    DryRunPowerBackend,
+    PowerController,
+)
+
+
+class PowerControllerTest(unittest.TestCase):
+    """Test class for power.py"""
+
+    def setUp(self) -> None:
+        self.backend = DryRunPowerBackend()
+        self.now = 100.0
+        self.power = PowerController(self.backend, clock=lambda: self.now)
+
+    def test_01_arm_once(self):
+        """Test a second arm while the shutdown is pending makes no call"""
+        self.assertTrue(self.power.arm(60))
+        self.assertFalse(self.power.arm(60))
+        self.assertTrue(self.power.pending)
+        self.assertEqual(self.power.deadline, 160)
+        self.assertEqual(self.backend.calls, [("schedule", 60)])
+
+    def test_02_cancel_only_pending(self):
+        """Test cancel makes a call only when this controller scheduled the shutdown"""
+        self.assertFalse(self.power.cancel())
+        self.power.arm(60)
+        self.assertTrue(self.power.cancel())
+        self.assertFalse(self.power.cancel())
+        self.assertFalse(self.power.pending)
+        self.assertEqual(self.backend.calls, [("schedule", 60), ("abort", None)])
+
+    def test_03_failed_call_keeps_state(self):
+        """Test a failing backend leaves the pending state unchanged"""
+        self.backend.error = PermissionError("denied")
+        with self.assertRaises(OSError):
+            self.power.arm(60)
+        self.assertFalse(self.power.pending)
+        self.backend.error = None
+        self.power.arm(60)
+        self.backend.error = PermissionError("denied")
+        with self.assertRaises(OSError):
+            self.power.cancel()
+        self.assertTrue(self.power.pending)
+
+    def test_04_command_backend(self):
+        """Test the command backend rounds the delay up to minutes and reports failures"""
+        backend = CommandPowerBackend()
+        with patch("power.subprocess.run") as run_mock:
+            backend.schedule_shutdown(90)
+            backend.abort_shutdown()
+        self.assertEqual(run_mock.call_args_list[0].args[0], ["shutdown", "-h", "+2"])
+        self.assertEqual(run_mock.call_args_list[1].args[0], ["shutdown", "-c"])
+        with patch(
+            "power.subprocess.run",
+            side_effect=subprocess.CalledProcessError(1, "shutdown"),
+        ), self.assertRaises(OSError):
+            backend.abort_shutdown()
+
+    def test_05_privilege_struct_layout(self):
+        """Test the privilege structs have the Win32 layout, a LUID is only 4-byte aligned"""
+        self.assertEqual(ctypes.sizeof(LUID_AND_ATTRIBUTES), 12)
+        self.assertEqual(ctypes.sizeof(TOKEN_PRIVILEGES), 16)
+        self.assertEqual(TOKEN_PRIVILEGES.Privileges.offset, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,232 @@
+""" This file contains the cost-aware scheduler of the probes used by the shutdown decision """
+from __future__ import annotations
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from time import monotonic, perf_counter
+
+from monitor_log import get_logger
+
+log = get_logger(__name__)
+
+COST_SMOOTHING = 0.3
+# Probes expected to be faster than this, in seconds, run inline since a thread hop costs more
+INLINE_COST = 0.0005
+# Result of a probe that failed or missed its deadline
+UNKNOWN = "unknown"
+
+
+class Probe:
+    """A check used by the shutdown decision. cost is the expected latency in seconds, ttl
+    how long, in seconds, a result can be reused and deadline how long, in seconds, a parallel
+    run is waited for. A probe blocks the shutdown when its result equals blocking_result"""
+
+    future: Future = None
+    # Called with the name and the latency in seconds of every run, failed runs included
+    observer = None
+
+    def __init__(self, name, check, cost, ttl, deadline=None, blocking_result=True):
+        self.name = name
+        self.check = check
+        self.cost = cost
+        self.ttl = ttl
+        self.deadline = deadline
+        self.blocking_result = blocking_result
+        self.value = None
+        self.timestamp = None
+        self.hits = 0
+        self.misses = 0
+        self.blocked = 0
+        self.unknown = 0
+        self.total_latency = 0.0
+        self.last_latency = 0.0
+
+    def is_fresh(self, now):
+        """Returns true if the cached result can still be used"""
+        return self.timestamp is not None and now - self.timestamp < self.ttl
+
+    def blocking_probability(self):
+        """Returns the estimated chance of this probe blocking the shutdown"""
+        return (self.blocked + 1) / (self.misses + 2)
+
+    def priority(self, now):
+        """Returns the evaluation priority, lower runs first. Fresh results are free, otherwise
+        cheap probes that usually decide the outcome go first"""
+        if self.is_fresh(now):
+            return 0.0
+        return self.cost / self.blocking_probability()
+
+    def run(self, now):
+        """Runs the check and caches its result, returns UNKNOWN if the check failed"""
+        start = perf_counter()
+        try:
+            value = self.check()
+        except Exception as e:
+            log.warning("Error running the %s probe: %s", self.name, e)
+            self.unknown += 1
+            if self.observer is not None:
+                self.observer(self.name, perf_counter() - start)
+            return UNKNOWN
+        latency = perf_counter() - start
+        if self.observer is not None:
+            self.observer(self.name, latency)
+        self.value = value
+        self.timestamp = now
+        self.misses += 1
+        if self.value == self.blocking_result:
+            self.blocked += 1
+        self.total_latency += latency
+        self.last_latency = latency
+        self.cost += COST_SMOOTHING * (latency - self.cost)
+        return self.value
+
+    def stats(self):
+        """Returns the hit/miss and latency stats of the probe"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "unknown": self.unknown,
+            "cost": self.cost,
+            "last_latency": self.last_latency,
+            "mean_latency": self.total_latency / self.misses if self.misses else 0.0,
+        }
+
+
+class ProbeExecutor:
+    """Small thread pool running the slow probes at the same time. A probe still running from
+    an earlier tick is waited on again instead of being started twice"""
+
+    def __init__(self, max_workers):
+        self.pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="probe"
+        )
+
+    def submit(self, probe: Probe, now):
+        """Starts the probe unless it is still running, returns its future"""
+        if probe.future is None or probe.future.done():
+            probe.future = self.pool.submit(probe.run, now)
+        return probe.future
+
+    def shutdown(self):
+        """Stops the workers without waiting for the running probes"""
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ProbeScheduler:
+    """Evaluates probes cheapest and most decisive first, reusing fresh cached results and
+    stopping as soon as one of them blocks the shutdown. With an executor the slow probes
+    run at the same time, each one waited for until its own deadline. observer is called with
+    the name and latency of every probe run"""
+
+    def __init__(
+        self, probes, clock=monotonic, executor: ProbeExecutor = None, observer=None
+    ):
+        self.probes = {probe.name: probe for probe in probes}
+        for probe in self.probes.values():
+            probe.observer = observer
+        self.clock = clock
+        self.executor = executor
+        # Names of the probes whose results evaluate used since clear_consumed
+        self.consumed = set()
+
+    def clear_consumed(self):
+        """Forgets which probe results evaluate used"""
+        self.consumed = set()
+
+    def result(self, name):
+        """Returns the result of the probe, from the cache if it is still fresh, or UNKNOWN"""
+        probe = self.probes[name]
+        now = self.clock()
+        if probe.is_fresh(now):
+            probe.hits += 1
+            return probe.value
+        return probe.run(now)
+
+    def evaluate(self, names):
+        """Returns the name of the first probe that blocks the shutdown, None if no probe does
+        or UNKNOWN if no probe blocks but some of them failed or missed their deadline"""
+        now = self.clock()
+        ordered = sorted(names, key=lambda name: self.probes[name].priority(now))
+        parallel = []
+        unknown = False
+        for name in ordered:
+            probe = self.probes[name]
+            if (
+                self.executor is not None
+                and not probe.is_fresh(now)
+                and probe.cost > INLINE_COST
+            ):
+                parallel.append(probe)
+                continue
+            value = self.result(name)
+            self.consumed.add(name)
+            if value == UNKNOWN:
+                unknown = True
+            elif value == probe.blocking_result:
+                return name
+        if parallel:
+            outcome = self.evaluate_parallel(parallel, now)
+            if outcome is not None:
+                return outcome
+        return UNKNOWN if unknown else None
+
+    def evaluate_parallel(self, probes, now):
+        """Runs the probes at the same time and returns like evaluate, without waiting
+        for the other probes once one of them blocks the shutdown"""
+        start = perf_counter()
+        futures = {self.executor.submit(probe, now): probe for probe in probes}
+        pending = set(futures)
+        unknown = False
+        while pending:
+            elapsed = perf_counter() - start
+            expired = {
+                future
+                for future in pending
+                if futures[future].deadline is not None
+                and elapsed >= futures[future].deadline
+            }
+            if expired:
+                for future in expired:
+                    log.warning(
+                        "The %s probe missed its deadline", futures[future].name
+                    )
+                    futures[future].unknown += 1
+                unknown = True
+                pending -= expired
+                continue
+            deadlines = [
+                futures[future].deadline - elapsed
+                for future in pending
+                if futures[future].deadline is not None
+            ]
+            done, pending = wait(
+                pending,
+                timeout=min(deadlines) if deadlines else None,
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                probe = futures[future]
+                value = future.result()
+                self.consumed.add(probe.name)
+                if value == UNKNOWN:
+                    unknown = True
+                elif value == probe.blocking_result:
+                    return probe.name
+        return UNKNOWN if unknown else None
+
+    def invalidate(self, name=None):
+        """Drops the cached result of the given probe, or of every probe"""
+        probes = [self.probes[name]] if name else self.probes.values()
+        for probe in probes:
+            probe.timestamp = None
+
+    def stats(self):
+        """Returns the stats of every probe"""
+        return {name: probe.stats() for name, probe in self.probes.items()}
+
+    def format_stats(self):
+        """Returns the stats of every probe as a single line"""
+        return ", ".join(
+            f"{name}: {stats['hits']} hits/{stats['misses']} misses "
+            f"{stats['mean_latency'] * 1000:.2f}ms"
+            for name, stats in self.stats().items()
+        )
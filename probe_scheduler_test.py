@@ -0,0 +1,126 @@
+""" Test file for probe_scheduler.py """
+import unittest
+from time import perf_counter, sleep
+from unittest.mock import MagicMock
+
+from probe_scheduler import UNKNOWN, Probe, ProbeExecutor, ProbeScheduler
+
+
+def slow_check(seconds, value):
+    """Returns a check that takes the given seconds to return the value"""
+
+    def check():
+        sleep(seconds)
+        return value
+
+    return check
+
+
+class ProbeSchedulerTest(unittest.TestCase):
+    """Test class for probe_scheduler.py"""
+
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.cheap = MagicMock(return_value=False)
+        self.expensive = MagicMock(return_value=True)
+        self.scheduler = ProbeScheduler(
+            [
+                Probe("expensive", self.expensive, cost=1.0, ttl=10),
+                Probe("cheap", self.cheap, cost=0.001, ttl=0),
+            ],
+            clock=lambda: self.now,
+        )
+
+    def test_01_cheapest_probe_first(self):
+        """Test that the cheapest probe is evaluated first"""
+        self.cheap.return_value = True
+        self.assertEqual(self.scheduler.evaluate(["expensive", "cheap"]), "cheap")
+        self.expensive.assert_not_called()
+
+    def test_02_fresh_results_are_reused(self):
+        """Test that fresh results are served from the cache until the ttl expires"""
+        self.assertEqual(self.scheduler.evaluate(["expensive", "cheap"]), "expensive")
+        self.now = 5
+        self.assertEqual(self.scheduler.evaluate(["expensive", "cheap"]), "expensive")
+        self.assertEqual(self.expensive.call_count, 1)
+        self.now = 10
+        self.scheduler.evaluate(["expensive"])
+        self.assertEqual(self.expensive.call_count, 2)
+        stats = self.scheduler.stats()["expensive"]
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+
+    def test_03_fresh_result_goes_first(self):
+        """Test that a fresh cached blocking result short-circuits the cheaper probes"""
+        self.scheduler.result("expensive")
+        self.assertEqual(self.scheduler.evaluate(["cheap", "expensive"]), "expensive")
+        self.cheap.assert_not_called()
+
+    def test_04_no_blocking_probe(self):
+        """Test that None is returned when no probe blocks"""
+        self.expensive.return_value = False
+        self.assertIsNone(self.scheduler.evaluate(["cheap", "expensive"]))
+
+    def test_05_invalidate(self):
+        """Test that invalidated results are checked again"""
+        self.scheduler.result("expensive")
+        self.scheduler.invalidate("expensive")
+        self.scheduler.result("expensive")
+        self.assertEqual(self.expensive.call_count, 2)
+
+    def test_06_failed_probe_is_unknown(self):
+        """Test that a probe raising an error gives an unknown outcome"""
+        self.expensive.side_effect = ConnectionError("Plex is down")
+        self.assertEqual(self.scheduler.evaluate(["cheap", "expensive"]), UNKNOWN)
+
+    def test_07_parallel_latency_is_the_max(self):
+        """Test that parallel probes cost the slowest probe, not the sum"""
+        executor = ProbeExecutor(max_workers=3)
+        scheduler = ProbeScheduler(
+            [
+                Probe(name, slow_check(0.2, False), cost=0.1, ttl=0, deadline=1)
+                for name in ("a", "b", "c")
+            ],
+            executor=executor,
+        )
+        start = perf_counter()
+        self.assertIsNone(scheduler.evaluate(["a", "b", "c"]))
+        self.assertLess(perf_counter() - start, 0.5)
+        executor.shutdown()
+
+    def test_08_parallel_deadline_is_unknown(self):
+        """Test that a probe missing its deadline gives an unknown outcome and its result is
+        not counted as used"""
+        executor = ProbeExecutor(max_workers=2)
+        scheduler = ProbeScheduler(
+            [
+                Probe("fast", slow_check(0.01, False), cost=0.1, ttl=0, deadline=1),
+                Probe("slow", slow_check(0.5, False), cost=0.1, ttl=0, deadline=0.05),
+            ],
+            executor=executor,
+        )
+        start = perf_counter()
+        self.assertEqual(scheduler.evaluate(["fast", "slow"]), UNKNOWN)
+        self.assertLess(perf_counter() - start, 0.3)
+        self.assertEqual(scheduler.consumed, {"fast"})
+        scheduler.clear_consumed()
+        self.assertEqual(scheduler.consumed, set())
+        executor.shutdown()
+
+    def test_09_parallel_blocking_short_circuits(self):
+        """Test that a blocking probe decides without waiting for the slow ones"""
+        executor = ProbeExecutor(max_workers=2)
+        scheduler = ProbeScheduler(
+            [
+                Probe("fast", slow_check(0.01, True), cost=0.1, ttl=0, deadline=1),
+                Probe("slow", slow_check(0.5, False), cost=0.1, ttl=0, deadline=1),
+            ],
+            executor=executor,
+        )
+        start = perf_counter()
+        self.assertEqual(scheduler.evaluate(["fast", "slow"]), "fast")
+        self.assertLess(perf_counter() - start, 0.3)
+        executor.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,454 @@
+"""This file contains the in-process probe used to check if the Plex processes are running"""
+
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+from collections import deque
+from ctypes import (
+    POINTER,
+    Structure,
+    byref,
+    c_size_t,
+    c_ulonglong,
+    c_void_p,
+    create_unicode_buffer,
+    sizeof,
+)
+from ctypes import wintypes
+from time import monotonic
+from typing import NamedTuple
+
+PLEX_SERVER_PROCESS = "Plex Media Server"
+PLEX_TRANSCODER_PROCESS = "Plex Transcoder"
+PLEX_PROCESSES = (PLEX_SERVER_PROCESS, PLEX_TRANSCODER_PROCESS)
+
+# Linux truncates /proc/<pid>/comm to 15 characters
+PROC_COMM_LENGTH = 15
+# Checks between two full scans looking for processes started since the last one
+RESCAN_EVERY = 5
+
+# Load of a transcoder, from the rate of its CPU time and I/O over the sample window
+TRANSCODER_ACTIVE = "active"
+TRANSCODER_IDLE = "idle"
+TRANSCODER_STALLED = "stalled"
+# Samples kept per transcoder, the rate is measured from the oldest to the newest
+LOAD_SAMPLE_WINDOW = 6
+# CPU seconds per second or bytes per second above which a transcoder is active
+ACTIVE_CPU_RATE = 0.02
+ACTIVE_IO_RATE = 32 * 1024
+# Seconds without any CPU time or I/O after which an idle transcoder is stalled
+STALL_SECONDS = 120
+# CPU seconds a stalled transcoder may still use, the clock tick of the counters
+STALL_CPU_SECONDS = 0.01
+
+
+class ProcessSample(NamedTuple):
+    """Counters of a process, io_bytes is None when they cannot be read"""
+
+    cpu_seconds: float
+    io_bytes: int | None
+
+
+def normalize_process_name(name):
+    """Returns the lowercase image name without its directory and .exe extension"""
+    name = name.replace("\\", "/").rsplit("/", 1)[-1].lower()
+    if name.endswith(".exe"):
+        name = name[:-4]
+    return name
+
+
+class ProcessBackend:
+    """Base class for the process table backends"""
+
+    def list_processes(self):
+        """Returns an iterable of (pid, image name) for every running process"""
+        raise NotImplementedError
+
+    def is_running(self, pid, name):
+        """Returns true if the process with the given pid is still alive and has the given name"""
+        raise NotImplementedError
+
+    def sample(self, pid):
+        """Returns the CPU time and I/O counters of the process, None when they cannot be read"""
+        return None
+
+
+class ProcfsBackend(ProcessBackend):
+    """Reads the process table from the Linux /proc filesystem"""
+
+    def __init__(self, proc_path="/proc"):
+        self.proc_path = proc_path
+        self.clock_ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def process_name(self, pid):
+        """Returns the image name of the process, None if it is gone"""
+        try:
+            with open(f"{self.proc_path}/{pid}/cmdline", "rb") as cmdline:
+                argv0 = cmdline.read().split(b"\0", 1)[0]
+            if argv0:
+                return argv0.decode("utf-8", "replace")
+            with open(f"{self.proc_path}/{pid}/comm", "rb") as comm:
+                return comm.read().strip().decode("utf-8", "replace")
+        except OSError:
+            return None
+
+    def list_processes(self):
+        for entry in os.listdir(self.proc_path):
+            if entry.isdigit():
+                name = self.process_name(entry)
+                if name is not None:
+                    yield int(entry), name
+
+    def is_running(self, pid, name):
+        image = self.process_name(pid)
+        return image is not None and process_matches(image, name)
+
+    def sample(self, pid):
+        try:
+            with open(f"{self.proc_path}/{pid}/stat", "rb") as stat:
+                # The name in parentheses may contain spaces, the fields follow the last one
+                fields = stat.read().rsplit(b")", 1)[1].split()
+        except (OSError, IndexError):
+            return None
+        # utime and stime, fields 14 and 15 of proc(5) counted from the state field
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / self.clock_ticks
+        try:
+            with open(f"{self.proc_path}/{pid}/io", "rb") as io_file:
+                counters = dict(
+                    line.split(b":", 1) for line in io_file.read().splitlines()
+                )
+            io_bytes = int(counters[b"rchar"]) + int(counters[b"wchar"])
+        except (OSError, KeyError, ValueError):
+            # /proc/<pid>/io is only readable by the owner of the process or by root
+            io_bytes = None
+        return ProcessSample(cpu_seconds, io_bytes)
+
+
+class PROCESSENTRY32W(Structure):
+    """Struct filled by Process32FirstW/Process32NextW"""
+
+    _fields_ = [
+        ("dwSize", wintypes.DWORD),
+        ("cntUsage", wintypes.DWORD),
+        ("th32ProcessID", wintypes.DWORD),
+        ("th32DefaultHeapID", c_size_t),
+        ("th32ModuleID", wintypes.DWORD),
+        ("cntThreads", wintypes.DWORD),
+        ("th32ParentProcessID", wintypes.DWORD),
+        ("pcPriClassBase", wintypes.LONG),
+        ("dwFlags", wintypes.DWORD),
+        ("szExeFile", wintypes.WCHAR * 260),
+    ]
+
+
+class FILETIME(Structure):
+    """Struct filled by GetProcessTimes, in 100 ns units"""
+
+    _fields_ = [
+        ("dwLowDateTime", wintypes.DWORD),
+        ("dwHighDateTime", wintypes.DWORD),
+    ]
+
+    def seconds(self):
+        """Returns the time in seconds"""
+        return ((self.dwHighDateTime << 32) | self.dwLowDateTime) / 10_000_000
+
+
+class IO_COUNTERS(Structure):
+    """Struct filled by GetProcessIoCounters"""
+
+    _fields_ = [
+        ("ReadOperationCount", c_ulonglong),
+        ("WriteOperationCount", c_ulonglong),
+        ("OtherOperationCount", c_ulonglong),
+        ("ReadTransferCount", c_ulonglong),
+        ("WriteTransferCount", c_ulonglong),
+        ("OtherTransferCount", c_ulonglong),
+    ]
+
+
+class ToolhelpBackend(ProcessBackend):
+    """Reads the process table through the Win32 toolhelp snapshot API"""
+
+    TH32CS_SNAPPROCESS = 0x00000002
+    PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+    STILL_ACTIVE = 259
+    # A HANDLE restype converts the returned pointer to an unsigned int
+    INVALID_HANDLE_VALUE = c_void_p(-1).value
+
+    def __init__(self):
+        # pylint: disable=import-outside-toplevel
+        from ctypes import WinDLL
+
+        self.kernel32 = WinDLL("kernel32", use_last_error=True)
+        self.declare_functions()
+
+    def declare_functions(self):
+        """Declares the signatures of the Win32 calls, so handles are not truncated to int"""
+        kernel32 = self.kernel32
+        kernel32.CreateToolhelp32Snapshot.argtypes = [wintypes.DWORD, wintypes.DWORD]
+        kernel32.CreateToolhelp32Snapshot.restype = wintypes.HANDLE
+        for function in (kernel32.Process32FirstW, kernel32.Process32NextW):
+            function.argtypes = [wintypes.HANDLE, POINTER(PROCESSENTRY32W)]
+            function.restype = wintypes.BOOL
+        kernel32.OpenProcess.argtypes = [wintypes.DWORD, wintypes.BOOL, wintypes.DWORD]
+        kernel32.OpenProcess.restype = wintypes.HANDLE
+        kernel32.GetExitCodeProcess.argtypes = [
+            wintypes.HANDLE,
+            POINTER(wintypes.DWORD),
+        ]
+        kernel32.GetExitCodeProcess.restype = wintypes.BOOL
+        kernel32.QueryFullProcessImageNameW.argtypes = [
+            wintypes.HANDLE,
+            wintypes.DWORD,
+            wintypes.LPWSTR,
+            POINTER(wintypes.DWORD),
+        ]
+        kernel32.QueryFullProcessImageNameW.restype = wintypes.BOOL
+        kernel32.GetProcessTimes.argtypes = [wintypes.HANDLE] + [POINTER(FILETIME)] * 4
+        kernel32.GetProcessTimes.restype = wintypes.BOOL
+        kernel32.GetProcessIoCounters.argtypes = [
+            wintypes.HANDLE,
+            POINTER(IO_COUNTERS),
+        ]
+        kernel32.GetProcessIoCounters.restype = wintypes.BOOL
+        kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+        kernel32.CloseHandle.restype = wintypes.BOOL
+
+    def list_processes(self):
+        snapshot = self.kernel32.CreateToolhelp32Snapshot(
+            ToolhelpBackend.TH32CS_SNAPPROCESS, 0
+        )
+        if snapshot is None or snapshot == ToolhelpBackend.INVALID_HANDLE_VALUE:
+            raise OSError("CreateToolhelp32Snapshot failed")
+        processes = []
+        try:
+            entry = PROCESSENTRY32W()
+            entry.dwSize = sizeof(PROCESSENTRY32W)
+            found = self.kernel32.Process32FirstW(snapshot, byref(entry))
+            while found:
+                processes.append((entry.th32ProcessID, entry.szExeFile))
+                found = self.kernel32.Process32NextW(snapshot, byref(entry))
+        finally:
+            self.kernel32.CloseHandle(snapshot)
+        return processes
+
+    def is_running(self, pid, name):
+        handle = self.kernel32.OpenProcess(
+            ToolhelpBackend.PROCESS_QUERY_LIMITED_INFORMATION, False, pid
+        )
+        if not handle:
+            return False
+        try:
+            exit_code = wintypes.DWORD()
+            if not self.kernel32.GetExitCodeProcess(handle, byref(exit_code)):
+                return False
+            if exit_code.value != ToolhelpBackend.STILL_ACTIVE:
+                return False
+            image = create_unicode_buffer(1024)
+            size = wintypes.DWORD(len(image))
+            if not self.kernel32.QueryFullProcessImageNameW(
+                handle, 0, image, byref(size)
+            ):
+                return False
+            return process_matches(image.value, name)
+        finally:
+            self.kernel32.CloseHandle(handle)
+
+    def sample(self, pid):
+        handle = self.kernel32.OpenProcess(
+            ToolhelpBackend.PROCESS_QUERY_LIMITED_INFORMATION, False, pid
+        )
+        if not handle:
+            return None
+        try:
+            creation, exit_time, kernel, user = (FILETIME() for _ in range(4))
+            if not self.kernel32.GetProcessTimes(
+                handle, byref(creation), byref(exit_time), byref(kernel), byref(user)
+            ):
+                return None
+            counters = IO_COUNTERS()
+            io_bytes = None
+            if self.kernel32.GetProcessIoCounters(handle, byref(counters)):
+                io_bytes = counters.ReadTransferCount + counters.WriteTransferCount
+            return ProcessSample(kernel.seconds() + user.seconds(), io_bytes)
+        finally:
+            self.kernel32.CloseHandle(handle)
+
+
+class TasklistBackend(ProcessBackend):
+    """Reads the process table by spawning tasklist, kept as a reference for benchmarks"""
+
+    def list_processes(self):
+        result = subprocess.run(
+            ["tasklist", "/fo", "csv", "/nh", "/fi", "imagename eq Plex*"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        for line in result.stdout.splitlines():
+            columns = line.strip('"').split('","')
+            if len(columns) > 1 and columns[1].isdigit():
+                yield int(columns[1]), columns[0]
+
+    def is_running(self, pid, name):
+        return any(
+            process_pid == pid and process_matches(image, name)
+            for process_pid, image in self.list_processes()
+        )
+
+
+class FakeProcessBackend(ProcessBackend):
+    """In-memory process table, used by tests and benchmarks"""
+
+    def __init__(self, processes=None, samples=None):
+        self.processes = dict(processes or {})
+        # ProcessSample of every pid, a pid without one cannot be sampled
+        self.samples = dict(samples or {})
+        self.list_calls = 0
+        self.is_running_calls = 0
+
+    def list_processes(self):
+        self.list_calls += 1
+        return list(self.processes.items())
+
+    def is_running(self, pid, name):
+        self.is_running_calls += 1
+        image = self.processes.get(pid)
+        return image is not None and process_matches(image, name)
+
+    def sample(self, pid):
+        if pid not in self.processes:
+            return None
+        return self.samples.get(pid)
+
+
+def process_matches(image, name):
+    """Returns true if the image name belongs to the given process name"""
+    image = normalize_process_name(image)
+    name = name.lower()
+    if image == name:
+        return True
+    # /proc/<pid>/comm is truncated, so a full length comm only matches the name prefix
+    return len(image) == PROC_COMM_LENGTH and name[:PROC_COMM_LENGTH] == image
+
+
+def default_process_backend():
+    """Returns the process backend for the current platform"""
+    if sys.platform == "win32":
+        return ToolhelpBackend()
+    return ProcfsBackend()
+
+
+class ProcessProbe:
+    """Checks if the given processes are running, remembering their PIDs so later checks
+    only have to look at those PIDs. The whole process table is scanned again when a cached
+    PID disappears, and every rescan_every checks to find processes started since"""
+
+    def __init__(
+        self,
+        backend: ProcessBackend = None,
+        names=PLEX_PROCESSES,
+        rescan_every=RESCAN_EVERY,
+    ):
+        self.backend = backend or default_process_backend()
+        self.names = names
+        self.rescan_every = max(rescan_every, 1)
+        self.pids = None
+        self.full_scans = 0
+        self.checks_since_scan = 0
+
+    def rescan(self):
+        """Scans the whole process table and caches the PIDs of the tracked processes"""
+        pids = {name: set() for name in self.names}
+        for pid, image in self.backend.list_processes():
+            for name in self.names:
+                if process_matches(image, name):
+                    pids[name].add(pid)
+        self.pids = pids
+        self.full_scans += 1
+        self.checks_since_scan = 0
+
+    def cache_is_valid(self):
+        """Returns true if every cached PID is still alive"""
+        for name, pids in self.pids.items():
+            for pid in pids:
+                if not self.backend.is_running(pid, name):
+                    return False
+        return True
+
+    def running(self):
+        """Returns a dict with the running state of every tracked process"""
+        self.checks_since_scan += 1
+        if self.pids is None or not self.cache_is_valid():
+            self.rescan()
+        elif self.scan_is_due() and not all(self.pids.values()):
+            self.rescan()
+        return {name: bool(pids) for name, pids in self.pids.items()}
+
+    def scan_is_due(self):
+        """Returns true once rescan_every checks used the cached PIDs since the last scan"""
+        return self.checks_since_scan >= self.rescan_every
+
+    def current_pids(self, name):
+        """Returns the PIDs of a tracked process, the table is scanned again when it is due
+        so processes started after the cached ones are found too"""
+        if self.pids is None or self.scan_is_due():
+            self.rescan()
+        return self.pids[name]
+
+
+class TranscoderLoadProbe:
+    """Classifies the transcoders as active, idle or stalled from the rate of their CPU time
+    and I/O. Every sample call reads the counters of the given PIDs once and keeps the last
+    window of them per PID. A transcoder that cannot be sampled yet is counted as active
+    """
+
+    def __init__(
+        self, backend: ProcessBackend = None, clock=monotonic, window=LOAD_SAMPLE_WINDOW
+    ):
+        self.backend = backend or default_process_backend()
+        self.clock = clock
+        self.window = max(window, 2)
+        self.samples = {}
+
+    def sample(self, pids):
+        """Samples the given PIDs and returns a dict with the load of each of them"""
+        now = self.clock()
+        # Processes that ended are forgotten, a reused PID starts a new history
+        self.samples = {pid: self.samples[pid] for pid in pids if pid in self.samples}
+        loads = {}
+        for pid in pids:
+            sample = self.backend.sample(pid)
+            history = self.samples.setdefault(pid, deque(maxlen=self.window))
+            if sample is None:
+                history.clear()
+                loads[pid] = TRANSCODER_ACTIVE
+                continue
+            if history and sample.cpu_seconds < history[-1][1].cpu_seconds:
+                history.clear()
+            history.append((now, sample))
+            loads[pid] = self.classify(history)
+        return loads
+
+    def classify(self, history):
+        """Returns the load of a transcoder from its samples, oldest first"""
+        if len(history) < 2:
+            return TRANSCODER_ACTIVE
+        (start, first), (end, last) = history[0], history[-1]
+        elapsed = end - start
+        if elapsed <= 0:
+            return TRANSCODER_ACTIVE
+        cpu = last.cpu_seconds - first.cpu_seconds
+        io = None
+        if first.io_bytes is not None and last.io_bytes is not None:
+            io = last.io_bytes - first.io_bytes
+        if cpu / elapsed >= ACTIVE_CPU_RATE or (
+            io is not None and io / elapsed >= ACTIVE_IO_RATE
+        ):
+            return TRANSCODER_ACTIVE
+        if elapsed >= STALL_SECONDS and cpu <= STALL_CPU_SECONDS and not io:
+            return TRANSCODER_STALLED
+        return TRANSCODER_IDLE
@@ -0,0 +1,172 @@
+"""Test file for process_probe.py"""
+
+import os
+import unittest
+from ctypes import wintypes
+from unittest.mock import MagicMock
+
+from process_probe import (
+    FakeProcessBackend,
+    PLEX_SERVER_PROCESS,
+    PLEX_TRANSCODER_PROCESS,
+    TRANSCODER_ACTIVE,
+    TRANSCODER_IDLE,
+    TRANSCODER_STALLED,
+    ProcessProbe,
+    ProcessSample,
+    ProcfsBackend,
+    ToolhelpBackend,
+    TranscoderLoadProbe,
+    process_matches,
+)
+
+PLEX_PROCESSES = {10: "Plex Media Server.exe", 20: "Plex Transcoder.exe"}
+
+
+class ProcessProbeTest(unittest.TestCase):
+    """Test class for process_probe.py"""
+
+    def test_01_process_matches(self):
+        """Test process name matching for every backend naming style"""
+        self.assertTrue(process_matches("Plex Transcoder.exe", PLEX_TRANSCODER_PROCESS))
+        self.assertTrue(
+            process_matches(
+                "C:\\Program Files\\Plex\\Plex Media Server.exe", PLEX_SERVER_PROCESS
+            )
+        )
+        self.assertTrue(process_matches("Plex Media Serv", PLEX_SERVER_PROCESS))
+        self.assertFalse(process_matches("Plex Media Scanner.exe", PLEX_SERVER_PROCESS))
+
+    def test_02_cached_pids_skip_rescan(self):
+        """Test that later checks only look at the cached PIDs"""
+        backend = FakeProcessBackend(PLEX_PROCESSES)
+        probe = ProcessProbe(backend)
+        self.assertEqual(
+            probe.running(), {PLEX_SERVER_PROCESS: True, PLEX_TRANSCODER_PROCESS: True}
+        )
+        probe.running()
+        probe.running()
+        self.assertEqual(backend.list_calls, 1)
+        self.assertEqual(probe.full_scans, 1)
+
+    def test_03_rescan_when_pid_disappears(self):
+        """Test that the process table is scanned again when a cached PID disappears"""
+        backend = FakeProcessBackend(PLEX_PROCESSES)
+        probe = ProcessProbe(backend)
+        probe.running()
+        del backend.processes[20]
+        self.assertEqual(
+            probe.running(), {PLEX_SERVER_PROCESS: True, PLEX_TRANSCODER_PROCESS: False}
+        )
+        self.assertEqual(backend.list_calls, 2)
+
+    def test_04_pid_reused_by_other_process(self):
+        """Test that a cached PID reused by another process is not reported as running"""
+        backend = FakeProcessBackend(PLEX_PROCESSES)
+        probe = ProcessProbe(backend)
+        probe.running()
+        backend.processes[20] = "notepad.exe"
+        self.assertFalse(probe.running()[PLEX_TRANSCODER_PROCESS])
+
+    @unittest.skipUnless(os.path.isdir("/proc/self"), "requires /proc")
+    def test_05_procfs_backend(self):
+        """Test that the /proc backend sees the current process"""
+        backend = ProcfsBackend()
+        pids = [pid for pid, _ in backend.list_processes()]
+        self.assertIn(os.getpid(), pids)
+        self.assertFalse(backend.is_running(os.getpid(), PLEX_SERVER_PROCESS))
+
+    def test_06_transcoder_load(self):
+        """Test transcoders are classified from the rate of their counters"""
+        now = [0.0]
+        backend = FakeProcessBackend(
+            {pid: "Plex Transcoder.exe" for pid in (20, 21, 22)},
+            {
+                pid: ProcessSample(10.0, None if pid == 21 else 0)
+                for pid in (20, 21, 22)
+            },
+        )
+        probe = TranscoderLoadProbe(backend, clock=lambda: now[0])
+        self.assertEqual(set(probe.sample({20, 21, 22}).values()), {TRANSCODER_ACTIVE})
+        loads = []
+        for _ in range(5):
+            now[0] += 30
+            cpu, _ = backend.samples[20]
+            backend.samples[20] = ProcessSample(cpu + 15, 0)
+            backend.samples[22] = ProcessSample(10.0, int(now[0]) * 64 * 1024)
+            loads.append(probe.sample({20, 21, 22}))
+        self.assertEqual(
+            loads[0],
+            {20: TRANSCODER_ACTIVE, 21: TRANSCODER_IDLE, 22: TRANSCODER_ACTIVE},
+        )
+        self.assertEqual(loads[-1][21], TRANSCODER_STALLED)
+        self.assertEqual(probe.sample({20})[20], TRANSCODER_ACTIVE)
+        self.assertEqual(list(probe.samples), [20])
+
+    def test_07_transcoder_restarted(self):
+        """Test a transcoder whose counters went back is sampled from scratch"""
+        now = [0.0]
+        backend = FakeProcessBackend(
+            {20: "Plex Transcoder.exe"}, {20: ProcessSample(100.0, 0)}
+        )
+        probe = TranscoderLoadProbe(backend, clock=lambda: now[0])
+        for _ in range(4):
+            now[0] += 60
+            probe.sample({20})
+        self.assertEqual(probe.sample({20})[20], TRANSCODER_STALLED)
+        backend.samples[20] = ProcessSample(0.5, 0)
+        self.assertEqual(probe.sample({20})[20], TRANSCODER_ACTIVE)
+        del backend.processes[20]
+        self.assertEqual(probe.sample({20})[20], TRANSCODER_ACTIVE)
+
+    @unittest.skipUnless(os.path.isdir("/proc/self"), "requires /proc")
+    def test_08_procfs_sample(self):
+        """Test that the /proc backend reads the counters of the current process"""
+        backend = ProcfsBackend()
+        before = backend.sample(os.getpid())
+        sum(range(2_000_000))
+        after = backend.sample(os.getpid())
+        self.assertGreaterEqual(after.cpu_seconds, before.cpu_seconds)
+        self.assertIsNotNone(after.io_bytes)
+        self.assertIsNone(backend.sample(-1))
+
+    def test_09_new_processes_found_periodically(self):
+        """Test processes started since the last scan are found every rescan_every checks"""
+        backend = FakeProcessBackend({10: "Plex Media Server.exe"})
+        probe = ProcessProbe(backend, rescan_every=3)
+        for _ in range(3):
+            self.assertFalse(probe.running()[PLEX_TRANSCODER_PROCESS])
+        self.assertEqual(backend.list_calls, 1)
+        backend.processes[20] = "Plex Transcoder.exe"
+        self.assertTrue(probe.running()[PLEX_TRANSCODER_PROCESS])
+        backend.processes[21] = "Plex Transcoder.exe"
+        for _ in range(2):
+            probe.running()
+            self.assertEqual(probe.current_pids(PLEX_TRANSCODER_PROCESS), {20})
+        probe.running()
+        self.assertEqual(probe.current_pids(PLEX_TRANSCODER_PROCESS), {20, 21})
+        self.assertEqual(backend.list_calls, 3)
+
+    def test_10_toolhelp_signatures(self):
+        """Test every Win32 call of the toolhelp backend taking a handle declares it"""
+        backend = ToolhelpBackend.__new__(ToolhelpBackend)
+        backend.kernel32 = MagicMock()
+        backend.declare_functions()
+        for name in (
+            "Process32FirstW",
+            "Process32NextW",
+            "GetExitCodeProcess",
+            "QueryFullProcessImageNameW",
+            "GetProcessTimes",
+            "GetProcessIoCounters",
+            "CloseHandle",
+        ):
+            function = getattr(backend.kernel32, name)
+            self.assertIs(function.argtypes[0], wintypes.HANDLE, name)
+            self.assertIs(function.restype, wintypes.BOOL, name)
+        for name in ("CreateToolhelp32Snapshot", "OpenProcess"):
+            self.assertIs(getattr(backend.kernel32, name).restype, wintypes.HANDLE)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,404 @@
+""" This file contains the simulation that replays a trace of computer and Plex activity through PlexShutdownManager on a virtual clock
+
+Run from the repository root: python simulation.py --days 28 --max-idle 15 30 60
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import logging
+import random
+from dataclasses import dataclass, field, replace
+from itertools import product
+from time import mktime, perf_counter
+from typing import NamedTuple
+
+from config import Settings
+from idle import SyntheticIdleSource
+from monitor_log import LOGGER_NAME
+from plex_sessions import SessionState
+from plex_shutdown_manager import PlexShutdownManager
+from power import DryRunPowerBackend, PowerController
+from usage_model import UsageModel
+from process_probe import (
+    PLEX_SERVER_PROCESS,
+    PLEX_TRANSCODER_PROCESS,
+    FakeProcessBackend,
+    ProcessProbe,
+)
+
+INPUT = "input"
+SESSIONS = "sessions"
+TRANSCODER = "transcoder"
+EVENT_KINDS = (INPUT, SESSIONS, TRANSCODER)
+ARM = "arm"
+CANCEL = "cancel"
+SHUTDOWN = "shutdown"
+BOOT = "boot"
+DAY = 24 * 60 * 60
+PLEX_SERVER_PID = 10
+PLEX_TRANSCODER_PID = 20
+# Wall time of the start of a trace, a Monday at 00:00 local time, for the usage model
+TRACE_START = mktime((2024, 1, 1, 0, 0, 0, 0, 0, -1))
+
+
+class TraceEvent(NamedTuple):
+    """Something that happens at the given second of the trace. An input event has no value,
+    sessions is the new number of active sessions and transcoder whether it now runs"""
+
+    time: float
+    kind: str
+    value: int = 0
+
+
+class Decision(NamedTuple):
+    """A change of the power state at the given second of the trace"""
+
+    time: float
+    action: str
+
+
+class VirtualClock:
+    """Clock moved by the simulation instead of by the time passing"""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class SimulatedPlex:
+    """Stands in for a Plex server handle, its session count is set by the trace"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.sessions = 0
+
+    def session_states(self):
+        """Returns the sessions, the trace has no pauses so they all keep playing"""
+        position = int(self.clock() * 1000)
+        return [
+            SessionState(str(key), position, "playing") for key in range(self.sessions)
+        ]
+
+    def session_count(self):
+        """Returns the number of sessions"""
+        return self.sessions
+
+
+class SimulationHost:
+    """Settings and status host of the simulated manager, auto shutdown is always on"""
+
+    def __init__(self, settings: Settings, plex: SimulatedPlex):
+        self.settings = settings
+        self.plex = plex
+        self.errors = []
+
+    def get_shutdown_status(self):
+        """Auto shutdown is always on in the simulation"""
+        return True
+
+    def get_max_computer_idle(self):
+        """Returns the max computer idle time"""
+        return self.settings.computer_idle
+
+    def get_shutdown_delay(self):
+        """Returns the shutdown delay"""
+        return self.settings.shutdown_delay
+
+    def get_interval_delay(self):
+        """Returns the interval delay"""
+        return self.settings.interval_delay
+
+    def get_plex_instance(self):
+        """Returns the simulated plex server"""
+        return self.plex
+
+    def get_extra_plex_instances(self):
+        """The simulation has a single server"""
+        return []
+
+    def show_error(self, message):
+        """Keeps the error for the report"""
+        self.errors.append(message)
+
+    def show_plex_health(self, message):
+        """The simulated server is always reachable"""
+
+    def reconnect_server(self, name):
+        """Returns the simulated plex server"""
+        return self.plex
+
+
+@dataclass
+class SimulationReport:
+    """What happened during a replay"""
+
+    settings: Settings
+    usage_model: bool = False
+    decisions: list = field(default_factory=list)
+    ticks: int = 0
+    simulated_seconds: float = 0.0
+    powered_seconds: float = 0.0
+    missed_sessions: int = 0
+    wall_seconds: float = 0.0
+
+    def count(self, action):
+        """Returns how many times the action was taken"""
+        return sum(1 for decision in self.decisions if decision.action == action)
+
+    @property
+    def ticks_per_second(self):
+        """Returns how many monitor checks were replayed per second of wall time"""
+        return self.ticks / self.wall_seconds if self.wall_seconds else 0.0
+
+    def summary(self):
+        """Returns the report as a single line"""
+        settings = self.settings
+        return (
+            f"MaxIdle={settings.computer_idle:g} IntervalDelay={settings.interval_delay:g} "
+            f"ShutdownDelay={settings.shutdown_delay:g}"
+            f"{' with the usage model' if self.usage_model else ''}: "
+            f"{self.count(ARM)} arms, {self.count(CANCEL)} cancels, "
+            f"{self.count(SHUTDOWN)} shutdowns, {self.missed_sessions} missed sessions, "
+            f"on {self.powered_seconds / max(self.simulated_seconds, 1):.0%} of the time, "
+            f"{self.ticks} ticks at {self.ticks_per_second:,.0f} ticks/s"
+        )
+
+
+class Simulation:
+    """Replays a trace through a PlexShutdownManager wired to a virtual clock, a synthetic idle
+    source, an in-memory process table and a dry-run power backend. The monitor runs its checks
+    at the times it would sleep until, the computer turns off when a pending shutdown is reached
+    and turns back on at the next input event. With learn_usage the usage model is fitted
+    every simulated day from the checks so far"""
+
+    def __init__(self, trace, settings: Settings, learn_usage=False):
+        self.trace = sorted(trace)
+        self.settings = settings
+        self.learn_usage = learn_usage
+        self.clock = VirtualClock()
+        self.idle_source = SyntheticIdleSource(clock=self.clock)
+        self.plex = SimulatedPlex(self.clock)
+        self.processes = FakeProcessBackend({PLEX_SERVER_PID: PLEX_SERVER_PROCESS})
+        self.power = PowerController(DryRunPowerBackend(), clock=self.clock)
+        self.manager = PlexShutdownManager(
+            SimulationHost(settings, self.plex),
+            process_probe=ProcessProbe(self.processes),
+            clock=self.clock,
+            parallel_probes=False,
+            idle_source=self.idle_source,
+            power=self.power,
+            session_reader=SimulatedPlex.session_states,
+            session_counter=SimulatedPlex.session_count,
+            stale_session_minutes=settings.stale_session_timeout,
+            notify=lambda *_: None,
+        )
+        self.next_event = 0
+        self.powered = True
+        self.report = SimulationReport(settings, learn_usage)
+        # Wall time and activity of every check, the history the usage model learns from
+        self.check_times = []
+        self.check_activity = []
+        self.fitted_day = 0
+
+    def apply(self, event: TraceEvent):
+        """Applies an event of the trace at its time"""
+        self.clock.now = max(self.clock.now, event.time)
+        if event.kind == INPUT:
+            self.idle_source.input()
+        elif event.kind == SESSIONS:
+            if not self.powered and event.value > self.plex.sessions:
+                self.report.missed_sessions += event.value - self.plex.sessions
+            self.plex.sessions = event.value
+        elif event.kind == TRANSCODER:
+            if event.value:
+                self.processes.processes[PLEX_TRANSCODER_PID] = PLEX_TRANSCODER_PROCESS
+            else:
+                self.processes.processes.pop(PLEX_TRANSCODER_PID, None)
+
+    def advance(self, until):
+        """Applies the events up to the given time and moves the clock there. While the
+        computer is off it stops at the input event that turns it back on"""
+        while (
+            self.next_event < len(self.trace)
+            and self.trace[self.next_event].time <= until
+        ):
+            event = self.trace[self.next_event]
+            self.next_event += 1
+            booting = not self.powered and event.kind == INPUT
+            if booting:
+                self.boot(event.time)
+            self.apply(event)
+            if booting:
+                return
+        self.clock.now = max(self.clock.now, until)
+
+    def boot(self, now):
+        """Turns the computer back on, the monitor starts from scratch"""
+        self.clock.now = now
+        self.powered = True
+        self.record(BOOT)
+        self.power.deadline = None
+        self.manager.shutdown_enabled = False
+        self.manager.shutdown_deadline = None
+        self.manager.last_idle_duration = None
+        self.manager.probe_scheduler.invalidate()
+
+    def record(self, action):
+        """Adds a decision at the current time"""
+        self.report.decisions.append(Decision(self.clock.now, action))
+
+    def tick(self):
+        """Runs a monitor check and records the power change it made"""
+        if self.learn_usage and self.clock.now // DAY > self.fitted_day:
+            self.fitted_day = self.clock.now // DAY
+            self.manager.usage_model = UsageModel.fit(
+                self.check_times,
+                self.check_activity,
+                clock=lambda: TRACE_START + self.clock.now,
+            )
+        was_pending = self.power.pending
+        self.manager.monitor_plex_and_shutdown()
+        self.report.ticks += 1
+        if self.learn_usage:
+            self.check_times.append(TRACE_START + self.clock.now)
+            self.check_activity.append(
+                self.plex.sessions > 0
+                or PLEX_TRANSCODER_PID in self.processes.processes
+            )
+        if self.power.pending and not was_pending:
+            self.record(ARM)
+        elif was_pending and not self.power.pending:
+            self.record(CANCEL)
+
+    def run(self, duration=None) -> SimulationReport:
+        """Replays the trace until the given number of seconds or its last event"""
+        if duration is None:
+            duration = self.trace[-1].time if self.trace else 0.0
+        start = perf_counter()
+        while self.clock.now < duration:
+            if not self.powered:
+                off_since = self.clock.now
+                self.advance(duration)
+                self.report.powered_seconds -= self.clock.now - off_since
+                continue
+            self.advance(self.clock.now)
+            self.tick()
+            target = min(duration, self.clock.now + self.manager.next_check_delay())
+            deadline = self.power.deadline
+            if deadline is not None and deadline <= target:
+                self.advance(deadline)
+                self.powered = False
+                self.record(SHUTDOWN)
+            else:
+                self.advance(target)
+        self.report.wall_seconds = perf_counter() - start
+        self.report.simulated_seconds = duration
+        self.report.powered_seconds += duration
+        return self.report
+
+
+def load_trace(trace_path):
+    """Reads a trace recorded as CSV rows of seconds, kind and value"""
+    with open(trace_path, newline="", encoding="utf-8") as trace_file:
+        trace = []
+        for row in csv.reader(trace_file):
+            if not row or row[0].startswith("#"):
+                continue
+            kind = row[1].strip()
+            if kind not in EVENT_KINDS:
+                raise ValueError(f"Unknown trace event kind: {kind}")
+            value = int(row[2]) if len(row) > 2 and row[2].strip() else 0
+            trace.append(TraceEvent(float(row[0]), kind, value))
+    return trace
+
+
+def save_trace(trace, trace_path):
+    """Writes a trace as CSV rows of seconds, kind and value"""
+    with open(trace_path, "w", newline="", encoding="utf-8") as trace_file:
+        csv.writer(trace_file).writerows(trace)
+
+
+def generate_trace(days, seed=0):
+    """Returns a trace of the given number of days with desk use during the day and Plex
+    sessions, some of them transcoded, in the evening. The same seed gives the same trace"""
+    rng = random.Random(seed)
+    trace = []
+    for day in range(days):
+        start = day * DAY
+        # A few bursts of input between 8:00 and 23:00
+        for _ in range(rng.randint(2, 6)):
+            burst = start + rng.uniform(8, 23) * 3600
+            for _ in range(rng.randint(5, 60)):
+                burst += rng.expovariate(1 / 30)
+                trace.append(TraceEvent(burst, INPUT))
+        # Most evenings someone watches one or two things
+        for _ in range(rng.choices((0, 1, 2), (2, 5, 3))[0]):
+            begin = start + rng.uniform(18, 23.5) * 3600
+            end = begin + rng.uniform(20, 150) * 60
+            transcoded = rng.random() < 0.3
+            trace.append(TraceEvent(begin, SESSIONS, 1))
+            trace.append(TraceEvent(end, SESSIONS, 0))
+            if transcoded:
+                trace.append(TraceEvent(begin, TRANSCODER, 1))
+                trace.append(TraceEvent(end, TRANSCODER, 0))
+    trace.sort()
+    return trace
+
+
+def main():
+    """Replays a trace with every combination of the given settings and prints the reports"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--trace", help="CSV trace of seconds, kind and value")
+    source.add_argument("--days", type=int, default=28, help="days of generated trace")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-idle", type=float, nargs="+", default=[30])
+    parser.add_argument("--interval", type=float, nargs="+", default=[1])
+    parser.add_argument("--shutdown-delay", type=float, nargs="+", default=[30])
+    parser.add_argument(
+        "--decisions", action="store_true", help="print every power decision"
+    )
+    parser.add_argument(
+        "--usage-model",
+        action="store_true",
+        help="also replay with the usage model learning from the replayed checks",
+    )
+    args = parser.parse_args()
+    # The reports are the output of the simulation, not the warnings of the replayed checks
+    logging.getLogger(LOGGER_NAME).setLevel(logging.ERROR)
+
+    if args.trace:
+        trace = load_trace(args.trace)
+        duration = None
+    else:
+        trace = generate_trace(args.days, args.seed)
+        duration = args.days * DAY
+    print(f"Replaying {len(trace)} events")
+    for max_idle, interval, shutdown_delay, learn_usage in product(
+        args.max_idle,
+        args.interval,
+        args.shutdown_delay,
+        (False, True) if args.usage_model else (False,),
+    ):
+        settings = replace(
+            Settings(),
+            computer_idle=max_idle,
+            interval_delay=interval,
+            shutdown_delay=shutdown_delay,
+        )
+        report = Simulation(trace, settings, learn_usage).run(duration)
+        print(report.summary())
+        if args.decisions:
+            for decision in report.decisions:
+                day, seconds = divmod(int(decision.time), DAY)
+                print(
+                    f"  day {day} {seconds // 3600:02d}:{seconds // 60 % 60:02d} "
+                    f"{decision.action}"
+                )
+
+
+if __name__ == "__main__":
+    main()
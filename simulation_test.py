@@ -0,0 +1,90 @@
+""" Test file for simulation.py """
+import os
+import tempfile
+import unittest
+
+from config import Settings
+from simulation import (
+    ARM,
+    BOOT,
+    CANCEL,
+    INPUT,
+    SESSIONS,
+    SHUTDOWN,
+    TRANSCODER,
+    Simulation,
+    TraceEvent,
+    generate_trace,
+    load_trace,
+    save_trace,
+)
+
+SETTINGS = Settings(computer_idle=30, interval_delay=1, shutdown_delay=30)
+
+
+class SimulationTest(unittest.TestCase):
+    """Test class for simulation.py"""
+
+    def actions(self, report):
+        """Returns the (minute, action) of every decision"""
+        return [(round(d.time / 60), d.action) for d in report.decisions]
+
+    def test_01_idle_computer_shuts_down(self):
+        """Test an idle computer is armed after max idle and turned off after the delay"""
+        report = Simulation([TraceEvent(0, INPUT)], SETTINGS).run(3 * 3600)
+        self.assertEqual(self.actions(report), [(30, ARM), (60, SHUTDOWN)])
+        self.assertAlmostEqual(report.powered_seconds, 3600, delta=60)
+
+    def test_02_session_cancels_shutdown(self):
+        """Test a session starting while armed cancels the pending shutdown"""
+        trace = [
+            TraceEvent(0, INPUT),
+            TraceEvent(40 * 60, SESSIONS, 1),
+            TraceEvent(90 * 60, SESSIONS, 0),
+        ]
+        report = Simulation(trace, SETTINGS).run(3 * 3600)
+        self.assertEqual(
+            self.actions(report),
+            [(30, ARM), (40, CANCEL), (90, ARM), (120, SHUTDOWN)],
+        )
+
+    def test_03_transcoder_blocks_arming(self):
+        """Test nothing is armed while the transcoder runs"""
+        trace = [
+            TraceEvent(0, INPUT),
+            TraceEvent(0, TRANSCODER, 1),
+            TraceEvent(50 * 60, TRANSCODER, 0),
+        ]
+        report = Simulation(trace, SETTINGS).run(3 * 3600)
+        self.assertEqual(self.actions(report)[0], (50, ARM))
+
+    def test_04_off_until_input(self):
+        """Test the computer stays off until the next input and counts the sessions it missed"""
+        trace = [
+            TraceEvent(0, INPUT),
+            TraceEvent(90 * 60, SESSIONS, 1),
+            TraceEvent(100 * 60, SESSIONS, 0),
+            TraceEvent(120 * 60, INPUT),
+        ]
+        report = Simulation(trace, SETTINGS).run(4 * 3600)
+        self.assertEqual(
+            self.actions(report),
+            [(30, ARM), (60, SHUTDOWN), (120, BOOT), (150, ARM), (180, SHUTDOWN)],
+        )
+        self.assertEqual(report.missed_sessions, 1)
+
+    def test_05_generated_trace(self):
+        """Test a generated trace is the same for a seed and survives a CSV round trip"""
+        trace = generate_trace(7, seed=3)
+        self.assertEqual(trace, generate_trace(7, seed=3))
+        with tempfile.TemporaryDirectory() as directory:
+            trace_path = os.path.join(directory, "trace.csv")
+            save_trace(trace, trace_path)
+            self.assertEqual(load_trace(trace_path), trace)
+        report = Simulation(trace, SETTINGS).run(7 * 24 * 3600)
+        self.assertGreater(report.ticks, 0)
+        self.assertIn(report.count(SHUTDOWN) - report.count(BOOT), (0, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
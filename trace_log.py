@@ -0,0 +1,303 @@
+""" This file contains the binary trace of the monitor checks, one fixed-size record per check appended to a rotating file
+
+Read it from the repository root: python trace_log.py summary PlexAutoShutdownTrace.bin
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import mmap
+import os
+import struct
+from collections import deque
+from datetime import datetime
+from time import time
+from typing import NamedTuple
+
+from monitor_log import get_logger
+
+log = get_logger(__name__)
+
+TRACE_LOG_PATH = "PlexAutoShutdownTrace.bin"
+TRACE_MAGIC = b"PAST"
+TRACE_VERSION = 1
+# 4 MiB hold about three months of checks at the default interval
+TRACE_MAX_BYTES = 4 * 1024 * 1024
+TRACE_BACKUPS = 3
+# Probes with a latency column, in column order
+TRACE_PROBES = ("idle", "transcoder", "sessions")
+HEADER = struct.Struct("<4sHH8x")
+# Wall time, idle seconds, session count, outcome, transcoder, flags and the probe latencies
+RECORD = struct.Struct("<dfibbBx3f")
+FLAG_SHUTDOWN_PENDING = 0x01
+NAN = float("nan")
+
+
+class TraceRecord(NamedTuple):
+    """A monitor check. Values the monitor did not know are NaN, or -1 for the session count
+    and the transcoder, the latency of a probe whose cached result was used is NaN"""
+
+    timestamp: float
+    idle_seconds: float
+    sessions: int
+    outcome: int
+    transcoder: int
+    flags: int
+    idle_latency: float
+    transcoder_latency: float
+    sessions_latency: float
+
+    @property
+    def shutdown_pending(self):
+        """Returns true if a shutdown was pending after the check"""
+        return bool(self.flags & FLAG_SHUTDOWN_PENDING)
+
+
+def backup_path(trace_path, index):
+    """Returns the path of a rotated file, 1 is the most recent"""
+    return f"{trace_path}.{index}"
+
+
+class TraceLog:
+    """Appends a record per monitor check with a single write, the file is rotated once it
+    reaches max_bytes and the oldest of the backups is dropped. Nothing is kept in memory"""
+
+    def __init__(
+        self,
+        trace_path=TRACE_LOG_PATH,
+        max_bytes=TRACE_MAX_BYTES,
+        backups=TRACE_BACKUPS,
+        clock=time,
+    ):
+        self.trace_path = trace_path
+        self.max_bytes = max(max_bytes, HEADER.size + RECORD.size)
+        self.backups = backups
+        self.clock = clock
+        self.fd = None
+        self.size = 0
+        self.open()
+
+    def open(self):
+        """Opens the file for appending, a file of another format is rotated away first and
+        a record cut short by a crash is dropped"""
+        if os.path.exists(self.trace_path) and not has_valid_header(self.trace_path):
+            self.shift_backups()
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0)
+        self.fd = os.open(self.trace_path, flags, 0o644)
+        size = os.fstat(self.fd).st_size
+        if size == 0:
+            os.write(self.fd, HEADER.pack(TRACE_MAGIC, TRACE_VERSION, RECORD.size))
+            size = HEADER.size
+        whole = size - (size - HEADER.size) % RECORD.size
+        if whole != size:
+            os.ftruncate(self.fd, whole)
+        self.size = whole
+
+    def record(
+        self, idle_seconds, transcoder, sessions, outcome, shutdown_pending, latencies
+    ):
+        """Appends a check, None stands for an unknown value. latencies are in seconds in
+        the order of TRACE_PROBES. Nothing is written while the file is not open"""
+        if self.fd is None:
+            return
+        os.write(
+            self.fd,
+            RECORD.pack(
+                self.clock(),
+                NAN if idle_seconds is None else idle_seconds,
+                -1 if sessions is None else sessions,
+                outcome,
+                -1 if transcoder is None else int(transcoder),
+                FLAG_SHUTDOWN_PENDING if shutdown_pending else 0,
+                *(NAN if latency is None else latency for latency in latencies),
+            ),
+        )
+        self.size += RECORD.size
+        if self.size >= self.max_bytes:
+            self.rotate()
+
+    def shift_backups(self):
+        """Renames the file and its backups one step older, dropping the oldest"""
+        for index in range(self.backups - 1, 0, -1):
+            source = backup_path(self.trace_path, index)
+            if os.path.exists(source):
+                os.replace(source, backup_path(self.trace_path, index + 1))
+        if self.backups > 0:
+            os.replace(self.trace_path, backup_path(self.trace_path, 1))
+        else:
+            os.remove(self.trace_path)
+
+    def rotate(self):
+        """Starts a new file, the full one becomes the most recent backup"""
+        os.close(self.fd)
+        # The descriptor number may be reused by another file if the new one cannot be opened
+        self.fd = None
+        try:
+            self.shift_backups()
+        except OSError as e:
+            # A reader holding the file open on Windows blocks the rename, retried later
+            log.warning("Cannot rotate the trace log: %s", e)
+        self.open()
+
+    def close(self):
+        """Closes the file"""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def open_trace_log(trace_path=TRACE_LOG_PATH):
+    """Returns the trace log of the monitor, or None when the file cannot be opened"""
+    try:
+        return TraceLog(trace_path)
+    except OSError as e:
+        log.warning("Cannot open the trace log, the checks are not recorded: %s", e)
+        return None
+
+
+def has_valid_header(trace_path):
+    """Returns true if the file starts with the header of this trace format"""
+    with open(trace_path, "rb") as trace_file:
+        data = trace_file.read(HEADER.size)
+    if len(data) != HEADER.size:
+        return False
+    return HEADER.unpack(data) == (TRACE_MAGIC, TRACE_VERSION, RECORD.size)
+
+
+def read_records(trace_path):
+    """Yields the records of a trace file, read through a memory map of the file"""
+    if not has_valid_header(trace_path):
+        raise ValueError(f"{trace_path} is not a trace log")
+    with open(trace_path, "rb") as trace_file:
+        size = os.fstat(trace_file.fileno()).st_size
+        end = size - (size - HEADER.size) % RECORD.size
+        if end == HEADER.size:
+            return
+        with mmap.mmap(trace_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for values in RECORD.iter_unpack(view[HEADER.size : end]):
+                    yield TraceRecord._make(values)
+            finally:
+                view.release()
+
+
+def trace_files(trace_path, backups=TRACE_BACKUPS):
+    """Returns the existing files of a trace, oldest first"""
+    paths = [backup_path(trace_path, index) for index in range(backups, 0, -1)]
+    return [path for path in paths + [trace_path] if os.path.exists(path)]
+
+
+def read_trace(trace_path, backups=TRACE_BACKUPS):
+    """Yields the records of a trace and of its backups, oldest first"""
+    for path in trace_files(trace_path, backups):
+        yield from read_records(path)
+
+
+class TraceSummary:
+    """Counts and extremes of a stream of records, kept in constant memory"""
+
+    def __init__(self):
+        self.records = 0
+        self.first = None
+        self.last = None
+        self.outcomes = {}
+        self.max_idle = None
+        self.max_sessions = -1
+        self.transcoder_checks = 0
+        self.pending_checks = 0
+        self.latency_count = [0] * len(TRACE_PROBES)
+        self.latency_total = [0.0] * len(TRACE_PROBES)
+        self.latency_max = [0.0] * len(TRACE_PROBES)
+
+    def add(self, record: TraceRecord):
+        """Adds a record to the summary"""
+        self.records += 1
+        if self.first is None:
+            self.first = record.timestamp
+        self.last = record.timestamp
+        self.outcomes[record.outcome] = self.outcomes.get(record.outcome, 0) + 1
+        if not math.isnan(record.idle_seconds) and (
+            self.max_idle is None or record.idle_seconds > self.max_idle
+        ):
+            self.max_idle = record.idle_seconds
+        self.max_sessions = max(self.max_sessions, record.sessions)
+        self.transcoder_checks += record.transcoder == 1
+        self.pending_checks += record.shutdown_pending
+        for index, latency in enumerate(record[-len(TRACE_PROBES) :]):
+            if not math.isnan(latency):
+                self.latency_count[index] += 1
+                self.latency_total[index] += latency
+                self.latency_max[index] = max(self.latency_max[index], latency)
+
+    def format(self, outcome_names=None):
+        """Returns the summary as text, outcome_names maps the outcome codes to names"""
+        if not self.records:
+            return "No records"
+        outcome_names = outcome_names or {}
+        lines = [
+            f"{self.records} checks from {format_time(self.first)} to {format_time(self.last)}",
+            "outcomes: "
+            + ", ".join(
+                f"{outcome_names.get(outcome, outcome)} {count}"
+                for outcome, count in sorted(self.outcomes.items())
+            ),
+            f"max idle {'?' if self.max_idle is None else f'{self.max_idle:.0f}'} s, "
+            f"max sessions {self.max_sessions}, "
+            f"transcoder running in {self.transcoder_checks} checks, "
+            f"shutdown pending in {self.pending_checks} checks",
+        ]
+        for index, name in enumerate(TRACE_PROBES):
+            count = self.latency_count[index]
+            mean = self.latency_total[index] / count if count else 0.0
+            lines.append(
+                f"{name} probe: {count} runs, mean {mean * 1000:.3f} ms, "
+                f"max {self.latency_max[index] * 1000:.3f} ms"
+            )
+        return "\n".join(lines)
+
+
+def format_time(timestamp):
+    """Formats a record timestamp in local time"""
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def format_record(record: TraceRecord, outcome_names=None):
+    """Formats a record as a single line"""
+    outcome = (outcome_names or {}).get(record.outcome, record.outcome)
+    transcoder = {1: "yes", 0: "no"}.get(record.transcoder, "?")
+    sessions = "?" if record.sessions < 0 else record.sessions
+    latencies = " ".join(
+        f"{name}={'-' if math.isnan(latency) else f'{latency * 1000:.2f}ms'}"
+        for name, latency in zip(TRACE_PROBES, record[-len(TRACE_PROBES) :])
+    )
+    return (
+        f"{format_time(record.timestamp)} idle={record.idle_seconds:.0f}s "
+        f"transcoder={transcoder} sessions={sessions} outcome={outcome} "
+        f"pending={'yes' if record.shutdown_pending else 'no'} {latencies}"
+    )
+
+
+def main():
+    """Prints a summary or the last checks of a trace"""
+    # pylint: disable=import-outside-toplevel
+    from plex_shutdown_manager import OUTCOME_NAMES
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("command", choices=("summary", "tail"))
+    parser.add_argument("trace_path", nargs="?", default=TRACE_LOG_PATH)
+    parser.add_argument("-n", type=int, default=20, help="checks printed by tail")
+    args = parser.parse_args()
+
+    if args.command == "summary":
+        summary = TraceSummary()
+        for record in read_trace(args.trace_path):
+            summary.add(record)
+        print(summary.format(OUTCOME_NAMES))
+    else:
+        for record in deque(read_trace(args.trace_path), maxlen=args.n):
+            print(format_record(record, OUTCOME_NAMES))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+""" Test file for trace_log.py """
+import math
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from trace_log import (
+    HEADER,
+    RECORD,
+    TraceLog,
+    TraceSummary,
+    backup_path,
+    read_records,
+    read_trace,
+)
+
+
+class TraceLogTest(unittest.TestCase):
+    """Test class for trace_log.py"""
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.trace_path = os.path.join(self.directory.name, "trace.bin")
+        self.now = 1000.0
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def open_log(self, **kwargs):
+        """Returns a trace log of the test directory on the test clock"""
+        trace_log = TraceLog(self.trace_path, clock=lambda: self.now, **kwargs)
+        self.addCleanup(trace_log.close)
+        return trace_log
+
+    def test_01_round_trip(self):
+        """Test a record is read back with the unknown values marked"""
+        trace_log = self.open_log()
+        trace_log.record(120.0, True, 2, 0, False, [0.001, 0.002, 0.05])
+        trace_log.record(None, None, None, 1, True, [None, None, None])
+        trace_log.close()
+        first, second = read_records(self.trace_path)
+        self.assertEqual(first.timestamp, 1000.0)
+        self.assertEqual(
+            (first.idle_seconds, first.transcoder, first.sessions), (120, 1, 2)
+        )
+        self.assertAlmostEqual(first.sessions_latency, 0.05)
+        self.assertFalse(first.shutdown_pending)
+        self.assertTrue(math.isnan(second.idle_seconds))
+        self.assertEqual(
+            (second.transcoder, second.sessions, second.outcome), (-1, -1, 1)
+        )
+        self.assertTrue(math.isnan(second.idle_latency))
+        self.assertTrue(second.shutdown_pending)
+        self.assertEqual(
+            os.path.getsize(self.trace_path), HEADER.size + 2 * RECORD.size
+        )
+
+    def test_02_rotation(self):
+        """Test full files become backups and the oldest one is dropped"""
+        trace_log = self.open_log(max_bytes=HEADER.size + 10 * RECORD.size, backups=2)
+        for index in range(35):
+            self.now = index
+            trace_log.record(index, False, 0, 0, False, [None] * 3)
+        trace_log.close()
+        self.assertTrue(os.path.exists(backup_path(self.trace_path, 2)))
+        self.assertFalse(os.path.exists(backup_path(self.trace_path, 3)))
+        timestamps = [record.timestamp for record in read_trace(self.trace_path, 2)]
+        self.assertEqual(timestamps, list(range(10, 35)))
+
+    def test_03_reopen_after_crash(self):
+        """Test a cut short record is dropped and a foreign file is moved away"""
+        trace_log = self.open_log()
+        trace_log.record(1, False, 0, 0, False, [None] * 3)
+        trace_log.close()
+        with open(self.trace_path, "ab") as trace_file:
+            trace_file.write(b"\1\2\3")
+        trace_log = self.open_log()
+        trace_log.record(2, False, 0, 0, False, [None] * 3)
+        trace_log.close()
+        self.assertEqual(
+            [r.idle_seconds for r in read_records(self.trace_path)], [1, 2]
+        )
+        with open(self.trace_path, "wb") as trace_file:
+            trace_file.write(b"not a trace")
+        self.open_log().close()
+        self.assertEqual(list(read_records(self.trace_path)), [])
+        with self.assertRaises(ValueError):
+            list(read_records(backup_path(self.trace_path, 1)))
+
+    def test_04_summary(self):
+        """Test the summary counts the outcomes and keeps the extremes"""
+        trace_log = self.open_log()
+        trace_log.record(10, False, 0, 0, False, [0.001, None, 0.02])
+        trace_log.record(2000, True, 3, 1, True, [0.003, 0.01, None])
+        trace_log.close()
+        summary = TraceSummary()
+        for record in read_trace(self.trace_path):
+            summary.add(record)
+        self.assertEqual(summary.records, 2)
+        self.assertEqual(summary.outcomes, {0: 1, 1: 1})
+        self.assertEqual((summary.max_idle, summary.max_sessions), (2000, 3))
+        self.assertEqual(summary.transcoder_checks, 1)
+        self.assertEqual(summary.latency_count, [2, 1, 1])
+        self.assertIn("2 checks", summary.format())
+
+    def test_05_failed_reopen_skips_records(self):
+        """Test records are skipped, not written to a closed descriptor, when the new
+        file cannot be opened after a rotation"""
+        trace_log = self.open_log(max_bytes=HEADER.size + 2 * RECORD.size)
+        trace_log.record(1, False, 0, 0, False, [None] * 3)
+        with patch.object(trace_log, "open", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                trace_log.record(2, False, 0, 0, False, [None] * 3)
+        self.assertIsNone(trace_log.fd)
+        trace_log.record(3, False, 0, 0, False, [None] * 3)
+        backup = list(read_records(backup_path(self.trace_path, 1)))
+        self.assertEqual(len(backup), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
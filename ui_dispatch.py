@@ -0,0 +1,137 @@
+""" This file contains the queue that hands the UI updates of background threads to the Tk thread """
+from __future__ import annotations
+
+import traceback
+from queue import Empty, SimpleQueue
+from time import monotonic
+from typing import NamedTuple
+
+STATUS_SLOT = "status"
+HEALTH_SLOT = "health"
+# Milliseconds between two drains of the queue on the Tk thread
+DRAIN_INTERVAL_MS = 100
+# Seconds a success or error message stays on screen
+MESSAGE_SECONDS = 5
+
+
+class StatusUpdate(NamedTuple):
+    """Shows text on a status line, for duration seconds or until replaced when None"""
+
+    slot: str
+    text: str
+    color: str | None
+    duration: float | None
+
+
+class StatusClear(NamedTuple):
+    """Empties a status line, only while it shows text unless text is None"""
+
+    slot: str
+    text: str | None
+
+
+class StatusLine:
+    """What a status line shows, repeats counts the identical messages merged into it"""
+
+    def __init__(self, text, color, expires_at):
+        self.text = text
+        self.color = color
+        self.expires_at = expires_at
+        self.repeats = 1
+
+    def display(self):
+        """Returns the text of the widget"""
+        if self.repeats > 1:
+            return f"{self.text} (x{self.repeats})"
+        return self.text
+
+
+class UiDispatcher:
+    """Takes UI work from any thread and runs it on the Tk thread. Callbacks and status
+    messages are put on a lock-free queue and a single periodic after callback drains it. The
+    messages of a status line are merged so only the latest one is rendered per drain, into
+    the same widget, however many the background threads post"""
+
+    def __init__(self, clock=monotonic):
+        self.queue = SimpleQueue()
+        self.clock = clock
+        # Slot -> callable(text, color) updating the widget of the status line
+        self.renderers = {}
+        self.lines: dict[str, StatusLine] = {}
+        self.renders = 0
+
+    def add_status(self, slot, render):
+        """Registers the widget of a status line, render is called on the Tk thread"""
+        self.renderers[slot] = render
+
+    def post(self, callback):
+        """Runs the callback on the Tk thread, safe from any thread"""
+        self.queue.put(callback)
+
+    def show(self, slot, text, color=None, duration=None):
+        """Shows text on a status line, safe from any thread"""
+        self.queue.put(StatusUpdate(slot, text, color, duration))
+
+    def clear(self, slot, text=None):
+        """Empties a status line, only while it shows text unless text is None"""
+        self.queue.put(StatusClear(slot, text))
+
+    def drain(self):
+        """Runs the queued callbacks and renders the status lines that changed, on the Tk
+        thread"""
+        now = self.clock()
+        changed = set()
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except Empty:
+                break
+            if isinstance(item, StatusUpdate):
+                self.update_line(item, now)
+                changed.add(item.slot)
+            elif isinstance(item, StatusClear):
+                line = self.lines.get(item.slot)
+                if line is not None and item.text in (None, line.text):
+                    del self.lines[item.slot]
+                    changed.add(item.slot)
+            else:
+                try:
+                    item()
+                except Exception:
+                    traceback.print_exc()
+        for slot, line in list(self.lines.items()):
+            if line.expires_at is not None and now >= line.expires_at:
+                del self.lines[slot]
+                changed.add(slot)
+        for slot in changed:
+            render = self.renderers.get(slot)
+            if render is None:
+                continue
+            line = self.lines.get(slot)
+            if line is None:
+                render("", None)
+            else:
+                render(line.display(), line.color)
+            self.renders += 1
+
+    def update_line(self, update: StatusUpdate, now):
+        """Puts a message on its status line, a repeat of the shown message is counted"""
+        expires_at = None if update.duration is None else now + update.duration
+        line = self.lines.get(update.slot)
+        if line is not None and (line.text, line.color) == (update.text, update.color):
+            line.repeats += 1
+            line.expires_at = expires_at
+            return
+        self.lines[update.slot] = StatusLine(update.text, update.color, expires_at)
+
+    def start(self, schedule, interval_ms=DRAIN_INTERVAL_MS):
+        """Drains the queue every interval_ms through schedule, the after method of the Tk
+        root"""
+
+        def tick():
+            try:
+                self.drain()
+            finally:
+                schedule(interval_ms, tick)
+
+        schedule(interval_ms, tick)
@@ -0,0 +1,77 @@
+""" Test file for ui_dispatch.py """
+import unittest
+from threading import Thread
+from unittest.mock import MagicMock, patch
+
+from ui_dispatch import HEALTH_SLOT, STATUS_SLOT, UiDispatcher
+
+
+class UiDispatchTest(unittest.TestCase):
+    """Test class for ui_dispatch.py"""
+
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.ui = UiDispatcher(clock=lambda: self.now)
+        self.status = MagicMock()
+        self.health = MagicMock()
+        self.ui.add_status(STATUS_SLOT, self.status)
+        self.ui.add_status(HEALTH_SLOT, self.health)
+
+    def test_01_messages_are_merged(self):
+        """Test the messages of many threads are rendered once per drain and line"""
+
+        def post_errors():
+            for _ in range(500):
+                self.ui.show(STATUS_SLOT, "Error: Connection error", "red", 5)
+
+        threads = [Thread(target=post_errors) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.ui.show(HEALTH_SLOT, "Plex Primary: connected")
+        self.ui.drain()
+        self.status.assert_called_once_with("Error: Connection error (x2000)", "red")
+        self.health.assert_called_once_with("Plex Primary: connected", None)
+        self.ui.show(STATUS_SLOT, "Success: Settings applied", "green", 5)
+        self.ui.drain()
+        self.status.assert_called_with("Success: Settings applied", "green")
+        self.assertEqual(self.ui.renders, 3)
+
+    def test_02_expiry_and_clear(self):
+        """Test timed messages disappear and a clear only removes the message it names"""
+        self.ui.show(STATUS_SLOT, "Error: Connection error", "red", 5)
+        self.ui.drain()
+        self.now = 5
+        self.ui.drain()
+        self.status.assert_called_with("", None)
+        self.ui.show(STATUS_SLOT, "Connecting to Plex...")
+        self.ui.show(STATUS_SLOT, "Error: Connection error", "red", 5)
+        self.ui.clear(STATUS_SLOT, "Connecting to Plex...")
+        self.ui.drain()
+        self.status.assert_called_with("Error: Connection error", "red")
+        self.ui.clear(STATUS_SLOT)
+        self.ui.drain()
+        self.status.assert_called_with("", None)
+        self.ui.drain()
+        self.assertEqual(self.status.call_count, 4)
+
+    def test_03_callbacks_on_schedule(self):
+        """Test posted callbacks run in order on the periodic drain, a failing one does not
+        stop the others"""
+        scheduled = []
+        calls = []
+        self.ui.start(lambda delay, tick: scheduled.append((delay, tick)), 50)
+        self.ui.post(lambda: calls.append(1))
+        self.ui.post(MagicMock(side_effect=RuntimeError("boom")))
+        self.ui.post(lambda: calls.append(2))
+        delay, tick = scheduled.pop()
+        self.assertEqual(delay, 50)
+        with patch("traceback.print_exc"):
+            tick()
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual(len(scheduled), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,190 @@
+""" This file contains the usage model, the chance of Plex activity per hour of the week learned from the trace log, used to scale the shutdown delay """
+from __future__ import annotations
+
+import os
+from functools import lru_cache
+from time import localtime, time
+
+from monitor_log import get_logger
+from trace_log import HEADER, RECORD, TRACE_BACKUPS, read_trace, trace_files
+
+try:
+    import numpy
+except ImportError:
+    # The model is also fitted in pure Python, only slower
+    numpy = None
+
+log = get_logger(__name__)
+
+HOURS_PER_WEEK = 7 * 24
+DAY = 24 * 60 * 60
+# 1970-01-01 was a Thursday, hours are counted from Monday 00:00
+EPOCH_WEEK_HOUR = 3 * 24
+# Checks of an hour of the week needed before its chance of activity is trusted
+MIN_HOUR_SAMPLES = 30
+# The shutdown delay is multiplied by a factor between these, from no activity to certain activity
+MIN_DELAY_FACTOR = 0.5
+MAX_DELAY_FACTOR = 2.0
+# Time after the shutdown in which a session would mean the computer is woken right away
+WAKE_HORIZON = 60 * 60
+# Seconds between two fits of the model from the trace log
+REFIT_INTERVAL = 6 * 60 * 60
+
+
+@lru_cache(maxsize=4096)
+def local_offset(day):
+    """Returns the UTC offset in seconds of local time at noon of the given day since the epoch"""
+    return localtime(day * DAY + DAY // 2).tm_gmtoff
+
+
+def week_hour(timestamp):
+    """Returns the local hour of the week of a timestamp, 0 is Monday from 00:00 to 01:00"""
+    local = timestamp + local_offset(int(timestamp // DAY))
+    return (int(local // 3600) + EPOCH_WEEK_HOUR) % HOURS_PER_WEEK
+
+
+def week_hour_histograms(timestamps, active):
+    """Returns the number of checks and of checks with activity per hour of the week"""
+    if numpy is not None:
+        timestamps = numpy.asarray(timestamps, dtype=numpy.float64)
+        if not len(timestamps):
+            return [0] * HOURS_PER_WEEK, [0] * HOURS_PER_WEEK
+        days = numpy.floor_divide(timestamps, DAY).astype(numpy.int64)
+        # Only the days of the covered range need a time zone lookup, not every check
+        first_day = int(days.min())
+        offsets = numpy.array(
+            [local_offset(day) for day in range(first_day, int(days.max()) + 1)],
+            dtype=numpy.float64,
+        )
+        hours = numpy.floor_divide(timestamps + offsets[days - first_day], 3600)
+        bins = (hours.astype(numpy.int64) + EPOCH_WEEK_HOUR) % HOURS_PER_WEEK
+        checks = numpy.bincount(bins, minlength=HOURS_PER_WEEK)
+        busy = numpy.bincount(
+            bins,
+            weights=numpy.asarray(active, dtype=numpy.float64),
+            minlength=HOURS_PER_WEEK,
+        )
+        return checks.tolist(), busy.astype(numpy.int64).tolist()
+    checks = [0] * HOURS_PER_WEEK
+    busy = [0] * HOURS_PER_WEEK
+    for timestamp, is_active in zip(timestamps, active):
+        hour = week_hour(timestamp)
+        checks[hour] += 1
+        busy[hour] += bool(is_active)
+    return checks, busy
+
+
+def read_activity(trace_path, backups=TRACE_BACKUPS):
+    """Returns the timestamps of the traced checks that measured the activity and whether they
+    saw any session or transcode. A check that skipped the sessions probe only counts when its
+    transcoder probe saw a transcode, an unknown count is not a quiet check"""
+    if numpy is not None:
+        dtype = numpy.dtype(
+            [
+                ("timestamp", "<f8"),
+                ("idle_seconds", "<f4"),
+                ("sessions", "<i4"),
+                ("outcome", "i1"),
+                ("transcoder", "i1"),
+                ("flags", "u1"),
+                ("padding", "V1"),
+                ("latencies", "<f4", (3,)),
+            ]
+        )
+        parts = []
+        for path in trace_files(trace_path, backups):
+            count = (os.path.getsize(path) - HEADER.size) // RECORD.size
+            if count > 0:
+                parts.append(
+                    numpy.fromfile(path, dtype=dtype, count=count, offset=HEADER.size)
+                )
+        if not parts:
+            return [], []
+        records = numpy.concatenate(parts)
+        # Columns are masked one by one, masking whole records copies them slowly
+        sessions = records["sessions"]
+        transcoding = records["transcoder"] == 1
+        known = (sessions >= 0) | transcoding
+        active = (sessions > 0) | transcoding
+        return records["timestamp"][known], active[known]
+    timestamps = []
+    active = []
+    for record in read_trace(trace_path, backups):
+        transcoding = record.transcoder == 1
+        if record.sessions >= 0 or transcoding:
+            timestamps.append(record.timestamp)
+            active.append(record.sessions > 0 or transcoding)
+    return timestamps, active
+
+
+class UsageModel:
+    """Chance of Plex activity for every hour of the week. The shutdown delay is made longer
+    when activity is likely soon and shorter in hours that are always quiet"""
+
+    def __init__(self, checks=None, busy=None, clock=time):
+        self.checks = list(checks or [0] * HOURS_PER_WEEK)
+        self.busy = list(busy or [0] * HOURS_PER_WEEK)
+        self.clock = clock
+
+    @classmethod
+    def fit(cls, timestamps, active, clock=time):
+        """Returns the model of the given checks, active tells if each saw any activity"""
+        checks, busy = week_hour_histograms(timestamps, active)
+        return cls(checks, busy, clock)
+
+    def probability(self, hour):
+        """Returns the chance of activity in an hour of the week, None without enough checks"""
+        if self.checks[hour] < MIN_HOUR_SAMPLES:
+            return None
+        return self.busy[hour] / self.checks[hour]
+
+    def activity_chance(self, start, end):
+        """Returns the highest chance of activity of the hours between the timestamps, None
+        when none of them has enough checks"""
+        chances = []
+        hour_start = start - start % 3600
+        while hour_start < end:
+            chance = self.probability(week_hour(max(start, hour_start)))
+            if chance is not None:
+                chances.append(chance)
+            hour_start += 3600
+        return max(chances) if chances else None
+
+    def delay_factor(self, delay_seconds, now=None):
+        """Returns the factor of a shutdown delay armed now, from the chance of activity until
+        a while after the shutdown"""
+        now = self.clock() if now is None else now
+        chance = self.activity_chance(now, now + delay_seconds + WAKE_HORIZON)
+        if chance is None:
+            return 1.0
+        return MIN_DELAY_FACTOR + (MAX_DELAY_FACTOR - MIN_DELAY_FACTOR) * chance
+
+    def shutdown_delay(self, delay_minutes, now=None):
+        """Returns the shutdown delay in minutes to use instead of the configured one"""
+        return delay_minutes * self.delay_factor(delay_minutes * 60, now)
+
+
+class TraceUsageModel(UsageModel):
+    """Usage model fitted from the trace log, fitted again when it is older than the refit
+    interval"""
+
+    def __init__(self, trace_path, backups=TRACE_BACKUPS, clock=time):
+        super().__init__(clock=clock)
+        self.trace_path = trace_path
+        self.backups = backups
+        self.fitted_at = None
+
+    def refit(self):
+        """Fits the model again from the trace log"""
+        timestamps, active = read_activity(self.trace_path, self.backups)
+        self.checks, self.busy = week_hour_histograms(timestamps, active)
+        self.fitted_at = self.clock()
+
+    def delay_factor(self, delay_seconds, now=None):
+        """Returns the factor of a shutdown delay armed now, see UsageModel.delay_factor"""
+        if self.fitted_at is None or self.clock() - self.fitted_at >= REFIT_INTERVAL:
+            try:
+                self.refit()
+            except (OSError, ValueError) as e:
+                log.warning("Cannot fit the usage model from the trace log: %s", e)
+        return super().delay_factor(delay_seconds, now)
@@ -0,0 +1,103 @@
+""" Test file for usage_model.py """
+import os
+import random
+import tempfile
+import unittest
+from time import mktime
+from unittest.mock import patch
+
+import usage_model
+from trace_log import TraceLog
+from usage_model import (
+    HOURS_PER_WEEK,
+    MIN_HOUR_SAMPLES,
+    TraceUsageModel,
+    UsageModel,
+    read_activity,
+    week_hour,
+    week_hour_histograms,
+)
+
+# Monday 2024-01-01 00:00 local time
+MONDAY = mktime((2024, 1, 1, 0, 0, 0, 0, 0, -1))
+
+
+def evening_activity(weeks):
+    """Returns checks every minute where Monday 20:00 to 22:00 is always busy"""
+    timestamps = [MONDAY + minute * 60 for minute in range(weeks * 7 * 24 * 60)]
+    active = [week_hour(timestamp) in (20, 21) for timestamp in timestamps]
+    return timestamps, active
+
+
+class UsageModelTest(unittest.TestCase):
+    """Test class for usage_model.py"""
+
+    def test_01_week_hour(self):
+        """Test hours of the week are counted in local time from Monday"""
+        self.assertEqual(week_hour(MONDAY + 30 * 60), 0)
+        self.assertEqual(week_hour(MONDAY + 20.5 * 3600), 20)
+        self.assertEqual(week_hour(MONDAY + 6 * 24 * 3600 + 23 * 3600), HOURS_PER_WEEK - 1)
+
+    def test_02_histograms_match_without_numpy(self):
+        """Test the pure Python fit gives the same histograms as the vectorized one"""
+        rng = random.Random(4)
+        timestamps = [MONDAY + rng.uniform(0, 90 * 24 * 3600) for _ in range(5000)]
+        active = [rng.random() < 0.2 for _ in timestamps]
+        expected = week_hour_histograms(timestamps, active)
+        with patch.object(usage_model, "numpy", None):
+            self.assertEqual(week_hour_histograms(timestamps, active), expected)
+        self.assertEqual(sum(expected[0]), 5000)
+
+    def test_03_delay_factor(self):
+        """Test the delay is longer before a busy hour, shorter in dead hours and unchanged
+        without enough checks"""
+        model = UsageModel.fit(*evening_activity(2))
+        self.assertEqual(model.probability(20), 1.0)
+        self.assertEqual(model.probability(3), 0.0)
+        self.assertGreater(model.shutdown_delay(30, MONDAY + 19.5 * 3600), 30)
+        self.assertLess(model.shutdown_delay(30, MONDAY + 3 * 3600), 30)
+        self.assertEqual(UsageModel().shutdown_delay(30, MONDAY), 30)
+        sparse = UsageModel.fit([MONDAY] * (MIN_HOUR_SAMPLES - 1), [True] * 29)
+        self.assertIsNone(sparse.probability(0))
+
+    def test_04_fit_from_trace_log(self):
+        """Test the model is fitted from the trace log with and without numpy"""
+        with tempfile.TemporaryDirectory() as directory:
+            trace_path = os.path.join(directory, "trace.bin")
+            timestamps, active = evening_activity(1)
+            clock = iter(timestamps)
+            trace_log = TraceLog(trace_path, clock=lambda: next(clock))
+            for is_active in active:
+                trace_log.record(0, False, int(is_active), 0, False, [None] * 3)
+            trace_log.close()
+            model = TraceUsageModel(trace_path, clock=lambda: MONDAY)
+            model.refit()
+            with patch.object(usage_model, "numpy", None):
+                pure = TraceUsageModel(trace_path, clock=lambda: MONDAY)
+                pure.refit()
+        self.assertEqual(model.busy, pure.busy)
+        self.assertEqual(model.checks, pure.checks)
+        self.assertEqual(model.probability(21), 1.0)
+
+    def test_05_skipped_probes_not_counted(self):
+        """Test checks that skipped the sessions probe only count for what they measured"""
+        with tempfile.TemporaryDirectory() as directory:
+            trace_path = os.path.join(directory, "trace.bin")
+            clock = iter([MONDAY + index for index in range(4)])
+            trace_log = TraceLog(trace_path, clock=lambda: next(clock))
+            # Quiet check, then checks stopped by the idle probe with only the transcoder
+            # known, unknown and a transcode
+            trace_log.record(1800, False, 0, 0, False, [None] * 3)
+            trace_log.record(10, False, None, 0, False, [None] * 3)
+            trace_log.record(10, None, None, 0, False, [None] * 3)
+            trace_log.record(10, True, None, 0, False, [None] * 3)
+            trace_log.close()
+            expected = ([MONDAY, MONDAY + 3], [False, True])
+            timestamps, active = read_activity(trace_path)
+            self.assertEqual((list(timestamps), list(active)), expected)
+            with patch.object(usage_model, "numpy", None):
+                self.assertEqual(read_activity(trace_path), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
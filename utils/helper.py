@@ -3,7 +3,12 @@
 
 import ctypes
 import platform
-import winreg
+
+try:
+    import winreg
+except ImportError:
+    # winreg only exists on Windows, check_aumid always reports the AUMID as missing elsewhere
+    winreg = None
 
 ES_CONTINUOUS = 0x80000000
 ES_SYSTEM_REQUIRED = 0x00000001
@@ -38,6 +43,9 @@ def long_running(func):
 
 
 def check_aumid(aumid):
+    if winreg is None:
+        print("AUMID not found")
+        return False
     try:
         with winreg.OpenKey(
             winreg.HKEY_CURRENT_USER,